@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+import os
+import re
+import time
+import sqlite3
+import threading
+import http.client
+import urllib.request
+from urllib.error import HTTPError, URLError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .dx import URL_HOURS, RETRY_CODES, retry, logger
+
+'''
+Local block cache for remote file reads (e.g. BGZF compressed VCFs and tabix indexes)
+Byte ranges of DNAnexus files are cached on disk in fixed size blocks keyed by file id
+and block number (SQLite, least recently used blocks are evicted above a size limit).
+Readers such as htslib access files through a local HTTP proxy which serves ranges from
+the cache and fetches missing blocks with range requests over presigned URLs, so that
+URL expiry does not invalidate cached content. The proxy must be read from a different
+process (htslib holds the GIL while reading).
+'''
+
+# cached block size (bytes) and blocks fetched ahead on a miss
+BLOCK_SIZE = 64 * 1024
+READAHEAD = 8
+# default cache size limit (bytes)
+CACHE_SIZE = 10 * 1024 ** 3
+
+
+class BlockCache(object):
+    def __init__(self, path, max_bytes=CACHE_SIZE, block_size=BLOCK_SIZE):
+        '''
+        Opens (or creates) the block cache
+
+        Args:
+            path (str): path of the SQLite database file
+            max_bytes (int): size limit of cached blocks
+            block_size (int): block size (fixed per cache file)
+
+        Returns:
+            None
+        '''
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(f'''
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY, size INTEGER);
+            CREATE TABLE IF NOT EXISTS blocks (
+                file TEXT, block INTEGER, data BLOB, used REAL, PRIMARY KEY (file, block));
+            CREATE INDEX IF NOT EXISTS blocks_used ON blocks (used);
+            CREATE TABLE IF NOT EXISTS settings (
+                name TEXT PRIMARY KEY, value INTEGER);
+            INSERT OR IGNORE INTO settings VALUES ('block_size', {block_size});
+        ''')
+        self.block_size = self.db.execute("SELECT value FROM settings WHERE name = 'block_size'").fetchone()[0]
+        self.max_bytes = max_bytes
+        self.cached_bytes = self.db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blocks').fetchone()[0]
+        self.lock = threading.Lock()
+
+    def size(self, file_id):
+        with self.lock:
+            row = self.db.execute('SELECT size FROM files WHERE id = ?', (file_id,)).fetchone()
+        return row[0] if row else None
+
+    def blocks(self, file_id, first, last):
+        '''
+        Cached blocks of a file
+
+        Args:
+            file_id (str): DNAnexus file id
+            first (int): first block
+            last (int): last block (inclusive)
+
+        Returns:
+            dict: block data by block number
+        '''
+        with self.lock:
+            blocks = dict(self.db.execute('SELECT block, data FROM blocks WHERE file = ? AND block BETWEEN ? AND ?',
+                (file_id, first, last)))
+            if blocks:
+                self.db.executemany('UPDATE blocks SET used = ? WHERE file = ? AND block = ?',
+                    [ (time.time(), file_id, block) for block in blocks ])
+                self.db.commit()
+        return blocks
+
+    def store(self, file_id, size, first, data):
+        '''
+        Stores consecutive blocks of a file (evicts least recently used blocks above the size limit)
+
+        Args:
+            file_id (str): DNAnexus file id
+            size (int): file size
+            first (int): block number of the start of data
+            data (bytes): data (block aligned)
+
+        Returns:
+            None
+        '''
+        blocks = [ (file_id, first + i, data[offset:offset + self.block_size], time.time())
+            for i, offset in enumerate(range(0, len(data), self.block_size)) ]
+        with self.lock:
+            # replaced blocks (e.g. fetched concurrently) are only counted once
+            replaced = self.db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blocks WHERE file = ? AND block BETWEEN ? AND ?',
+                (file_id, first, first + len(blocks) - 1)).fetchone()[0]
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (file_id, size))
+            self.db.executemany('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)', blocks)
+            self.cached_bytes += len(data) - replaced
+            if self.cached_bytes > self.max_bytes:
+                # evict down to 90% of the limit
+                evicted = 0
+                for file, block, length in self.db.execute('SELECT file, block, LENGTH(data) FROM blocks ORDER BY used').fetchall():
+                    if self.cached_bytes - evicted <= self.max_bytes * 0.9:
+                        break
+                    self.db.execute('DELETE FROM blocks WHERE file = ? AND block = ?', (file, block))
+                    evicted += length
+                self.cached_bytes -= evicted
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class BlockProxy(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, cache, sign, valid_hours=URL_HOURS):
+        '''
+        Local HTTP proxy serving DNAnexus files through a block cache
+
+        Args:
+            cache (BlockCache): block cache
+            sign (function): presigned URL of a file (project_id, file_id)
+            valid_hours (int): validity of presigned URLs
+
+        Returns:
+            None
+        '''
+        super().__init__(('127.0.0.1', 0), BlockHandler)
+        self.cache = cache
+        self.sign = sign
+        self.valid = valid_hours * 3600
+        self.urls = {}
+        # files served (readers probe for other index files)
+        self.files = set()
+        self.lock = threading.Lock()
+        # bytes served from the cache and fetched remotely (updated by handler threads)
+        self.served = self.fetched = 0
+        self.counter_lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, project_id, file_id):
+        '''
+        Proxy URL of a file
+
+        Args:
+            project_id (str): project id
+            file_id (str): file id
+
+        Returns:
+            str: URL
+        '''
+        self.files.add((project_id, file_id))
+        return f'http://127.0.0.1:{self.server_address[1]}/{project_id}/{file_id}'
+
+    def count(self, name, value):
+        with self.counter_lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def presigned(self, project_id, file_id, renew=False):
+        # presigned URLs are renewed before expiry (or when rejected)
+        with self.lock:
+            url, expires = self.urls.get(file_id, (None, 0))
+            if renew or time.time() > expires - 600:
+                url, expires = self.sign(project_id, file_id), time.time() + self.valid
+                if not url:
+                    # e.g. archived
+                    raise FileNotFoundError(f'No download URL for {project_id}:{file_id}')
+                self.urls[file_id] = (url, expires)
+        return url
+
+    def fetch(self, project_id, file_id, start, end):
+        '''
+        Fetches a byte range of a file over its presigned URL
+
+        Args:
+            project_id (str): project id
+            file_id (str): file id
+            start (int): first byte
+            end (int): last byte (inclusive)
+
+        Returns:
+            (bytes, int): data and file size
+        '''
+        def get(renew):
+            request = urllib.request.Request(self.presigned(project_id, file_id, renew),
+                headers={ 'Range': f'bytes={start}-{end}' })
+            try:
+                with urllib.request.urlopen(request) as response:
+                    data = response.read()
+                    m = re.search(r'/(\d+)$', response.headers.get('Content-Range', ''))
+                    if response.status == 200:
+                        # range not supported (whole file)
+                        return data[start:end + 1], len(data)
+                    return data, int(m.group(1)) if m else start + len(data)
+            except HTTPError as error:
+                if error.code not in RETRY_CODES:
+                    raise
+                # throttled or server error (retried with backoff)
+                raise ConnectionError(f'HTTP {error.code} reading {file_id}') from error
+            except (URLError, http.client.HTTPException) as error:
+                # connection failures and incomplete responses (retried with backoff)
+                raise ConnectionError(f'Failed to read {file_id} ({getattr(error, "reason", error)})') from error
+        try:
+            data, size = retry(get, False)
+        except HTTPError as error:
+            if error.code == 416:
+                return b'', self.cache.size(file_id) or start
+            if error.code not in (401, 403):
+                raise
+            data, size = retry(get, True)
+        self.count('fetched', len(data))
+        return data, size
+
+    def read(self, project_id, file_id, start, end=None):
+        '''
+        Reads a byte range of a file (cached blocks, missing blocks are fetched with readahead)
+
+        Args:
+            project_id (str): project id
+            file_id (str): file id
+            start (int): first byte
+            end (int): last byte (inclusive, defaults to end of file)
+
+        Returns:
+            generator: data chunks
+        '''
+        block_size = self.cache.block_size
+        size = self.file_size(project_id, file_id)
+        end = size - 1 if end is None else min(end, size - 1)
+        block, last = start // block_size, end // block_size
+        while block <= last:
+            cached = self.cache.blocks(file_id, block, min(last, block + READAHEAD - 1))
+            if block in cached:
+                while block in cached:
+                    chunk = self.slice(cached[block], block, start, end)
+                    self.count('served', len(chunk))
+                    yield chunk
+                    block += 1
+                continue
+            # fetch missing blocks (with readahead, up to the end of the file)
+            fetch_last = min(block + READAHEAD - 1, (size - 1) // block_size)
+            data, size = self.fetch(project_id, file_id, block * block_size, (fetch_last + 1) * block_size - 1)
+            if not data:
+                break
+            self.cache.store(file_id, size, block, data)
+            for i in range(block, min(last, fetch_last) + 1):
+                offset = (i - block) * block_size
+                yield self.slice(data[offset:offset + block_size], i, start, end)
+            block = fetch_last + 1
+
+    def slice(self, data, block, start, end):
+        offset = block * self.cache.block_size
+        return data[max(0, start - offset):end - offset + 1]
+
+    def file_size(self, project_id, file_id):
+        size = self.cache.size(file_id)
+        if size is None:
+            data, size = self.fetch(project_id, file_id, 0, self.cache.block_size - 1)
+            self.cache.store(file_id, size, 0, data)
+        return size
+
+
+class BlockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def parse(self):
+        # project and file id from the path, requested byte range
+        project_id, file_id = (self.path.strip('/').split('/') + [''])[:2]
+        if (project_id, file_id) not in self.server.files:
+            raise FileNotFoundError(self.path)
+        size = self.server.file_size(project_id, file_id)
+        m = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        start = int(m.group(1)) if m else 0
+        end = min(int(m.group(2)), size - 1) if m and m.group(2) else size - 1
+        return project_id, file_id, size, start, end, m is not None
+
+    def headers_for(self, size, start, end, partial):
+        if partial and start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return False
+        self.send_response(206 if partial else 200)
+        if partial:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(max(0, end - start + 1)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return True
+
+    def do_HEAD(self):
+        try:
+            _, _, size, start, end, partial = self.parse()
+        except Exception as error:
+            self.send_error(404, str(error))
+            return
+        self.headers_for(size, start, end, partial)
+
+    def do_GET(self):
+        try:
+            project_id, file_id, size, start, end, partial = self.parse()
+        except Exception as error:
+            self.send_error(404, str(error))
+            return
+        if self.headers_for(size, start, end, partial):
+            try:
+                for chunk in self.server.read(project_id, file_id, start, end):
+                    self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # reader seeked elsewhere
+                self.close_connection = True
+            except Exception as error:
+                # truncated response (reported as read error by the reader)
+                logger.warning(f'Failed to read {self.path}: {error}')
+                self.close_connection = True
+
+    def log_message(self, *args):
+        pass
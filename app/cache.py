@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import os
+import json
+import sqlite3
+import threading
+
+'''
+Local store of execution descriptors (analyses, jobs)
+Executions in a terminal state are immutable and only fetched once, repeated
+audits query executions created after the sync watermark of a given scope
+(e.g. project or executable) which is held back by executions still running.
+Cached executions are also held in memory once read, so that a long running process
+(e.g. the daemon) sharing one store between jobs does not re-read them.
+'''
+
+# execution states that will not change anymore
+TERMINAL_STATES = ('done', 'failed', 'terminated')
+
+
+class ExecutionCache(object):
+    def __init__(self, path):
+        '''
+        Opens (or creates) the execution store (can be shared between threads)
+
+        Args:
+            path (str): path of the SQLite database file
+
+        Returns:
+            None
+        '''
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        # executions by scope (loaded on first use)
+        self.loaded = {}
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS executions (
+                id TEXT PRIMARY KEY, scope TEXT, created INTEGER, describe TEXT);
+            CREATE INDEX IF NOT EXISTS executions_scope ON executions (scope);
+            CREATE TABLE IF NOT EXISTS watermarks (
+                scope TEXT PRIMARY KEY, created INTEGER);
+        ''')
+
+    def watermark(self, scope):
+        '''
+        Creation time after which executions of a scope must be fetched
+
+        Args:
+            scope (str): project or executable id
+
+        Returns:
+            int: epoch (ms) or None if the scope was never synced
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT created FROM watermarks WHERE scope = ?', (scope,)).fetchone()
+        return row[0] if row else None
+
+    def executions(self, scope):
+        '''
+        Cached (terminal) executions of a scope
+
+        Args:
+            scope (str): project or executable id
+
+        Returns:
+            list: execution search results (id and describe)
+        '''
+        with self.lock:
+            return list(self._load(scope).values())
+
+    def _load(self, scope):
+        # executions of a scope by id (read from the store once)
+        if scope not in self.loaded:
+            rows = self.db.execute('SELECT id, describe FROM executions WHERE scope = ?', (scope,))
+            self.loaded[scope] = { execution_id: { 'id': execution_id, 'describe': json.loads(describe) }
+                for execution_id, describe in rows }
+        return self.loaded[scope]
+
+    def update(self, scope, executions, synced):
+        '''
+        Stores terminal executions and advances the scope watermark
+
+        Args:
+            scope (str): project or executable id
+            executions (list): execution search results fetched since the last watermark
+            synced (int): epoch (ms) at which the search was started
+
+        Returns:
+            list: cached and fetched executions (fetched take precedence)
+        '''
+        watermark = synced
+        with self.lock:
+            cached = self._load(scope)
+            for execution in executions:
+                describe = execution['describe']
+                if describe['state'] in TERMINAL_STATES:
+                    self.db.execute('INSERT OR REPLACE INTO executions VALUES (?, ?, ?, ?)',
+                        (execution['id'], scope, describe['created'], json.dumps(describe)))
+                    cached[execution['id']] = execution
+                else:
+                    watermark = min(watermark, describe['created'])
+            # query window overlaps by a minute to allow for clock skew
+            self.db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?)', (scope, watermark - 60000))
+            self.db.commit()
+            fetched = set(execution['id'] for execution in executions)
+            return [ e for e in cached.values() if e['id'] not in fetched ] + executions
+
+    def close(self):
+        self.db.close()
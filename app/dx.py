@@ -4,8 +4,15 @@ import os
 import re
 import sys
 import json
+import time
+import logging
+import random
+import threading
 import dxpy
 import datetime
+from dxpy.utils import normalize_time_input
+from .idset import IdSet
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 '''
 Class to search for project
@@ -27,8 +34,24 @@ DATA_FOLDERS = {
     '/analysis_folder/Logs_Intermediates/StitchedRealigned': tso_sample_regex_bam,
     '/bigwig_output': tso_sample_regex_bw,
 }
+logger = logging.getLogger(__name__)
+
 # Validity of generated URLs
 URL_HOURS = 12
+# Bulk operations (concurrent API calls, requests per second, retries with exponential backoff)
+WORKERS = 8
+RATE_LIMIT = 20
+MIN_RATE_LIMIT = 0.5
+MAX_RATE_LIMIT = 100
+RETRIES = 5
+BACKOFF = 1.0
+# HTTP status codes of transient API errors and throttled requests
+RETRY_CODES = (429, 500, 502, 503, 504)
+THROTTLE_CODES = (429, 503)
+# Bulk archival (files per API call) and archival state polling (seconds, doubles while no file changes state)
+ARCHIVE_BATCH = 1000
+POLL_INTERVAL = 60
+MAX_POLL_INTERVAL = 1800
 
 
 def get_sample_name(filename):
@@ -46,6 +69,201 @@ def get_sample_name(filename):
         if m:
             return m.group(1)
 
+def epoch(timestamp):
+    '''
+    Converts absolute or relative time (e.g. -12w) to epoch
+
+    Args:
+        timestamp (str|int): time as accepted by the search functions
+
+    Returns:
+        int: epoch in ms (None if no time given)
+    '''
+    if timestamp is None:
+        return None
+    value = normalize_time_input(timestamp)
+    return int(time.time() * 1000) + value if value < 0 else value
+
+
+def is_retryable(error):
+    '''
+    Checks if an API error is transient (throttling, server or connection errors)
+
+    Args:
+        error (Exception): exception raised by an API call
+
+    Returns:
+        bool: True if the call should be retried
+    '''
+    if isinstance(error, dxpy.exceptions.DXAPIError):
+        return error.code in RETRY_CODES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def retry(fun, *args, retries=RETRIES, backoff=BACKOFF, **kwargs):
+    '''
+    Calls an API function, retrying transient errors with exponential backoff
+
+    Args:
+        fun (callable): API function (e.g. dxpy.api.file_add_tags)
+        *args: arguments to pass to the API function
+        retries (int): maximum number of retries
+        backoff (float): initial backoff in seconds (doubles with every retry)
+        **kwargs: keyword arguments to pass to the API function
+
+    Returns:
+        object: return value of the API function
+    '''
+    for attempt in range(retries + 1):
+        try:
+            return fun(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            logger.info(f'Retrying {getattr(fun, "__name__", "API call")} after error ({e}), retry {attempt + 1} of {retries}')
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def stream_map(fun, items, workers=WORKERS, backlog=None):
+    '''
+    Applies a function to the items of a (lazy) iterable concurrently
+    Items are only drawn from the iterable while fewer than backlog calls are pending,
+    so that upstream generators are consumed at the pace of the workers. Pending calls
+    are cancelled if a call fails or the consumer stops early.
+
+    Args:
+        fun (function): function to apply to each item
+        items (iterable): items (e.g. search results)
+        workers (int): number of concurrent calls
+        backlog (int): maximum number of pending calls (defaults to 4 per worker)
+
+    Returns:
+        generator: (item, result) as calls complete
+    '''
+    backlog = backlog or workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        try:
+            for item in items:
+                pending[executor.submit(fun, item)] = item
+                if len(pending) >= backlog:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            for future in as_completed(list(pending)):
+                yield pending.pop(future), future.result()
+        except BaseException:
+            # calls that have not started are not run (running calls complete)
+            for future in pending:
+                future.cancel()
+            raise
+
+
+class RateLimiter(object):
+    def __init__(self, rate=RATE_LIMIT, min_rate=MIN_RATE_LIMIT, max_rate=MAX_RATE_LIMIT):
+        '''
+        Adaptive limit of the API request rate shared between concurrent workers
+        The rate is halved on throttled responses (429/503, all requests pause for Retry-After)
+        and recovers additively with successful responses.
+
+        Args:
+            rate (float): initial number of requests per second
+            min_rate (float): minimum number of requests per second
+            max_rate (float): maximum number of requests per second
+
+        Returns:
+            None
+        '''
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._next_call = time.monotonic()
+
+    def wait(self):
+        '''
+        Blocks until the next request slot is available
+
+        Returns:
+            None
+        '''
+        with self._lock:
+            now = time.monotonic()
+            call_time = max(now, self._next_call)
+            self._next_call = call_time + 1.0 / self.rate
+        if call_time > now:
+            time.sleep(call_time - now)
+
+    def feedback(self, status, retry_after=None):
+        '''
+        Adapts the request rate to a response
+
+        Args:
+            status (int): HTTP status code
+            retry_after (str): Retry-After header (seconds)
+
+        Returns:
+            None
+        '''
+        with self._lock:
+            if status in THROTTLE_CODES:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                try:
+                    pause = float(retry_after)
+                except (TypeError, ValueError):
+                    pause = 1.0 / self.rate
+                self._next_call = max(self._next_call, time.monotonic() + pause)
+                logger.info(f'API throttled ({status}), reducing request rate to {self.rate:.1f}/s')
+            elif status < 400:
+                self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+
+
+class LimitedPoolManager(object):
+    def __init__(self, pool, limiter):
+        '''
+        HTTP connection pool of dxpy paced by a rate limiter (sees every request including dxpy retries)
+
+        Args:
+            pool (urllib3.PoolManager): dxpy connection pool
+            limiter (RateLimiter): shared rate limiter
+
+        Returns:
+            None
+        '''
+        self.pool = pool
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs):
+        self.limiter.wait()
+        response = self.pool.request(*args, **kwargs)
+        self.limiter.feedback(response.status, response.headers.get('retry-after'))
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+
+def limit_requests(limiter):
+    '''
+    Routes all dxpy API requests through the rate limiter (shared connection pool)
+
+    Args:
+        limiter (RateLimiter): shared rate limiter
+
+    Returns:
+        None
+    '''
+    pool = dxpy._get_pool_manager(None, None, None)
+    if not isinstance(pool, LimitedPoolManager):
+        dxpy._pool_manager = LimitedPoolManager(pool, limiter)
+
+
+# rate limiter shared by all sessions
+LIMITER = RateLimiter()
+
+
 class Dx(object):
     def __init__(self,token):
         '''
@@ -60,6 +278,8 @@ class Dx(object):
         sec_context = '{"auth_token":"' + token + '","auth_token_type":"Bearer"}'
         os.environ['DX_SECURITY_CONTEXT'] = sec_context
         dxpy.set_security_context(json.loads(sec_context))
+        self.limiter = LIMITER
+        limit_requests(self.limiter)
         self.whoami = dxpy.api.system_whoami()
 
     def find_objects(self, name, mode='glob', *args, **kwargs):
@@ -76,27 +296,41 @@ class Dx(object):
             list: list of objects matching the given name
 
         '''
+        return list(self.iter_objects(name, mode, *args, **kwargs))
+
+    def iter_objects(self, name, mode='glob', *args, **kwargs):
+        '''
+        Finds objects matching the given name lazily (result pages are fetched as objects are consumed)
+
+        Args:
+            name (str): name of the object to find
+            mode (str): mode of the search, can be 'glob', 'regex', 'exact'
+            *args: additional arguments to pass to the search function
+            **kwargs: additional keyword arguments to pass to the search function
+
+        Returns:
+            generator: objects matching the given name
+        '''
         m = re.match(r'(record|file|applet|workflow|database)-\w{24}$', name)
         if m:
-            objects = []
             classname = m.group(1)
             for project in self.get_file_projects(name):
                 if classname == 'file':
                     obj = self.get_file(project, name)
-                    objects.append({
+                    yield {
                         'id': obj['id'],
                         'project': project,
                         'describe': obj
-                    })
+                    }
                 if classname == 'applet':
                     obj = self.get_applet(project, name)
-                    objects.append({
+                    yield {
                         'id': obj['id'],
                         'project': project,
                         'describe': obj
-                    })
-            return objects
-        return list(dxpy.bindings.search.find_data_objects(name=name, name_mode=mode, *args, **kwargs))
+                    }
+            return
+        yield from dxpy.bindings.search.find_data_objects(name=name, name_mode=mode, *args, **kwargs)
 
     def find_projects(self, name, mode='glob', *args, **kwargs):
         '''
@@ -211,7 +445,7 @@ class Dx(object):
         remote_handler = dxpy.bindings.dxfile.DXFile(file_id, project_id)
         if remote_handler.describe()['archivalState'] != 'live':
             try:
-                remote_handler.unarchive()
+                retry(remote_handler.unarchive)
                 return True
             except dxpy.exceptions.PermissionDenied:
                 return False
@@ -230,11 +464,147 @@ class Dx(object):
         remote_handler = dxpy.bindings.dxfile.DXFile(file_id, project_id)
         if remote_handler.describe()['archivalState'] == 'live':
             try:
-                remote_handler.archive(all_copies=all_copies)
+                retry(remote_handler.archive, all_copies=all_copies)
                 return True
             except dxpy.exceptions.PermissionDenied:
                 return False
 
+    def archive_files(self, project_id, file_ids, all_copies=False):
+        '''
+        Archives files of a project in batches (max ARCHIVE_BATCH per API call)
+
+        Args:
+            project_id (str): id of the project
+            file_ids (list): ids of the files to archive (live)
+            all_copies (bool): archive all copies of the files
+
+        Returns:
+            list: ids of files that could not be archived
+        '''
+        return self.batch_files(dxpy.api.project_archive, project_id, file_ids, allCopies=all_copies)
+
+    def unarchive_files(self, project_id, file_ids):
+        '''
+        Unarchives files of a project in batches (max ARCHIVE_BATCH per API call)
+
+        Args:
+            project_id (str): id of the project
+            file_ids (list): ids of the files to unarchive (archived)
+
+        Returns:
+            list: ids of files that could not be unarchived
+        '''
+        return self.batch_files(dxpy.api.project_unarchive, project_id, file_ids)
+
+    def batch_files(self, fun, project_id, file_ids, **kwargs):
+        '''
+        Applies a project file operation in batches, a failed batch is run file by file (e.g. archive as much as you can)
+
+        Args:
+            fun (function): API function (e.g. dxpy.api.project_archive)
+            project_id (str): id of the project
+            file_ids (list): ids of the files
+            **kwargs: additional input parameters of the API function
+
+        Returns:
+            list: ids of files that failed
+        '''
+        failed = []
+        for i in range(0, len(file_ids), ARCHIVE_BATCH):
+            chunk = list(file_ids[i:i + ARCHIVE_BATCH])
+            try:
+                retry(fun, project_id, { 'files': chunk, **kwargs })
+            except Exception as e:
+                logger.warning(f'Error in batch operation ({project_id} {len(chunk)} files: {e}), running as separate tasks...')
+                for file_id in chunk:
+                    try:
+                        retry(fun, project_id, { 'files': [ file_id ], **kwargs })
+                    except (dxpy.exceptions.PermissionDenied, dxpy.exceptions.InvalidState) as ee:
+                        logger.warning(f'Cannot process {file_id} ({ee})')
+                        failed.append(file_id)
+                    except Exception:
+                        logger.critical(f'Something prevented the following data object to be processed: {file_id}')
+                        raise
+        return failed
+
+    def archival_states(self, files):
+        '''
+        Archival states of many files (bulk describe, max ARCHIVE_BATCH per API call)
+
+        Args:
+            files (list): (project_id, file_id) tuples
+
+        Returns:
+            dict: archival state by file id (None if the file could not be described)
+        '''
+        files = list(files)
+        states = {}
+        for i in range(0, len(files), ARCHIVE_BATCH):
+            chunk = files[i:i + ARCHIVE_BATCH]
+            result = retry(dxpy.api.system_describe_data_objects, {
+                'objects': [ { 'id': file_id, 'project': project_id } for project_id, file_id in chunk ],
+                'classDescribeOptions': { 'file': { 'fields': { 'archivalState': True } } }
+            })
+            for (_, file_id), described in zip(chunk, result['results']):
+                states[file_id] = (described.get('describe') or {}).get('archivalState')
+        return states
+
+    def wait_live(self, files, timeout=None, interval=POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL):
+        '''
+        Polls the archival states of files in bulk until they are live
+        The polling interval doubles (up to max_interval) while no file becomes live. Files that
+        cannot become live (archived without unarchival request, being archived, or not found) are dropped.
+
+        Args:
+            files (list): (project_id, file_id) tuples
+            timeout (float): maximum time to wait in seconds (defaults to no limit)
+            interval (float): initial polling interval in seconds
+            max_interval (float): maximum polling interval in seconds
+
+        Returns:
+            generator: (project_id, file_id) as files become live
+        '''
+        pending = { file_id: project_id for project_id, file_id in files }
+        deadline = time.time() + timeout if timeout is not None else None
+        delay = interval
+        while pending:
+            states = self.archival_states((project_id, file_id) for file_id, project_id in pending.items())
+            live = [ file_id for file_id in pending if states.get(file_id) == 'live' ]
+            for file_id in live:
+                yield pending.pop(file_id), file_id
+            for file_id in [ file_id for file_id in pending if states.get(file_id) in (None, 'archival', 'archived') ]:
+                logger.warning(f'{file_id} is {states.get(file_id) or "not found"}, not waiting for it')
+                del pending[file_id]
+            if not pending or (deadline and time.time() >= deadline):
+                break
+            delay = interval if live else min(delay * 2, max_interval)
+            time.sleep(max(0, min(delay, deadline - time.time())) if deadline else delay)
+
+    def change_object_tags(self, classname, project_id, object_id, tags=None, untags=None):
+        '''
+        Adds and/or removes tags of a data object (<class>_add_tags, <class>_remove_tags)
+        Transient errors are retried with backoff.
+
+        Args:
+            classname (str): object class (e.g. file, record)
+            project_id (str): id of the project of the object
+            object_id (str): id of the object
+            tags (list): tags to add
+            untags (list): tags to remove
+
+        Returns:
+            str: error message or None on success
+        '''
+        try:
+            if tags:
+                retry(getattr(dxpy.api, f'{classname}_add_tags'), object_id,
+                    { 'tags': tags, 'project': project_id })
+            if untags:
+                retry(getattr(dxpy.api, f'{classname}_remove_tags'), object_id,
+                    { 'tags': untags, 'project': project_id })
+        except Exception as e:
+            return str(e)
+
     def update_project(self, project_id, **kwargs):
         '''
         Updates a project
@@ -247,7 +617,7 @@ class Dx(object):
             None
         '''
         project = dxpy.bindings.dxproject.DXProject(dxid=project_id)
-        project.update(**kwargs)
+        retry(project.update, **kwargs)
 
     def file_url(self, project_id, file_id, valid_hours=URL_HOURS):
         '''
@@ -300,40 +670,62 @@ class Dx(object):
         Returns:
             list: list of projects that contain the given file
         '''
-        return list(dxpy.api.file_list_projects(object_id, input_params={}, always_retry=True, *args, **kwargs))
+        return list(retry(dxpy.api.file_list_projects, object_id, {}, *args, **kwargs))
 
-    def workstations(self, *args, **kwargs):
+    def workstations(self, fields=None, cache=None, workers=WORKERS, created_after=None, created_before=None, **kwargs):
         '''
-        Returns a list of all workstations on the platform
+        Returns a list of all workstations on the platform (executions of cloud_workstation apps, queried concurrently)
 
         Args:
-            *args: additional arguments to pass to the search function
+            fields (list): describe fields to return (defaults to full describe)
+            cache (ExecutionCache): store of terminated workstations (only new or running workstations are fetched)
+            workers (int): number of concurrent queries
+            created_after (str|int): created after (absolute or relative time)
+            created_before (str|int): created before (absolute or relative time)
             **kwargs: additional keyword arguments to pass to the search function
 
         Returns:
             list: list of workstations
         '''
+        describe = { 'fields': { field: True for field in set(fields) | {'id', 'state', 'created'} } } if fields else True
+        after, before = epoch(created_after), epoch(created_before)
+
+        def find(app_id, watermark):
+            synced = int(time.time() * 1000)
+            # cached scopes are synced completely (filtered by creation time below)
+            start, end = (watermark, None) if cache else (after, before)
+            executions = retry(lambda: list(dxpy.bindings.search.find_executions(executable=app_id, describe=describe,
+                created_after=start, created_before=end, **kwargs)))
+            return app_id, synced, executions
+
         workstations = []
-        for app in dxpy.bindings.search.find_apps('cloud_workstation'):
-            workstations += list(dxpy.bindings.search.find_executions(executable=app['id'], describe=True, *args, **kwargs))
+        apps = list(dxpy.bindings.search.find_apps('cloud_workstation'))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [ executor.submit(find, app['id'], cache.watermark(app['id']) if cache else None) for app in apps ]
+            for future in as_completed(futures):
+                app_id, synced, executions = future.result()
+                if cache:
+                    executions = cache.update(app_id, executions, synced)
+                workstations += [ w for w in executions
+                    if (not after or w['describe']['created'] >= after) and (not before or w['describe']['created'] <= before) ]
         return workstations
 
     def project_file_ids(self, project_regex, *args, **kwargs):
         '''
-        Returns a deduplicated list of file ids for all files in one or multiple projects (matched by regex name)
+        Returns a deduplicated set of file ids for all files in one or multiple projects (matched by regex name)
 
         Args:
             project_regex (str): regex to match project name
 
         Returns:
-            list of file ids
+            IdSet: file ids
         '''
         # find project-ids whose membership is reason for exclusion from archival
         exclude_in_project = list(map(lambda x:  x['id'], self.find_projects(project_regex, 'regexp'))) \
             if project_regex else []
         # find all file ids in those projects (faster than querying the projects for each archival candidate)
-        return list(set([ file_obj['id'] for p in exclude_in_project for file_obj in \
-            self.find_files('.*', 'regexp', project=p, *args, **kwargs)]))
+        return IdSet(file_obj['id'] for p in exclude_in_project for file_obj in \
+            dxpy.bindings.search.find_data_objects(classname='file', name='.*', name_mode='regexp', project=p, *args, **kwargs))
 
 
 if __name__=="__main__":
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import re
+from collections import OrderedDict
+from functools import lru_cache
+import pyhgvs as hgvs
+
+'''
+HGVS name to genomic coordinate resolution
+Resolved names are memoized (bounded) by their normalized form and batches resolve each
+unique name once, in genomic order. Reference sequence is read in blocks that are kept
+for the current chromosome, so that variants on the same chromosome share reads.
+'''
+
+# memoized HGVS names
+HGVS_CACHE_SIZE = 65536
+# reference read block size (bases) and blocks kept of the current chromosome
+BLOCK_SIZE = 16384
+MAX_BLOCKS = 1024
+
+
+def normalize_hgvs(name):
+    '''
+    Normalized HGVS name (without whitespace)
+
+    Args:
+        name (str): HGVS name (e.g. NM_000059.3:c.68-7T>A)
+
+    Returns:
+        str: normalized name
+    '''
+    return re.sub(r'\s+', '', str(name))
+
+
+class SharedReference(object):
+    def __init__(self, genome, block_size=BLOCK_SIZE, max_blocks=MAX_BLOCKS):
+        '''
+        Reference genome with block reads shared per chromosome
+
+        Args:
+            genome (pyfaidx.Fasta): reference genome
+            block_size (int): bases per read
+            max_blocks (int): blocks kept of the current chromosome
+
+        Returns:
+            None
+        '''
+        self.genome = genome
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.chrom = None
+        self.blocks = OrderedDict()
+
+    def __getitem__(self, chrom):
+        return ChromosomeSequence(self, chrom)
+
+    def __contains__(self, chrom):
+        return chrom in self.genome
+
+    def block(self, chrom, i):
+        '''
+        Reads a block of a chromosome (blocks of the previous chromosome are dropped)
+
+        Args:
+            chrom (str): chromosome
+            i (int): block number
+
+        Returns:
+            str: sequence
+        '''
+        if chrom != self.chrom:
+            self.chrom, self.blocks = chrom, OrderedDict()
+        if i in self.blocks:
+            self.blocks.move_to_end(i)
+        else:
+            self.blocks[i] = str(self.genome[chrom][i * self.block_size:(i + 1) * self.block_size])
+            if len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        return self.blocks[i]
+
+
+class ChromosomeSequence(object):
+    def __init__(self, reference, chrom):
+        self.reference = reference
+        self.chrom = chrom
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None or key.start is None or key.stop is None \
+            or key.start < 0 or key.stop < 0:
+            return str(self.reference.genome[self.chrom][key])
+        if key.stop <= key.start:
+            return ''
+        size = self.reference.block_size
+        first, last = key.start // size, (key.stop - 1) // size
+        sequence = ''.join(self.reference.block(self.chrom, i) for i in range(first, last + 1))
+        return sequence[key.start - first * size:key.stop - first * size]
+
+    def __len__(self):
+        return len(self.reference.genome[self.chrom])
+
+
+class GenomicResolver(object):
+    def __init__(self, genome, get_transcript, cache_size=HGVS_CACHE_SIZE):
+        '''
+        Resolves HGVS names to genomic coordinates
+
+        Args:
+            genome (pyfaidx.Fasta): reference genome
+            get_transcript (function): transcript by name
+            cache_size (int): memoized names
+
+        Returns:
+            None
+        '''
+        self.genome = SharedReference(genome)
+        self.get_transcript = get_transcript
+        self._parse = lru_cache(maxsize=cache_size)(self._parse_hgvs)
+
+    def _parse_hgvs(self, name):
+        return hgvs.parse_hgvs_name(name, self.genome, get_transcript=self.get_transcript)
+
+    def _position(self, name):
+        # genomic position of the transcript (unknown transcripts first)
+        transcript = self.get_transcript(name.split(':')[0])
+        return (str(transcript.tx_position.chrom), transcript.tx_position.chrom_start) if transcript else ('', 0)
+
+    def resolve(self, name):
+        '''
+        Genomic coordinates of a HGVS name (memoized)
+
+        Args:
+            name (str): HGVS name
+
+        Returns:
+            (str, int, str, str): chromosome, position, reference and alternate allele
+        '''
+        return self._parse(normalize_hgvs(name))
+
+    def resolve_batch(self, names):
+        '''
+        Genomic coordinates of many HGVS names (each unique name is resolved once, in genomic order)
+
+        Args:
+            names (iterable): HGVS names
+
+        Returns:
+            list: chromosome, position, reference and alternate allele (in order of names)
+        '''
+        names = [ normalize_hgvs(name) for name in names ]
+        resolved = { name: self._parse(name) for name in sorted(set(names), key=self._position) }
+        return [ resolved[name] for name in names ]
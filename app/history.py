@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import os
+import time
+import sqlite3
+import pandas as pd
+
+'''
+Local time series of project costs (SQLite)
+Each audit appends a snapshot of the cost figures per project (numbers only) and stores
+the rollups per billTo at the same time, so that trends are computed from the stored
+aggregates of two snapshots without revisiting project rows or the API. Snapshots are
+kept per audit scope (e.g. project pattern) as different scopes are not comparable.
+'''
+
+# cost figures per project
+COST_FIGURES = ['dataUsage', 'archivedDataUsage', 'storageCost', 'computeCost']
+# comparison interval (ms) and tolerance for irregular audit times
+WEEK = 7 * 24 * 3600 * 1000
+TOLERANCE = 12 * 3600 * 1000
+
+
+def records(frame):
+    '''
+    Rows of a data frame with missing values as NULL
+
+    Args:
+        frame (pd.DataFrame): data frame
+
+    Returns:
+        iterator: row tuples
+    '''
+    return frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+
+
+class CostHistory(object):
+    def __init__(self, path):
+        '''
+        Opens (or creates) the cost history
+
+        Args:
+            path (str): path of the SQLite database file
+
+        Returns:
+            None
+        '''
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY, scope TEXT, taken INTEGER);
+            CREATE INDEX IF NOT EXISTS snapshots_scope ON snapshots (scope, taken);
+            CREATE TABLE IF NOT EXISTS project_costs (
+                snapshot INTEGER, project TEXT, name TEXT, billTo TEXT, dataUsage REAL,
+                archivedDataUsage REAL, storageCost REAL, computeCost REAL,
+                PRIMARY KEY (snapshot, project));
+            CREATE TABLE IF NOT EXISTS billto_costs (
+                snapshot INTEGER, billTo TEXT, projects INTEGER, dataUsage REAL,
+                archivedDataUsage REAL, storageCost REAL, computeCost REAL,
+                PRIMARY KEY (snapshot, billTo));
+        ''')
+
+    def record(self, scope, costs, taken=None):
+        '''
+        Appends a snapshot of project costs and its billTo rollups
+
+        Args:
+            scope (str): audit scope (e.g. project pattern)
+            costs (pd.DataFrame): project costs (project-id, project-name, billedTo and COST_FIGURES)
+            taken (int): epoch (ms) of the snapshot (defaults to now)
+
+        Returns:
+            int: snapshot id
+        '''
+        taken = taken if taken is not None else int(time.time() * 1000)
+        costs = costs.reindex(columns=['project-id', 'project-name', 'billedTo'] + COST_FIGURES)
+        snapshot = self.db.execute('INSERT INTO snapshots (scope, taken) VALUES (?, ?)', (scope, taken)).lastrowid
+        self.db.executemany('INSERT OR REPLACE INTO project_costs VALUES (?,?,?,?,?,?,?,?)',
+            [ (snapshot, *row) for row in records(costs) ])
+        # rollups (compute cost stays NULL if not audited)
+        rollups = costs.groupby('billedTo', dropna=False).agg(projects=('project-id', 'size'),
+            **{ figure: (figure, lambda x: x.sum(min_count=1)) for figure in COST_FIGURES }).reset_index()
+        self.db.executemany('INSERT OR REPLACE INTO billto_costs VALUES (?,?,?,?,?,?,?)',
+            [ (snapshot, *row) for row in records(rollups) ])
+        self.db.commit()
+        return snapshot
+
+    def previous(self, scope, snapshot, interval=WEEK):
+        '''
+        Latest snapshot of a scope taken at least an interval before a given snapshot
+
+        Args:
+            scope (str): audit scope
+            snapshot (int): snapshot id
+            interval (int): minimum age difference (ms), audits up to TOLERANCE early are accepted
+
+        Returns:
+            int: snapshot id (None if there is no such snapshot)
+        '''
+        row = self.db.execute('''SELECT id FROM snapshots WHERE scope = ?
+            AND taken <= (SELECT taken FROM snapshots WHERE id = ?) - ? ORDER BY taken DESC LIMIT 1''',
+            (scope, snapshot, interval - TOLERANCE)).fetchone()
+        return row[0] if row else None
+
+    def rollups(self, snapshot):
+        '''
+        Stored billTo rollups of a snapshot
+
+        Args:
+            snapshot (int): snapshot id
+
+        Returns:
+            pd.DataFrame: projects and cost figures indexed by billTo
+        '''
+        rollups = pd.read_sql_query('SELECT * FROM billto_costs WHERE snapshot = ?', self.db,
+            params=(snapshot,)).drop(columns='snapshot').set_index('billTo')
+        rollups[COST_FIGURES] = rollups[COST_FIGURES].astype(float)
+        return rollups
+
+    def trends(self, scope, snapshot, interval=WEEK):
+        '''
+        Costs per billTo with changes since the snapshot an interval earlier (from stored rollups)
+
+        Args:
+            scope (str): audit scope
+            snapshot (int): snapshot id
+            interval (int): comparison interval (ms)
+
+        Returns:
+            pd.DataFrame: billTo, projects, cost figures and their deltas (incl. Total row)
+        '''
+        previous = self.previous(scope, snapshot, interval)
+        current, before = self.rollups(snapshot), self.rollups(previous)
+        current.loc['Total'] = current.sum(min_count=1)
+        if previous is not None:
+            before.loc['Total'] = before.sum(min_count=1)
+        trends = current[['projects']].copy()
+        for figure in COST_FIGURES:
+            trends[figure] = current[figure]
+            trends[f'{figure}Delta'] = current[figure].sub(before[figure].reindex(current.index)) \
+                if previous is not None else float('nan')
+        trends['projects'] = trends['projects'].astype('Int64')
+        return trends.reset_index()
+
+    def series(self, scope, billto=None):
+        '''
+        Time series of billTo rollups
+
+        Args:
+            scope (str): audit scope
+            billto (str): limit to billTo (defaults to all)
+
+        Returns:
+            pd.DataFrame: taken, billTo and cost figures per snapshot
+        '''
+        query = '''SELECT s.taken, b.* FROM snapshots s JOIN billto_costs b ON b.snapshot = s.id
+            WHERE s.scope = ?'''
+        params = [scope]
+        if billto:
+            query += ' AND b.billTo = ?'
+            params.append(billto)
+        return pd.read_sql_query(query + ' ORDER BY s.taken', self.db, params=params)
+
+    def close(self):
+        self.db.close()
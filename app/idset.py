@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+
+import numpy as np
+from itertools import islice
+
+'''
+Compact sets of DNAnexus ids (e.g. file-GK2b4Qj0x8Vz5b1F9bKq0p3X)
+Ids are packed into two unsigned 64 bit integers (class and 12 base-32 digits each)
+and held as sorted NumPy arrays (24 bytes per id instead of ~130 bytes for a Python
+string in a set). Arrays are ordered by a 64 bit mixing key so that sorting and
+searching run on a single integer column, colliding keys are resolved by the full id.
+Membership, intersection and difference of many ids are vectorized.
+'''
+
+# id alphabet (5 bits per character)
+ALPHABET = '0123456789BFGJKPQVXYZbfgjkpqvxyz'
+# id classes (4 bits)
+CLASSES = ['file', 'project', 'container', 'record', 'applet', 'workflow', 'database', 'job',
+    'analysis', 'app', 'globalworkflow', 'user', 'org', 'team', 'dbcluster']
+# ids encoded per vectorized step
+CHUNK = 1000000
+# buffered ids before merging into the arrays
+PENDING = 100000
+
+_DIGITS = np.full(256, 255, dtype=np.uint8)
+_DIGITS[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(32, dtype=np.uint8)
+_CHARS = np.frombuffer(ALPHABET.encode(), dtype=np.uint8)
+_SHIFTS = np.arange(55, -1, -5, dtype=np.uint64)
+_BASE32 = str.maketrans(ALPHABET, '0123456789abcdefghijklmnopqrstuv')
+_CODES = { classname: code for code, classname in enumerate(CLASSES) }
+_ALPHABET = frozenset(ALPHABET)
+
+
+def mix(hi, lo):
+    '''
+    64 bit sort key of encoded ids (multiplicative hashing, wraps around)
+
+    Args:
+        hi (np.ndarray): class and first 12 digits
+        lo (np.ndarray): last 12 digits
+
+    Returns:
+        np.ndarray: keys (uint64)
+    '''
+    with np.errstate(over='ignore'):
+        return (hi * np.uint64(0x9E3779B97F4A7C15)) ^ ((lo ^ (lo >> np.uint64(29))) * np.uint64(0xC2B2AE3D27D4EB4F))
+
+
+def encode(ids):
+    '''
+    Packs DNAnexus ids into integer pairs
+
+    Args:
+        ids (iterable): ids (str)
+
+    Returns:
+        (np.ndarray, np.ndarray): class and first 12 digits (hi), last 12 digits (lo)
+    '''
+    his, los = [], []
+    ids = iter(ids)
+    while True:
+        chunk = list(islice(ids, CHUNK))
+        if not chunk:
+            break
+        his_chunk, los_chunk = _encode_chunk(chunk)
+        his.append(his_chunk)
+        los.append(los_chunk)
+    if not his:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64)
+    return np.concatenate(his), np.concatenate(los)
+
+
+def _encode_chunk(ids):
+    '''
+    Packs a list of ids (vectorized over fixed width byte strings)
+
+    Args:
+        ids (list): ids (str)
+
+    Returns:
+        (np.ndarray, np.ndarray): hi and lo
+    '''
+    strings = np.array(ids, dtype='S')
+    width = strings.dtype.itemsize
+    lengths = np.char.str_len(strings)
+    chars = strings.view(np.uint8).reshape(len(strings), width)
+    classes = np.full(len(strings), 255, dtype=np.uint64)
+    # digits by position (24 x ids)
+    digits = np.full((24, len(strings)), 255, dtype=np.uint8)
+    # rows of equal length share the class prefix length (usually a single group)
+    for length in np.unique(lengths):
+        rows = lengths == length
+        prefixed = [ (code, f'{classname}-'.encode()) for code, classname in enumerate(CLASSES)
+            if len(classname) + 25 == length ]
+        if not prefixed:
+            continue
+        rows = slice(None) if rows.all() else rows
+        group = chars[rows]
+        group_classes = np.full(len(group), 255, dtype=np.uint64)
+        for code, prefix in prefixed:
+            group_classes[(group[:, :len(prefix)] == np.frombuffer(prefix, dtype=np.uint8)).all(axis=1)] = code
+        classes[rows] = group_classes
+        digits[:, rows] = _DIGITS[group[:, length - 24:length].T]
+    invalid = (classes == 255) | (digits == 255).any(axis=0)
+    if invalid.any():
+        raise ValueError(f'Invalid DNAnexus id: {ids[int(np.argmax(invalid))]}')
+    # base-32 digits to integers (Horner scheme over columns)
+    hi, lo = classes, np.zeros(len(strings), dtype=np.uint64)
+    for i in range(12):
+        hi = (hi << np.uint64(5)) | digits[i]
+        lo = (lo << np.uint64(5)) | digits[12 + i]
+    return hi, lo
+
+
+def encode_one(object_id):
+    '''
+    Packs a single id (without NumPy overhead, e.g. for membership tests in loops)
+
+    Args:
+        object_id (str): id
+
+    Returns:
+        (int, int, int): mixing key, hi and lo
+    '''
+    classname, _, digits = object_id.partition('-')
+    if classname not in _CODES or len(digits) != 24 or not _ALPHABET.issuperset(digits):
+        raise ValueError(f'Invalid DNAnexus id: {object_id}')
+    value = int(digits.translate(_BASE32), 32)
+    hi, lo = (_CODES[classname] << 60) | (value >> 60), value & 0xFFFFFFFFFFFFFFF
+    key = ((hi * 0x9E3779B97F4A7C15) ^ ((lo ^ (lo >> 29)) * 0xC2B2AE3D27D4EB4F)) & 0xFFFFFFFFFFFFFFFF
+    return key, hi, lo
+
+
+def decode(hi, lo):
+    '''
+    Unpacks integer pairs into DNAnexus ids
+
+    Args:
+        hi (np.ndarray): class and first 12 digits
+        lo (np.ndarray): last 12 digits
+
+    Returns:
+        np.ndarray: ids (str)
+    '''
+    digits = np.concatenate([(hi[:, None] >> _SHIFTS) & np.uint64(31), (lo[:, None] >> _SHIFTS) & np.uint64(31)], axis=1)
+    suffixes = np.ascontiguousarray(_CHARS[digits.astype(np.intp)]).view('S24').ravel()
+    ids = np.empty(len(hi), dtype=object)
+    classes = hi >> np.uint64(60)
+    for code in np.unique(classes):
+        rows = classes == code
+        ids[rows] = np.char.add(f'{CLASSES[int(code)]}-'.encode(), suffixes[rows]).astype(str)
+    return ids
+
+
+class IdSet(object):
+    def __init__(self, ids=()):
+        '''
+        Creates a compact set of DNAnexus ids
+
+        Args:
+            ids (iterable): ids (str) or IdSet
+
+        Returns:
+            None
+        '''
+        if isinstance(ids, IdSet):
+            ids._merge()
+            self.key, self.hi, self.lo = ids.key, ids.hi, ids.lo
+        else:
+            self.key, self.hi, self.lo = self._unique(*encode(ids))
+        self._pending = set()
+
+    @classmethod
+    def _from_arrays(cls, key, hi, lo):
+        idset = cls()
+        idset.key, idset.hi, idset.lo = key, hi, lo
+        return idset
+
+    @staticmethod
+    def _unique(hi, lo):
+        '''
+        Sorts and deduplicates encoded ids
+
+        Args:
+            hi (np.ndarray): class and first 12 digits
+            lo (np.ndarray): last 12 digits
+
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray): sorted unique key, hi, lo
+        '''
+        key = mix(hi, lo)
+        order = np.argsort(key)
+        key, hi, lo = key[order], hi[order], lo[order]
+        # order ids with equal keys (duplicates, rare collisions) by the full id
+        tied = np.zeros(len(key), dtype=bool)
+        tied[1:] = key[1:] == key[:-1]
+        tied[:-1] |= tied[1:]
+        if tied.any():
+            positions = np.flatnonzero(tied)
+            order = positions[np.lexsort((lo[positions], hi[positions], key[positions]))]
+            hi[positions], lo[positions] = hi[order], lo[order]
+        keep = np.ones(len(key), dtype=bool)
+        keep[1:] = (key[1:] != key[:-1]) | (hi[1:] != hi[:-1]) | (lo[1:] != lo[:-1])
+        return key[keep], hi[keep], lo[keep]
+
+    def _merge(self):
+        # merge buffered ids into the arrays (inserted at their sorted positions, linear in the set size)
+        if self._pending:
+            key, hi, lo = self._unique(*encode(self._pending))
+            self._pending = set()
+            new = ~self._search(key, hi, lo)[0]
+            key, hi, lo = key[new], hi[new], lo[new]
+            positions = np.searchsorted(self.key, key)
+            self.key, self.hi, self.lo = (np.insert(array, positions, values)
+                for array, values in ((self.key, key), (self.hi, hi), (self.lo, lo)))
+
+    def _locate(self, key, hi, lo):
+        '''
+        Vectorized lookup of encoded ids
+
+        Args:
+            key (np.ndarray): keys
+            hi (np.ndarray): class and first 12 digits
+            lo (np.ndarray): last 12 digits
+
+        Returns:
+            (np.ndarray, np.ndarray): bool mask of found ids and their positions in the arrays
+        '''
+        self._merge()
+        return self._search(key, hi, lo)
+
+    def _search(self, key, hi, lo):
+        # lookup in the arrays (buffered ids are not merged)
+        found = np.zeros(len(key), dtype=bool)
+        # search in key order (sequential access of the sorted arrays)
+        order = np.argsort(key)
+        positions = np.empty(len(key), dtype=np.intp)
+        positions[order] = np.searchsorted(self.key, key[order])
+        active = np.arange(len(key))
+        # walk runs of equal keys (only longer than one on collisions)
+        while len(active):
+            p = positions[active]
+            valid = p < len(self.key)
+            active, p = active[valid], p[valid]
+            same = self.key[p] == key[active]
+            active, p = active[same], p[same]
+            hit = (self.hi[p] == hi[active]) & (self.lo[p] == lo[active])
+            found[active[hit]] = True
+            active = active[~hit]
+            positions[active] += 1
+        return found, positions
+
+    def _contains(self, key, hi, lo):
+        return self._locate(key, hi, lo)[0]
+
+    def contains(self, ids):
+        '''
+        Vectorized membership test
+
+        Args:
+            ids (iterable): ids (str) or IdSet
+
+        Returns:
+            np.ndarray: bool mask (in order of the given ids)
+        '''
+        if isinstance(ids, IdSet):
+            ids._merge()
+            return self._contains(ids.key, ids.hi, ids.lo)
+        hi, lo = encode(ids)
+        return self._contains(mix(hi, lo), hi, lo)
+
+    def add(self, object_id):
+        '''
+        Adds an id (buffered and merged in bulk)
+
+        Args:
+            object_id (str): id
+
+        Returns:
+            None
+        '''
+        self._pending.add(object_id)
+        if len(self._pending) >= PENDING:
+            self._merge()
+
+    def intersection(self, other):
+        '''
+        Ids contained in both sets
+
+        Args:
+            other (IdSet|iterable): ids
+
+        Returns:
+            IdSet: intersection
+        '''
+        other = other if isinstance(other, IdSet) else IdSet(other)
+        self._merge()
+        other._merge()
+        # look up the smaller set in the larger one
+        small, large = (self, other) if len(self.key) <= len(other.key) else (other, self)
+        mask = large._contains(small.key, small.hi, small.lo)
+        return IdSet._from_arrays(small.key[mask], small.hi[mask], small.lo[mask])
+
+    def difference(self, other):
+        '''
+        Ids not contained in the other set
+
+        Args:
+            other (IdSet|iterable): ids
+
+        Returns:
+            IdSet: difference
+        '''
+        other = other if isinstance(other, IdSet) else IdSet(other)
+        self._merge()
+        other._merge()
+        if len(other.key) < len(self.key):
+            # remove the positions of the (smaller) other set
+            found, positions = self._locate(other.key, other.hi, other.lo)
+            mask = np.ones(len(self.key), dtype=bool)
+            mask[positions[found]] = False
+        else:
+            mask = ~other._contains(self.key, self.hi, self.lo)
+        return IdSet._from_arrays(self.key[mask], self.hi[mask], self.lo[mask])
+
+    def union(self, other):
+        '''
+        Ids contained in either set
+
+        Args:
+            other (IdSet|iterable): ids
+
+        Returns:
+            IdSet: union
+        '''
+        other = other if isinstance(other, IdSet) else IdSet(other)
+        self._merge()
+        other._merge()
+        return IdSet._from_arrays(*self._unique(np.concatenate([self.hi, other.hi]), np.concatenate([self.lo, other.lo])))
+
+    __and__ = intersection
+    __sub__ = difference
+    __or__ = union
+
+    @property
+    def nbytes(self):
+        return self.key.nbytes + self.hi.nbytes + self.lo.nbytes
+
+    def __contains__(self, object_id):
+        # single lookups check the buffer and the arrays without merging
+        if object_id in self._pending:
+            return True
+        if not len(self.key):
+            return False
+        try:
+            key, hi, lo = encode_one(object_id)
+        except (ValueError, TypeError, AttributeError):
+            return False
+        keys = self.key
+        position = int(keys.searchsorted(np.uint64(key)))
+        while position < len(keys) and int(keys[position]) == key:
+            if int(self.hi[position]) == hi and int(self.lo[position]) == lo:
+                return True
+            position += 1
+        return False
+
+    def __len__(self):
+        self._merge()
+        return len(self.key)
+
+    def __iter__(self):
+        self._merge()
+        for start in range(0, len(self.key), CHUNK):
+            yield from decode(self.hi[start:start + CHUNK], self.lo[start:start + CHUNK])
+
+    def __repr__(self):
+        return f'IdSet({len(self)} ids)'
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import os
+import json
+import threading
+from collections import defaultdict
+from .idset import IdSet
+
+'''
+Append-only run journal for resumable archival
+Records discovered projects, the exclusion list, archival candidates per project,
+archived chunks and renamed projects. Each record is flushed to disk (thread-safe)
+before the run continues, replaying the journal restores the state of the last committed record.
+Completed runs are marked as done, so that resuming them starts a new run.
+'''
+
+
+class Journal(object):
+    def __init__(self, path, resume=False):
+        '''
+        Opens a run journal
+
+        Args:
+            path (str): path of the journal file
+            resume (bool): replay an existing journal (otherwise starts a new one)
+
+        Returns:
+            None
+        '''
+        self.path = path
+        self._reset()
+        self.resumed = False
+        # an existing journal was of a completed run (not resumed)
+        self.completed = False
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        committed = 0
+        if resume and os.path.exists(path):
+            with open(path, 'rb') as infile:
+                for line in infile:
+                    try:
+                        self._replay(json.loads(line))
+                    except ValueError:
+                        # incomplete record (interrupted write)
+                        break
+                    committed += len(line)
+            if self.done:
+                self._reset()
+                self.completed, committed = True, 0
+            self.resumed = committed > 0
+        self.outfile = open(path, 'ab')
+        self.outfile.truncate(committed)
+
+    def _reset(self):
+        # run state of a new run
+        self.projects = None
+        self.exclude = None
+        self.candidates = {}
+        self.chunks = defaultdict(set)
+        self.renames = {}
+        self.done = False
+
+    def _replay(self, record):
+        '''
+        Applies a journal record to the run state
+
+        Args:
+            record (dict): journal record
+
+        Returns:
+            None
+        '''
+        if record['type'] == 'projects':
+            self.projects = record['projects']
+        elif record['type'] == 'exclude':
+            self.exclude = IdSet(record['files'])
+        elif record['type'] == 'candidates':
+            self.candidates[record['project']] = record['files']
+        elif record['type'] == 'chunk':
+            self.chunks[record['project']].add(record['chunk'])
+        elif record['type'] == 'rename':
+            self.renames[record['project']] = record['name']
+        elif record['type'] == 'done':
+            self.done = True
+
+    def _commit(self, record):
+        '''
+        Writes a record and syncs it to disk
+
+        Args:
+            record (dict): journal record
+
+        Returns:
+            None
+        '''
+        line = (json.dumps(record) + '\n').encode()
+        with self._lock:
+            self.outfile.write(line)
+            self.outfile.flush()
+            os.fsync(self.outfile.fileno())
+            self._replay(record)
+
+    def record_projects(self, projects):
+        self._commit({ 'type': 'projects', 'projects': projects })
+
+    def record_exclude(self, file_ids):
+        self._commit({ 'type': 'exclude', 'files': list(file_ids) })
+
+    def record_candidates(self, project_id, file_ids):
+        self._commit({ 'type': 'candidates', 'project': project_id, 'files': list(file_ids) })
+
+    def record_chunk(self, project_id, chunk):
+        self._commit({ 'type': 'chunk', 'project': project_id, 'chunk': chunk })
+
+    def record_rename(self, project_id, name):
+        self._commit({ 'type': 'rename', 'project': project_id, 'name': name })
+
+    def record_done(self):
+        self._commit({ 'type': 'done' })
+
+    def close(self):
+        self.outfile.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import os
+import json
+import sqlite3
+
+'''
+Local cache of values extracted from files (SQLite)
+Values (JSON) are keyed by file path and are valid as long as the modification time and
+size of the file are unchanged, so that re-runs over a growing collection of files only
+parse new or changed files.
+'''
+
+
+def file_stamp(path):
+    '''
+    Modification time and size of a file
+
+    Args:
+        path (str): path of the file
+
+    Returns:
+        (int, int): modification time (ns) and size
+    '''
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ParseCache(object):
+    def __init__(self, path, kind):
+        '''
+        Opens (or creates) the parse cache
+
+        Args:
+            path (str): path of the SQLite database file
+            kind (str): kind of extracted values (cached separately, e.g. parser name and version)
+
+        Returns:
+            None
+        '''
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS parsed (
+                kind TEXT, path TEXT, mtime INTEGER, size INTEGER, value TEXT,
+                PRIMARY KEY (kind, path));
+        ''')
+        self.kind = kind
+
+    def get(self, path):
+        '''
+        Cached value of a file
+
+        Args:
+            path (str): path of the file
+
+        Returns:
+            object: value (None if not cached or the file changed)
+        '''
+        row = self.db.execute('SELECT mtime, size, value FROM parsed WHERE kind = ? AND path = ?',
+            (self.kind, os.path.abspath(path))).fetchone()
+        if row and tuple(row[:2]) == file_stamp(path):
+            return json.loads(row[2])
+
+    def put(self, path, value, stamp=None):
+        '''
+        Caches the value of a file
+
+        Args:
+            path (str): path of the file
+            value (object): value (JSON serializable)
+            stamp (tuple): modification time and size of the parsed file (defaults to current)
+
+        Returns:
+            None
+        '''
+        self.db.execute('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?)',
+            (self.kind, os.path.abspath(path), *(stamp or file_stamp(path)), json.dumps(value)))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import types
+import logging
+import threading
+import functools
+import urllib3
+import dxpy
+from collections import Counter, defaultdict
+
+'''
+Profiling of dxarc runs
+Records wall time per phase, call counts and time per instrumented method (Dx methods
+and all dxpy.api routes), HTTP requests, bytes received, throttled responses (429/503)
+and retries. Optionally samples Python stacks of all threads (folded stack format).
+'''
+
+# stack sampling interval (seconds)
+SAMPLE_INTERVAL = 0.01
+# HTTP status codes of throttled requests
+THROTTLE_CODES = (429, 503)
+
+
+class RetryCounter(logging.Handler):
+    def __init__(self, profiler):
+        '''
+        Counts retry messages of the dxpy and Dx loggers
+
+        Args:
+            profiler (Profiler): profiler to update
+
+        Returns:
+            None
+        '''
+        super().__init__(logging.DEBUG)
+        self.profiler = profiler
+
+    def emit(self, record):
+        if 'retry' in record.getMessage().lower():
+            self.profiler.count('http', 'retries')
+
+
+class Profiler(object):
+    def __init__(self, enabled=True, sample=False, sample_interval=SAMPLE_INTERVAL):
+        '''
+        Initialize profiler (disabled profilers ignore all calls)
+
+        Args:
+            enabled (bool): record profile
+            sample (bool): sample Python stacks
+            sample_interval (float): stack sampling interval in seconds
+
+        Returns:
+            None
+        '''
+        self.enabled = enabled
+        self.sample = sample
+        self.sample_interval = sample_interval
+        self.phases = defaultdict(float)
+        self.calls = defaultdict(lambda: { 'calls': 0, 'errors': 0, 'seconds': 0.0 })
+        self.counters = defaultdict(Counter)
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+        self._phase = None
+        self._patched = []
+        self._handler = RetryCounter(self)
+        self._sampler = None
+
+    def start(self):
+        '''
+        Starts profiling (instruments dxpy.api, HTTP pool and retry logs)
+
+        Returns:
+            None
+        '''
+        if not self.enabled:
+            return
+        self.started = time.perf_counter()
+        self.phase('setup')
+        # all API routes (also used by dxpy search and bindings)
+        for name, fun in list(vars(dxpy.api).items()):
+            if isinstance(fun, types.FunctionType) and fun.__module__ == dxpy.api.__name__:
+                self._patch(dxpy.api, name, f'dxpy.api.{name}')
+        # HTTP responses (bytes received, throttling)
+        urlopen = urllib3.PoolManager.urlopen
+        @functools.wraps(urlopen)
+        def profiled_urlopen(pool, *args, **kwargs):
+            response = urlopen(pool, *args, **kwargs)
+            self.count('http', 'requests')
+            self.count('http', 'bytesReceived', int(response.headers.get('content-length') or len(response.data or b'')))
+            if response.status in THROTTLE_CODES:
+                self.count('http', 'throttled')
+            return response
+        self._patched.append((urllib3.PoolManager, 'urlopen', urlopen))
+        urllib3.PoolManager.urlopen = profiled_urlopen
+        # retries (logged by dxpy and Dx)
+        for logger_name in ('dxpy', 'app.dx'):
+            logging.getLogger(logger_name).addHandler(self._handler)
+        # stack sampler
+        if self.sample:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        '''
+        Stops profiling and restores instrumented functions
+
+        Returns:
+            None
+        '''
+        if not self.enabled:
+            return
+        self.phase(None)
+        self.wall = time.perf_counter() - self.started
+        for owner, name, original in reversed(self._patched):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patched = []
+        for logger_name in ('dxpy', 'app.dx'):
+            logging.getLogger(logger_name).removeHandler(self._handler)
+        if self._sampler:
+            self.sample = False
+            self._sampler.join()
+
+    def phase(self, name):
+        '''
+        Marks the start of a phase (ends the current phase)
+
+        Args:
+            name (str): phase name (None to end the current phase)
+
+        Returns:
+            None
+        '''
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if self._phase:
+                self.phases[self._phase[0]] += now - self._phase[1]
+            self._phase = (name, now) if name else None
+
+    def count(self, group, name, value=1):
+        with self._lock:
+            self.counters[group][name] += value
+
+    def instrument(self, obj, prefix):
+        '''
+        Instruments all public methods of an object (e.g. Dx instance)
+
+        Args:
+            obj (object): object to instrument
+            prefix (str): name prefix of recorded calls
+
+        Returns:
+            None
+        '''
+        if not self.enabled:
+            return
+        for name in dir(obj):
+            if not name.startswith('_') and callable(getattr(obj, name)):
+                self._patch(obj, name, f'{prefix}.{name}', instance=True)
+
+    def _patch(self, owner, name, label, instance=False):
+        original = getattr(owner, name)
+        @functools.wraps(original)
+        def profiled(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = original(*args, **kwargs)
+            except Exception:
+                self._record(label, start, error=True)
+                raise
+            if isinstance(result, types.GeneratorType):
+                return self._generator(label, start, result)
+            self._record(label, start)
+            return result
+        # instance attributes are removed on restore (class method is visible again)
+        self._patched.append((owner, name, None if instance else original))
+        setattr(owner, name, profiled)
+
+    def _generator(self, label, start, generator):
+        # time spent in generators is recorded when exhausted
+        elapsed = time.perf_counter() - start
+        try:
+            while True:
+                resumed = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - resumed
+                yield item
+        finally:
+            self._record(label, time.perf_counter() - elapsed)
+
+    def _record(self, label, start, error=False):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.calls[label]['calls'] += 1
+            self.calls[label]['errors'] += int(error)
+            self.calls[label]['seconds'] += elapsed
+
+    def _sample(self):
+        # folded stacks of all other threads
+        own = threading.get_ident()
+        while self.sample:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame:
+                    stack.append(f'{frame.f_code.co_filename}:{frame.f_code.co_name}')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.sample_interval)
+
+    def summary(self):
+        '''
+        Profile summary
+
+        Returns:
+            dict: wall time, phases, calls and HTTP counters
+        '''
+        return {
+            'wallSeconds': round(self.wall, 3),
+            'phases': { name: round(seconds, 3) for name, seconds in self.phases.items() },
+            'calls': { label: dict(stats, seconds=round(stats['seconds'], 3))
+                for label, stats in sorted(self.calls.items(), key=lambda x: -x[1]['seconds']) },
+            'http': dict(self.counters['http']),
+        }
+
+    def dump(self, file):
+        '''
+        Writes JSON summary
+
+        Args:
+            file (str): output file
+
+        Returns:
+            None
+        '''
+        with open(file, 'w') as outfile:
+            json.dump(self.summary(), outfile, indent=2)
+
+    def dump_samples(self, file):
+        '''
+        Writes sampled stacks in folded format (e.g. for flamegraph.pl or speedscope)
+
+        Args:
+            file (str): output file
+
+        Returns:
+            None
+        '''
+        with open(file, 'w') as outfile:
+            for stack, count in self.stacks.most_common():
+                outfile.write(f'{stack} {count}\n')
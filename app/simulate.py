@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import re
+import json
+import numpy as np
+import pandas as pd
+from itertools import product
+from .dx import epoch
+
+'''
+Archival what-if simulation over a metadata snapshot
+The file inventory is loaded once and encoded as integer arrays (file and project codes),
+each scenario (age threshold, project pattern, exclusion pattern) is evaluated with vectorized
+masks. As in archival runs, candidates are closed, live, non-empty files modified before the
+age threshold in matching projects created before the age threshold that are not contained
+in excluded projects. Storage is
+freed once no live copy of a file remains (or any copy with all copies archived).
+'''
+
+# bytes per GB
+GB = 1024 ** 3
+# scenario results
+SIMULATION_COLUMNS = ['age', 'project', 'notin', 'projects', 'files', 'candidateGB', 'freedGB', 'storageCostSaved']
+
+
+class ArchivalSimulator(object):
+    def __init__(self, snapshot, visibility='either', prices=None):
+        '''
+        Loads the file inventory of a snapshot
+
+        Args:
+            snapshot (Snapshot): metadata snapshot
+            visibility (str): either, hidden or visible
+            prices (tuple): storage cost per GB of live and archived data (estimated from projects if None)
+
+        Returns:
+            None
+        '''
+        files = snapshot.inventory(columns=['id', 'project', 'size', 'archivalState', 'state', 'hidden', 'modified'],
+            chunksize=None, ordered=False)
+        projects = pd.read_sql_query('SELECT id, name, created, describe FROM projects', snapshot.db)
+        self.project_ids = projects['id'].to_numpy()
+        self.project_names = projects['name'].to_numpy()
+        self.project_created = projects['created'].fillna(0).to_numpy(dtype=np.int64)
+        self.file_code, file_ids = pd.factorize(files['id'])
+        self.project_code = pd.Categorical(files['project'], categories=self.project_ids).codes
+        self.size = files['size'].fillna(0).to_numpy(dtype=np.int64)
+        self.modified = files['modified'].fillna(0).to_numpy(dtype=np.int64)
+        self.live = (files['archivalState'] == 'live').to_numpy()
+        # archival candidates before scenario filters
+        self.eligible = self.live & (files['state'] == 'closed').to_numpy() & (self.size > 0) & (self.project_code >= 0)
+        if visibility in ('hidden', 'visible'):
+            self.eligible &= files['hidden'].to_numpy() == int(visibility == 'hidden')
+        self.files = len(file_ids)
+        self.live_copies = np.bincount(self.file_code, weights=self.live, minlength=self.files)
+        self.file_size = np.zeros(self.files, dtype=np.int64)
+        self.file_size[self.file_code] = self.size
+        self.prices = prices if prices else self.estimate_prices([ json.loads(d) for d in projects['describe'] ])
+        self._projects = {}
+
+    @staticmethod
+    def estimate_prices(describes):
+        '''
+        Estimates storage cost per GB of live and archived data (least squares fit of project storage costs)
+
+        Args:
+            describes (list): project descriptors (dataUsage, archivedDataUsage, storageCost in GB and cost)
+
+        Returns:
+            (float, float): cost per GB live, cost per GB archived
+        '''
+        usage = np.array([ (d.get('dataUsage', 0) - d.get('archivedDataUsage', 0), d.get('archivedDataUsage', 0),
+            d.get('storageCost', 0)) for d in describes if d.get('storageCost') is not None ], dtype=float).reshape(-1, 3)
+        if len(usage) and usage[:, 1].any():
+            (live, archived), *_ = np.linalg.lstsq(usage[:, :2], usage[:, 2], rcond=None)
+            if live > 0 and archived >= 0:
+                return live, archived
+        # all live (or inconsistent fit): cost of archived data unknown
+        total = usage[:, 0].sum() + usage[:, 1].sum() if len(usage) else 0
+        return (usage[:, 2].sum() / total if total else 0.0), 0.0
+
+    def _project_mask(self, pattern):
+        '''
+        Projects matching a name pattern (cached)
+
+        Args:
+            pattern (str): project name regex (None for no projects)
+
+        Returns:
+            np.ndarray: bool mask over projects
+        '''
+        if pattern not in self._projects:
+            self._projects[pattern] = np.array([ pattern is not None and re.search(pattern, name) is not None
+                for name in self.project_names ], dtype=bool)
+        return self._projects[pattern]
+
+    def evaluate(self, age, pattern, notin=None, all_copies=False):
+        '''
+        Evaluates an archival scenario
+
+        Args:
+            age (str): projects created and files modified before (relative time e.g. 12w)
+            pattern (str): project name regex
+            notin (str): exclude files contained in projects matching this regex
+            all_copies (bool): archive all copies of candidate files
+
+        Returns:
+            dict: scenario result (SIMULATION_COLUMNS)
+        '''
+        projects = self._project_mask(pattern)
+        if age:
+            # as --before limits both the project search and the file search
+            before = epoch(f'-{age}')
+            projects = projects & (self.project_created <= before)
+        candidates = self.eligible & projects[self.project_code]
+        if age:
+            candidates &= self.modified <= before
+        if notin:
+            in_excluded = self._project_mask(notin)[self.project_code] & (self.project_code >= 0)
+            excluded_files = np.zeros(self.files, dtype=bool)
+            excluded_files[self.file_code[in_excluded]] = True
+            candidates &= ~excluded_files[self.file_code]
+        archived_copies = np.bincount(self.file_code[candidates], minlength=self.files)
+        freed = (archived_copies > 0) & ((archived_copies == self.live_copies) | all_copies)
+        freed_gb = self.file_size[freed].sum() / GB
+        return {
+            'age': age,
+            'project': pattern,
+            'notin': notin,
+            'projects': int(projects.sum()),
+            'files': int(candidates.sum()),
+            'candidateGB': round(self.size[candidates].sum() / GB, 3),
+            'freedGB': round(freed_gb, 3),
+            'storageCostSaved': round(freed_gb * (self.prices[0] - self.prices[1]), 3),
+        }
+
+    def grid(self, ages, patterns, notins=(None,), all_copies=False):
+        '''
+        Evaluates all combinations of scenario parameters
+
+        Args:
+            ages (list): modified before thresholds (relative times)
+            patterns (list): project name regexes
+            notins (list): exclusion project regexes (None for no exclusion)
+            all_copies (bool): archive all copies of candidate files
+
+        Returns:
+            pd.DataFrame: scenario results (SIMULATION_COLUMNS)
+        '''
+        return pd.DataFrame([ self.evaluate(age, pattern, notin, all_copies)
+            for pattern, notin, age in product(patterns, notins, ages) ], columns=SIMULATION_COLUMNS)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+
+import os
+import re
+import json
+import time
+import sqlite3
+import pandas as pd
+from itertools import islice
+from .dx import epoch
+from .idset import IdSet
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+'''
+Offline metadata snapshot of projects and files (SQLite)
+Mirrors project describes and file metadata for fast repeated queries. Files are
+synced incrementally by modification time. The search methods mirror those of Dx
+so that the snapshot can be used in place of live API searches.
+'''
+
+# file describe fields mirrored in the snapshot
+FILE_FIELDS = ['id', 'project', 'name', 'folder', 'size', 'archivalState', 'tags',
+    'created', 'modified', 'hidden', 'state', 'createdBy']
+
+
+def regexp(pattern, value):
+    '''
+    SQLite REGEXP function (search semantics as the DNAnexus regexp name mode)
+
+    Args:
+        pattern (str): regular expression
+        value (str): value to match
+
+    Returns:
+        bool: True if the pattern matches
+    '''
+    return value is not None and re.search(pattern, value) is not None
+
+
+class Snapshot(object):
+    def __init__(self, path):
+        '''
+        Opens (or creates) a metadata snapshot
+
+        Args:
+            path (str): path of the SQLite database file
+
+        Returns:
+            None
+        '''
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.create_function('REGEXP', 2, regexp, deterministic=True)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS projects (
+                id TEXT PRIMARY KEY, name TEXT, created INTEGER, modified INTEGER,
+                synced INTEGER, describe TEXT);
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT, project TEXT, name TEXT, folder TEXT, size INTEGER, archivalState TEXT,
+                tags TEXT, created INTEGER, modified INTEGER, hidden INTEGER, state TEXT, createdBy TEXT,
+                PRIMARY KEY (id, project));
+            CREATE INDEX IF NOT EXISTS files_project ON files (project);
+        ''')
+
+    def sync(self, dx, project_regex, full=False, workers=8):
+        '''
+        Syncs projects and their files (only files modified since the last sync unless full)
+        Removed files are only purged with a full sync.
+
+        Args:
+            dx (Dx): DNAnexus connection
+            project_regex (str): regex to match project names
+            full (bool): resync all files
+            workers (int): number of concurrent project queries
+
+        Returns:
+            generator: (project, number of updated files) as projects complete
+        '''
+        def fetch(project, modified_after):
+            synced = int(time.time() * 1000)
+            files = dx.find_files('.*', 'regexp', project=project['id'], modified_after=modified_after,
+                describe={ 'fields': { field: True for field in FILE_FIELDS } })
+            return project, synced, files
+
+        watermarks = dict(self.db.execute('SELECT id, synced FROM projects'))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [ executor.submit(fetch, project, None if full else watermarks.get(project['id']))
+                for project in dx.find_projects(project_regex, 'regexp') ]
+            for future in as_completed(futures):
+                project, synced, files = future.result()
+                describe = project['describe']
+                if full:
+                    self.db.execute('DELETE FROM files WHERE project = ?', (project['id'],))
+                self.db.executemany('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?,?)', [ (
+                    f['id'], project['id'], f['describe']['name'], f['describe'].get('folder'),
+                    f['describe'].get('size'), f['describe'].get('archivalState'),
+                    json.dumps(f['describe'].get('tags', [])), f['describe']['created'], f['describe']['modified'],
+                    int(f['describe']['hidden']), f['describe'].get('state'), f['describe']['createdBy']['user'],
+                ) for f in files ])
+                # query window overlaps by a minute to allow for clock skew
+                self.db.execute('INSERT OR REPLACE INTO projects VALUES (?,?,?,?,?,?)', (project['id'],
+                    describe['name'], describe['created'], describe['modified'], synced - 60000, json.dumps(describe)))
+                self.db.commit()
+                yield project, len(files)
+
+    def _file(self, row):
+        '''
+        Converts a files table row to a search result
+
+        Args:
+            row (tuple): files table row
+
+        Returns:
+            dict: search result (id, project, describe)
+        '''
+        describe = dict(zip(FILE_FIELDS, row))
+        describe.update({
+            'class': 'file',
+            'tags': json.loads(describe['tags']),
+            'hidden': bool(describe['hidden']),
+            'createdBy': { 'user': describe['createdBy'] },
+        })
+        return { 'id': describe['id'], 'project': describe['project'], 'describe': describe }
+
+    def find_projects(self, name, mode='glob', created_after=None, created_before=None, **kwargs):
+        '''
+        Finds snapshot projects matching the given name (regexp or exact)
+
+        Args:
+            name (str): name of the project to find
+            mode (str): mode of the search, can be 'regexp' or 'exact'
+            created_after (str|int): created after (absolute or relative time)
+            created_before (str|int): created before (absolute or relative time)
+
+        Returns:
+            list: list of projects matching the given name
+        '''
+        query = f'SELECT id, describe FROM projects WHERE name {"REGEXP" if mode == "regexp" else "="} ?'
+        params = [name]
+        if created_after:
+            query += ' AND created >= ?'
+            params.append(epoch(created_after))
+        if created_before:
+            query += ' AND created <= ?'
+            params.append(epoch(created_before))
+        return [ { 'id': project_id, 'describe': json.loads(describe) }
+            for project_id, describe in self.db.execute(query, params) ]
+
+    def find_files(self, name, mode='glob', **kwargs):
+        '''
+        Finds snapshot files matching the given name (regexp or exact)
+
+        Args:
+            name (str): name of the file to find (or file id)
+            mode (str): mode of the search, can be 'regexp' or 'exact'
+            **kwargs: additional filters (see iter_files)
+
+        Returns:
+            list: list of files matching the given name
+        '''
+        return list(self.iter_files(name, mode, **kwargs))
+
+    def iter_files(self, name, mode='glob', project=None, visibility='either', tags=None, state=None,
+            modified_after=None, modified_before=None, limit=None, **kwargs):
+        '''
+        Finds snapshot files matching the given name lazily (rows are read as files are consumed)
+
+        Args:
+            name (str): name of the file to find (or file id)
+            mode (str): mode of the search, can be 'regexp' or 'exact'
+            project (str): project id
+            visibility (str): either, hidden or visible
+            tags (list): require all tags (as the API search)
+            state (str): file state
+            modified_after (str|int): modified after (absolute or relative time)
+            modified_before (str|int): modified before (absolute or relative time)
+            limit (int): maximum number of results
+
+        Returns:
+            generator: files matching the given name
+        '''
+        query = f'SELECT {",".join(FILE_FIELDS)} FROM files WHERE '
+        if re.match(r'file-\w{24}$', name):
+            query += 'id = ?'
+        else:
+            query += f'name {"REGEXP" if mode == "regexp" else "="} ?'
+        params = [name]
+        for column, value in (('project', project), ('state', state)):
+            if value:
+                query += f' AND {column} = ?'
+                params.append(value)
+        if visibility in ('hidden', 'visible'):
+            query += ' AND hidden = ?'
+            params.append(int(visibility == 'hidden'))
+        if modified_after:
+            query += ' AND modified >= ?'
+            params.append(epoch(modified_after))
+        if modified_before:
+            query += ' AND modified <= ?'
+            params.append(epoch(modified_before))
+        files = map(self._file, self.db.execute(query, params))
+        if tags:
+            files = filter(lambda f: set(tags) <= set(f['describe']['tags']), files)
+        return islice(files, limit)
+
+    def find_objects(self, name, mode='glob', classname='file', **kwargs):
+        '''
+        Finds snapshot objects matching the given name (only files are mirrored)
+
+        Args:
+            name (str): name of the object to find
+            mode (str): mode of the search, can be 'regexp' or 'exact'
+            classname (str): object class
+            **kwargs: additional filters (see iter_files)
+
+        Returns:
+            list: list of objects matching the given name
+        '''
+        return list(self.iter_objects(name, mode, classname, **kwargs))
+
+    def iter_objects(self, name, mode='glob', classname='file', **kwargs):
+        '''
+        Finds snapshot objects matching the given name lazily (only files are mirrored)
+
+        Args:
+            name (str): name of the object to find
+            mode (str): mode of the search, can be 'regexp' or 'exact'
+            classname (str): object class
+            **kwargs: additional filters (see iter_files)
+
+        Returns:
+            generator: objects matching the given name
+        '''
+        if classname != 'file':
+            raise ValueError(f'Snapshot only contains files (not {classname})')
+        return self.iter_files(name, mode, **kwargs)
+
+    def get_project(self, project_id):
+        '''
+        Get project
+
+        Args:
+            project_id (str): id of the project to get
+
+        Returns:
+            dict: project descriptor
+        '''
+        row = self.db.execute('SELECT describe FROM projects WHERE id = ?', (project_id,)).fetchone()
+        if not row:
+            raise KeyError(f'{project_id} not in snapshot')
+        return json.loads(row[0])
+
+    def get_file(self, project_id, file_id):
+        '''
+        Get file from project
+
+        Args:
+            project_id (str): id of the project
+            file_id (str): id of the file
+
+        Returns:
+            dict: file descriptor
+        '''
+        row = self.db.execute(f'SELECT {",".join(FILE_FIELDS)} FROM files WHERE id = ? AND project = ?',
+            (file_id, project_id)).fetchone()
+        if not row:
+            raise KeyError(f'{file_id} not in snapshot of {project_id}')
+        return self._file(row)['describe']
+
+    def get_file_projects(self, object_id):
+        '''
+        Finds all projects that contain the given file
+
+        Args:
+            object_id (str): id of the file to find
+
+        Returns:
+            list: list of projects that contain the given file
+        '''
+        return [ project_id for project_id, in self.db.execute('SELECT project FROM files WHERE id = ?', (object_id,)) ]
+
+    def project_file_ids(self, project_regex, visibility='either', **kwargs):
+        '''
+        Returns a deduplicated set of file ids for all files in one or multiple projects (matched by regex name)
+
+        Args:
+            project_regex (str): regex to match project name
+            visibility (str): either, hidden or visible
+
+        Returns:
+            IdSet: file ids
+        '''
+        if not project_regex:
+            return IdSet()
+        query = 'SELECT DISTINCT f.id FROM files f JOIN projects p ON f.project = p.id WHERE p.name REGEXP ?'
+        params = [project_regex]
+        if visibility in ('hidden', 'visible'):
+            query += ' AND f.hidden = ?'
+            params.append(int(visibility == 'hidden'))
+        return IdSet(file_id for file_id, in self.db.execute(query, params))
+
+    def inventory(self, columns=('id', 'project', 'size', 'archivalState'), chunksize=1000000, ordered=True):
+        '''
+        Streams file-project pairs ordered by file id (all copies of a file are contiguous)
+
+        Args:
+            columns (list): file columns
+            chunksize (int): number of pairs per chunk (None to load all pairs at once)
+            ordered (bool): order by file id (not required if all pairs are loaded at once)
+
+        Returns:
+            generator: pd.DataFrame chunks (or pd.DataFrame if chunksize is None)
+        '''
+        if not set(columns) <= set(FILE_FIELDS):
+            raise ValueError(f'Unknown file columns: {set(columns) - set(FILE_FIELDS)}')
+        return pd.read_sql_query(f'SELECT {",".join(columns)} FROM files{" ORDER BY id" if ordered else ""}',
+            self.db, chunksize=chunksize)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import sqlite3
+import pyhgvs.utils as hgvs_utils
+
+'''
+Compiled transcript index of a refGene file (SQLite)
+The refGene text file is parsed once into transcript records keyed by accession and
+version. Names that were resolved by probing successive versions (or without version)
+are precomputed as aliases, so that a lookup is a single indexed query. The index is
+memory-mapped and transcripts are built on first use only.
+'''
+
+# successive versions tried for a missing transcript version
+VERSION_FALLBACKS = 10
+# memory-mapped size of the index (bytes)
+MMAP_SIZE = 512 * 1024 ** 2
+
+
+def index_path(refgene):
+    '''
+    Path of the compiled index of a refGene file
+
+    Args:
+        refgene (str): path of the refGene file
+
+    Returns:
+        str: path of the index
+    '''
+    return f'{refgene}.transcripts.db'
+
+
+def compile_refgene(refgene, path=None):
+    '''
+    Compiles a refGene file into a transcript index
+
+    Args:
+        refgene (str): path of the refGene file
+        path (str): path of the index (defaults to index_path)
+
+    Returns:
+        str: path of the index
+    '''
+    path = path or index_path(refgene)
+    records, versions, latest = {}, {}, {}
+    with open(refgene) as infile:
+        for record in hgvs_utils.read_refgene(infile):
+            # later records of the same name take precedence (as in read_transcripts)
+            records[record['id']] = record
+            accession, _, version = record['id'].partition('.')
+            latest[accession] = record['id']
+            if version:
+                versions.setdefault(accession, set()).add(int(version))
+    names = { name: name for name in records }
+    names.update(latest)
+    # missing versions resolve to the next available version
+    for accession, available in versions.items():
+        for version in range(1, max(available)):
+            name = f'{accession}.{version}'
+            if name not in names:
+                fallback = next((v for v in range(version, version + VERSION_FALLBACKS) if v in available), None)
+                if fallback:
+                    names[name] = f'{accession}.{fallback}'
+    # write to a temporary file (concurrent readers keep a complete index)
+    partial = f'{path}.{os.getpid()}'
+    if os.path.exists(partial):
+        os.remove(partial)
+    db = sqlite3.connect(partial)
+    db.executescript('''
+        CREATE TABLE transcripts (name TEXT PRIMARY KEY, record TEXT);
+        CREATE TABLE names (name TEXT PRIMARY KEY, transcript TEXT);
+    ''')
+    db.executemany('INSERT INTO transcripts VALUES (?, ?)', ((name, json.dumps(record)) for name, record in records.items()))
+    db.executemany('INSERT INTO names VALUES (?, ?)', names.items())
+    db.commit()
+    db.close()
+    os.replace(partial, path)
+    return path
+
+
+def load_transcripts(refgene):
+    '''
+    Opens the transcript index of a refGene file (compiled if missing or outdated)
+
+    Args:
+        refgene (str): path of the refGene file
+
+    Returns:
+        TranscriptIndex: transcripts by name
+    '''
+    path = index_path(refgene)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(refgene):
+        compile_refgene(refgene, path)
+    return TranscriptIndex(path)
+
+
+class TranscriptIndex(object):
+    def __init__(self, path):
+        '''
+        Opens a compiled transcript index
+
+        Args:
+            path (str): path of the index
+
+        Returns:
+            None
+        '''
+        self.db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        self.db.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        self._names = {}
+        self._transcripts = {}
+
+    def get(self, name, default=None):
+        '''
+        Transcript by name (with version fallback as precomputed)
+
+        Args:
+            name (str): transcript name (e.g. NM_000059.3 or NM_000059)
+            default: returned if the transcript is unknown
+
+        Returns:
+            pyhgvs.models.Transcript: transcript
+        '''
+        if name not in self._names:
+            row = self.db.execute('''SELECT n.transcript, t.record FROM names n JOIN transcripts t
+                ON t.name = n.transcript WHERE n.name = ?''', (name,)).fetchone()
+            self._names[name] = row[0] if row else None
+            if row and row[0] not in self._transcripts:
+                self._transcripts[row[0]] = hgvs_utils.make_transcript(json.loads(row[1]))
+        transcript = self._names[name]
+        return self._transcripts[transcript] if transcript else default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def close(self):
+        self.db.close()
+
+
+if __name__=="__main__":
+    for refgene in sys.argv[1:]:
+        print(f'Compiled {compile_refgene(refgene)}')
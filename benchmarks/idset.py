@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.idset import IdSet, decode, encode, mix
+
+'''
+Memory and speed of IdSet against Python sets of id strings
+Builds a set of N random file ids (e.g. the --notin exclusion list) and a second
+set of M ids (half of them contained in the first) and times construction,
+membership of the second set, intersection and difference. The single column mixing
+key is compared with sorting on the (hi, lo) pair directly (lexsort), which it replaces
+at the cost of 8 bytes per id.
+'''
+
+
+def random_ids(n, seed):
+    '''
+    Random file ids
+
+    Args:
+        n (int): number of ids
+        seed (int): random seed
+
+    Returns:
+        np.ndarray: ids (str)
+    '''
+    rng = np.random.default_rng(seed)
+    hi = rng.integers(0, 2 ** 60, size=n, dtype=np.uint64)
+    lo = rng.integers(0, 2 ** 60, size=n, dtype=np.uint64)
+    return decode(hi, lo)
+
+
+def timed(fun):
+    start = time.perf_counter()
+    result = fun()
+    return result, round(time.perf_counter() - start, 2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IdSet memory and speed benchmark")
+    parser.add_argument("--n", help="Number of ids in the first set", type=int, default=10000000)
+    parser.add_argument("--m", help="Number of ids in the second set", type=int, default=2000000)
+    args = parser.parse_args()
+
+    first = random_ids(args.n, 1).tolist()
+    second = first[:args.m // 2] + random_ids(args.m - args.m // 2, 2).tolist()
+    results = {}
+
+    # Python sets
+    first_set, results['set.build'] = timed(lambda: set(first))
+    second_set = set(second)
+    results['set.megabytes'] = round((sys.getsizeof(first_set) + sum(map(sys.getsizeof, first))) / 2 ** 20)
+    _, results['set.membership'] = timed(lambda: [ x in first_set for x in second ])
+    common, results['set.intersection'] = timed(lambda: first_set & second_set)
+    _, results['set.difference'] = timed(lambda: first_set - second_set)
+    del first_set, second_set
+
+    # IdSet
+    first_ids, results['idset.build'] = timed(lambda: IdSet(first))
+    second_ids = IdSet(second)
+    results['idset.megabytes'] = round(first_ids.nbytes / 2 ** 20)
+    _, results['idset.membership'] = timed(lambda: first_ids.contains(second))
+    _, results['idset.membership_encoded'] = timed(lambda: first_ids.contains(second_ids))
+    common_ids, results['idset.intersection'] = timed(lambda: first_ids & second_ids)
+    _, results['idset.difference'] = timed(lambda: first_ids - second_ids)
+    assert len(common_ids) == len(common)
+
+    # sort order: mixing key (one column) against the id pair (two columns)
+    hi, lo = encode(first)
+    _, results['sort.key'] = timed(lambda: np.argsort(mix(hi, lo)))
+    _, results['sort.lexsort'] = timed(lambda: np.lexsort((lo, hi)))
+
+    print(json.dumps(results, indent=2))
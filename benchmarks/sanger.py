@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from extract_sanger import build_results
+
+'''
+Speed of the Sanger result builder against the previous per-sample loop
+Generates request and result cells of N samples (matching, discordant, incomplete and
+empty descriptions) and builds the result table with the previous loop (a Variant per
+cell, one row appended per sample) and with the vectorized builder. Genomic resolution
+is replaced by a fixed lookup so that only table building is timed.
+'''
+
+GENES = ['BRCA1', 'BRCA2', 'TP53', 'MLH1', 'MSH2', 'PALB2', 'ATM', 'CHEK2']
+
+
+class FixedGenomic(object):
+    '''
+    Genomic coordinates without reference data (same pairs resolve to the same coordinates)
+    '''
+    def get_genomic(self, gene, hgvsc):
+        return '17', 41200000 + int(re.search(r'\d+', hgvsc).group()), 'A', 'G', f'{gene}_NM'
+
+    def get_genomic_batch(self, variants):
+        return { variant: self.get_genomic(*variant) for variant in dict.fromkeys(variants) }
+
+
+def sample_data(n, seed):
+    '''
+    Request and result cells of random samples
+
+    Args:
+        n (int): number of samples
+        seed (int): random seed
+
+    Returns:
+        pd.DataFrame: request and result rows, a column per sample
+    '''
+    rng = np.random.default_rng(seed)
+    samples, requests, results = [], [], []
+    for i in range(n):
+        samples.append(f'NGS{i % 900 + 100}_{i % 90 + 10}_{200000 + i}_AB_{"MFU"[i % 3]}_VCP{i % 5}_Pan{4000 + i % 100}')
+        variant = f'{rng.choice(GENES)} c.{rng.integers(1, 9000)}{rng.choice(["A>G", "del", "_2dup"])} {rng.choice(["het", "Hom"])}'
+        requests.append(rng.choice([variant, variant.rsplit(' ', 1)[0], 'Not requested', np.nan], p=[0.7, 0.1, 0.1, 0.1]))
+        results.append(rng.choice([variant, f'{variant[:-3]}hom', 'No variant detected', np.nan], p=[0.6, 0.1, 0.2, 0.1]))
+    return pd.DataFrame([requests, results], index=['request', 'result'], columns=samples)
+
+
+class Variant(object):
+    # previous variant description parser (incomplete descriptions are empty as in the vectorized
+    # classification, the previous parser described them as X so that FP, FN and TN never occurred)
+    def __init__(self, cell):
+        self._zygo = re.search(r'(het|hom)', cell, re.IGNORECASE)
+        self._hgvs = re.search(r'(c\.\d+\S+)', cell)
+        self._gene = re.search(r'([A-Z][A-Z0-9]+)', cell)
+
+    def __str__(self):
+        if self._zygo and self._hgvs and self._gene:
+            return '{} {} {}'.format(self._gene.group(1), self._hgvs.group(1), self._zygo.group(1).lower())
+        return ''
+
+    def check_result(self, other):
+        if str(self) and not str(other):
+            return 'FP'
+        elif str(other) and not str(self):
+            return 'FN'
+        elif not str(self) and not str(other):
+            return 'TN'
+        elif str(self) == str(other):
+            return 'TP'
+
+    def gene(self):
+        return self._gene.group(1) if self._gene else ''
+
+    def hgvs(self):
+        return self._hgvs.group(1) if self._hgvs else ''
+
+
+def append_results(data, babelfish):
+    '''
+    Previous result loop (DataFrame.append replaced by the equivalent concat, missing results read as empty)
+
+    Args:
+        data (pd.DataFrame): request and result rows, a column per sample
+        babelfish (FixedGenomic): genomic coordinates
+
+    Returns:
+        pd.DataFrame: results
+    '''
+    df = pd.DataFrame([], index=[])
+    for sample in data.columns:
+        if type(data[sample]['request']) == str:
+            requested_variant = Variant(data[sample]['request'])
+            confirmed_variant = Variant(data[sample]['result'] if type(data[sample]['result']) == str else '')
+            result = requested_variant.check_result(confirmed_variant)
+            if requested_variant.hgvs():
+                s = re.match(r'(\w+)_(\d+)_(\w+)_(\w{2})_([MFU])_([^_]+)_(Pan\d+)', sample)
+                chrom, genomics = '', ''
+                if requested_variant.gene() and requested_variant.hgvs():
+                    chrom, pos, ref, alt, transcript = babelfish.get_genomic(requested_variant.gene(), requested_variant.hgvs())
+                    genomics = f'g.{pos}{ref}>{alt}'
+                df = pd.concat([df, pd.DataFrame({
+                    'Gene': requested_variant.gene(),
+                    'DNA': s.group(3),
+                    'Final result (HGVS)': confirmed_variant.hgvs(),
+                    'Chr': chrom,
+                    'genomics': genomics,
+                    'transcript': 'NM_138701.3',
+                    'hgvs nom': requested_variant.hgvs(),
+                    'Real': result if result == 'TP' else '',
+                    'False Pos': result if result == 'FP' else '',
+                    'False Neg': result if result == 'FN' else '',
+                    'Run Name': s.group(0),
+                }, index=[0])], ignore_index=True)
+    return df
+
+
+def timed(fun):
+    start = time.perf_counter()
+    result = fun()
+    return result, round(time.perf_counter() - start, 2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sanger result builder speed benchmark")
+    parser.add_argument("--n", help="Number of samples", type=int, default=5000)
+    args = parser.parse_args()
+
+    data = sample_data(args.n, 1)
+    babelfish = FixedGenomic()
+    results = {}
+    previous, results['loop.seconds'] = timed(lambda: append_results(data, babelfish))
+    vectorized, results['vectorized.seconds'] = timed(lambda: build_results(data, babelfish))
+    results['rows'] = len(vectorized)
+    results['speedup'] = round(results['loop.seconds'] / max(results['vectorized.seconds'], 0.01), 1)
+    pd.testing.assert_frame_equal(vectorized.astype(str), previous.astype(str), check_dtype=False)
+
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import dxpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app.dx
+from app.dx import Dx, RateLimiter, stream_map
+
+'''
+Tagging throughput against a local mock API server that throttles requests
+The mock server admits requests at a fixed rate (token bucket) and responds with
+429 and Retry-After otherwise. Compares bulk tagging without client side rate
+limiting (dxpy retries each throttled request on its own) and with the shared
+adaptive rate limiter.
+'''
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rate, burst, retry_after):
+        super().__init__(('127.0.0.1', 0), MockHandler)
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.served = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def admit(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.served += 1
+                return True
+            self.throttled += 1
+            return False
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('content-length', 0)))
+        if self.path == '/system/whoami':
+            self.reply(200, { 'id': 'user-benchmark' })
+        elif self.server.admit():
+            self.reply(200, { 'id': self.path.split('/')[1] })
+        else:
+            self.reply(429, { 'error': { 'type': 'RateLimitConditional', 'message': 'Too many requests' } },
+                { 'Retry-After': str(self.server.retry_after) })
+
+    def reply(self, status, content, headers={}):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def benchmark(server, objects, workers, limiter):
+    '''
+    Tags objects against the mock server
+
+    Args:
+        server (MockServer): mock API server
+        objects (list): data objects
+        workers (int): number of concurrent calls
+        limiter (RateLimiter): shared rate limiter (None for unlimited)
+
+    Returns:
+        dict: benchmark results
+    '''
+    server.served, server.throttled = 0, 0
+    dxpy._pool_manager = None
+    app.dx.LIMITER = limiter or RateLimiter()
+    dx = Dx('benchmark')
+    if not limiter:
+        # plain dxpy connection pool (no client side rate limit)
+        dxpy._pool_manager = dxpy._pool_manager.pool
+    start = time.time()
+    change = lambda obj: dx.change_object_tags(obj['describe']['class'], obj['project'], obj['id'], ['benchmark'])
+    failed = sum(1 for _, error in stream_map(change, objects, workers=workers) if error)
+    elapsed = time.time() - start
+    return {
+        'limiter': 'adaptive' if limiter else 'none',
+        'calls': len(objects),
+        'failed': failed,
+        'seconds': round(elapsed, 2),
+        'callsPerSecond': round(len(objects) / elapsed, 1),
+        'throttledResponses': server.throttled,
+        'finalRate': round(limiter.rate, 1) if limiter else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk tagging throughput under simulated API throttling")
+    parser.add_argument("--calls", help="Number of tagging calls", type=int, default=500)
+    parser.add_argument("--workers", help="Concurrent calls", type=int, default=32)
+    parser.add_argument("--rate", help="Requests per second admitted by the mock server", type=float, default=50)
+    parser.add_argument("--burst", help="Request burst admitted by the mock server", type=int, default=20)
+    parser.add_argument("--retry-after", help="Retry-After of throttled responses (seconds)", type=int, default=1)
+    args = parser.parse_args()
+
+    server = MockServer(args.rate, args.burst, args.retry_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    dxpy.set_api_server_info(host='127.0.0.1', port=server.server_address[1], protocol='http')
+
+    objects = [ { 'id': f'file-{i:024d}', 'project': 'project-benchmark', 'describe': { 'class': 'file' } }
+        for i in range(args.calls) ]
+    for limiter in (None, RateLimiter(rate=args.rate / 2)):
+        print(json.dumps(benchmark(server, objects, args.workers, limiter)))
+    server.shutdown()
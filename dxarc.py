@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 import os
 import re
+import json
+import copy
 import time
+import hashlib
+import threading
+import shlex
 import argparse
 import pandas as pd
 from dxpy.exceptions import InvalidAuthentication
@@ -15,6 +21,13 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from logging.config import dictConfig
 from app.dx import *
+from app.cache import ExecutionCache
+from app.history import CostHistory
+from app.idset import IdSet
+from app.journal import Journal
+from app.snapshot import Snapshot
+from app.simulate import ArchivalSimulator, SIMULATION_COLUMNS
+from app.profiler import Profiler
 from tqdm.auto import tqdm
 from dotenv import load_dotenv
 from slack_logger import SlackHandler, SlackFormatter
@@ -28,10 +41,23 @@ AUDIT_COLUMNS = ['project-name', 'created', 'modified', 'dataUsage', 'archivedDa
 COST_COLUMNS = ['project-name', 'project-id', 'created', 'modified', 'dataUsage', 'archivedDataUsage', 'storageCost', 'billedTo', 'computeCost', 'estComputeCostPerSample']
 COMPUTE_COLUMNS = ['job','launchedBy','workflowName','region','executableName','billTo','state','instanceType','totalPrice']
 ORG_COLUMNS = ['id','estSpendingLimitLeft', 'computeCharges', 'storageCharges', 'dataEgressCharges']
+OBJECT_COLUMNS = ['object', 'name', 'state', 'visibility', 'archive', 'tags', 'folder', 'created', 'modified', 'size',
+    'createdBy', 'project', 'project-id', 'projectCreatedBy', 'billedTo']
+DEDUP_COLUMNS = ['project-name', 'project-id', 'files', 'uniqueGB', 'sharedGB', 'liveGB', 'savingGB']
+# bytes per GB (storage attribution)
+GB = 1024 ** 3
+# integer and float columns in typed (parquet) outputs (other columns of streamed outputs are strings)
+INTEGER_COLUMNS = ['size']
+FLOAT_COLUMNS = ['totalPrice']
+# rows per row group of streamed outputs
+ROW_GROUP_SIZE = 10000
+# held by profiled runs (daemon jobs share the process)
+PROFILE_LOCK = threading.Lock()
 
 # load environment
 load_dotenv()
 DX_API_TOKEN = os.getenv('DX_API_TOKEN')
+DXARC_CACHE = os.getenv('DXARC_CACHE', os.path.expanduser('~/.dxarc'))
 
 
 def as_date(epoch):
@@ -43,6 +69,15 @@ def as_date(epoch):
     '''
     return time.strftime('%Y-%m-%dT d %H:%M:%S', time.localtime(epoch/1000))
 
+def as_day(epoch):
+    '''
+    Converts UNIX epoch to day string
+    input:
+        epoch: int
+        output: str
+    '''
+    return time.strftime('%Y-%m-%d', time.localtime(epoch/1000))
+
 def send_email(email_server, email_from, email_to, email_subject, email_text, email_html):
     '''
     Sends email
@@ -80,27 +115,139 @@ def send_email(email_server, email_from, email_to, email_subject, email_text, em
 
 
 # Pandas DataFrame bases csv output (stdout or file)
+# Files ending in .parquet are written as typed columnar data (epoch timestamps, integer sizes),
+# streamed files are written in row groups as rows are appended (requires file and columns), row groups
+# are printed to screen as they are written, rows are only kept if emailed (data is available once the
+# stream is committed)
 class DataFile(object):
-    def __init__(self, file, email=None, columns=None):
+    def __init__(self, file, email=None, columns=None, stream=False, dates=None, screen=None):
         self.file = file
         self.email = email
         self.columns = columns
+        self.dates = dates if dates else {}
+        self.screen = screen
+        self.trends = None
+        self.parquet = bool(file) and file.endswith('.parquet')
+        self._rows = []
+        self.stream = None
+        self.writer = None
         self.data = pd.DataFrame(columns=columns)
         if columns:
             for COL in columns:
                 if COL not in self.data:
                     self.data[COL] = ''
+        if stream and file and columns:
+            self.stream = file
+        # rows kept of streamed files (row groups, emailed only) and number of rows written
+        self._kept = []
+        self.count = 0
+
+    @property
+    def data(self):
+        if self.stream:
+            raise RuntimeError(f'Data of streamed file {self.stream} is not available before commit')
+        # materialise appended rows
+        if self._rows:
+            self._data = pd.concat([self._data, pd.DataFrame(self._rows)], ignore_index=True)
+            self._rows = []
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        if self.stream:
+            raise RuntimeError(f'Data of streamed file {self.stream} cannot be replaced')
+        self._data = data
+        self._rows = []
 
     def reload(self):
-        self.data = pd.read_csv(self.file)
+        self.data = pd.read_parquet(self.file) if self.parquet else pd.read_csv(self.file)
 
     def append(self,dict):
-        self.data = pd.concat([self.data, pd.DataFrame(dict, index=[0])], ignore_index=True)
+        self._rows.append(dict)
+        if self.stream and len(self._rows) >= ROW_GROUP_SIZE:
+            self._write_rows()
+
+    def formatted(self, data=None):
+        # epoch (ms) columns as date strings for text outputs
+        data = (self.data if data is None else data).copy()
+        for col, fmt in self.dates.items():
+            if col in data:
+                data[col] = data[col].map(lambda x: fmt(x) if pd.notna(x) else x)
+        return data
+
+    def typed(self, data):
+        # epoch (ms) columns as timestamps and integer sizes for columnar outputs
+        data = data.copy()
+        for col in self.dates:
+            if col in data:
+                data[col] = pd.to_datetime(data[col], unit='ms')
+        for col in INTEGER_COLUMNS:
+            if col in data:
+                data[col] = pd.to_numeric(data[col]).astype('Int64')
+        for col in FLOAT_COLUMNS:
+            if col in data:
+                data[col] = pd.to_numeric(data[col]).astype(float)
+        return data
+
+    def schema(self):
+        # columnar schema of streamed outputs (fixed, row groups may infer different types)
+        import pyarrow as pa
+        return pa.schema([ (col, pa.timestamp('ms') if col in self.dates else pa.int64() if col in INTEGER_COLUMNS
+            else pa.float64() if col in FLOAT_COLUMNS else pa.string()) for col in self.columns ])
+
+    def _write_rows(self):
+        # write pending rows as row group (cast to the schema of the output)
+        rows = pd.DataFrame(self._rows, columns=self.columns, index=range(self.count, self.count + len(self._rows)))
+        self._rows = []
+        if self.email:
+            self._kept.append(rows.copy())
+        # print rows up to the screen limit (header with the first row group)
+        shown = len(rows) if self.screen is None else max(0, self.screen - self.count)
+        if shown:
+            print(self.formatted(rows.head(shown)).to_string(header=not self.count))
+        self.count += len(rows)
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if not self.writer:
+                self.writer = pq.ParquetWriter(self.stream, self.schema())
+            typed = self.typed(rows)
+            for field in self.writer.schema:
+                if pa.types.is_string(field.type):
+                    typed[field.name] = typed[field.name].map(lambda x: str(x) if pd.notna(x) else None).astype(object)
+            self.writer.write_table(pa.Table.from_pandas(typed, schema=self.writer.schema, preserve_index=False))
+        else:
+            if not self.writer:
+                self.writer = open(self.stream, 'w', newline='')
+                rows.iloc[:0].to_csv(self.writer, sep="\t", index=False)
+            for col, fmt in self.dates.items():
+                if col in rows:
+                    rows[col] = rows[col].map(lambda x: fmt(x) if pd.notna(x) else x)
+            rows.to_csv(self.writer, sep="\t", index=False, header=False)
+
+    def show(self, data):
+        # print to screen (truncated to number of rows, suppressed if 0)
+        if self.screen is None or len(data) <= self.screen:
+            print(data.to_string())
+        elif self.screen > 0:
+            print(data.head(self.screen).to_string())
+            print(f'... {len(data) - self.screen} more rows', file=sys.stderr)
 
     def commit(self):
+        # flush and close streamed file (kept rows are shown and emailed)
+        streamed = bool(self.stream)
+        if streamed:
+            self._write_rows()
+            self.writer.close()
+            self.stream = None
+            self.data = pd.concat(self._kept, ignore_index=True) if self._kept else self._data
+            self._kept = []
         # write to file and return
-        if self.file:
-            self.data.to_csv(self.file, sep="\t", index=False)
+        if self.file and not streamed:
+            if self.parquet:
+                self.typed(self.data).to_parquet(self.file, index=False)
+            else:
+                self.formatted().to_csv(self.file, sep="\t", index=False)
         # formatted email
         if self.email:
             # validate email config (crude)
@@ -113,6 +260,9 @@ class DataFile(object):
                 return
             # summarize data
             totals = self.data[SUMMARY_COLUMNS].transpose().sum(axis=1)
+            audit = self.formatted()[AUDIT_COLUMNS]
+            # week-over-week changes by billTo (from cost history)
+            trends = self.trends.round(3) if self.trends is not None else pd.DataFrame()
             # create email body
             email_text = """\
             DX Audit - %s
@@ -120,9 +270,12 @@ class DataFile(object):
             Totals:
             %s
 
+            Trends (week over week):
+            %s
+
             Projects
             %s
-            """ % (email_subject, totals.to_string(), self.data[AUDIT_COLUMNS].to_string())
+            """ % (email_subject, totals.to_string(), trends.to_string(index=False), audit.to_string())
             email_html = """\
             <html>
                 <head></head>
@@ -130,18 +283,352 @@ class DataFile(object):
                     <h2>DX Audit - %s</h2>
                     <h5>Totals</h5>
                     %s
+                    <h5>Trends (week over week)</h5>
+                    %s
                     <h5>Projects</h5>
                     %s
                 </body>
             </html>
-            """ % (email_subject, pd.DataFrame([totals]).to_html(), self.data[AUDIT_COLUMNS].to_html())
+            """ % (email_subject, pd.DataFrame([totals]).to_html(), trends.to_html(index=False), audit.to_html())
             # send email
             try:
                 send_email(email_server, email_from, email_to, email_subject, email_text, email_html)
             except Exception as e:
                 logger.warning(f'Could not send audit via email ({str(e)})')
-        # print to screen
-        print(self.data.to_string())
+        # print to screen (streamed rows were printed as written)
+        if not streamed or not self.count:
+            self.show(self.formatted())
+        elif self.screen is not None and 0 < self.screen < self.count:
+            print(f'... {self.count - self.screen} more rows', file=sys.stderr)
+
+
+def compute_audit(projects, cdf, cache=None, workers=WORKERS):
+    '''
+    Audits compute costs of projects (concurrent analysis queries per project)
+    Per job costs are streamed to the compute audit file as projects complete.
+
+    input:
+        projects: list of project search results
+        cdf: DataFile (per job compute costs)
+        cache: ExecutionCache (terminal analyses, only new or running analyses are fetched)
+        workers: int (concurrent queries)
+
+    output:
+        costs: dict (project-id -> (computeCost, estComputeCostPerSample))
+    '''
+    def find_analyses(project_id, created_after):
+        synced = int(time.time() * 1000)
+        analyses = retry(lambda: list(dxpy.bindings.find_executions(project=project_id, classname='analysis',
+            created_after=created_after, describe=True)))
+        return project_id, synced, analyses
+
+    costs = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [ executor.submit(find_analyses, project['id'], cache.watermark(project['id']) if cache else None)
+            for project in projects ]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            project_id, synced, analyses = future.result()
+            if cache:
+                analyses = cache.update(project_id, analyses, synced)
+            # per project stats
+            workflow_counter = Counter()
+            price_counter = Counter()
+            for analysis in analyses:
+                name = analysis['describe']['executableName']
+                workflow_counter[name] += 1
+                price = analysis['describe']['totalPrice']
+                price_counter[name] += price
+                ### detailed compute stats (per job)
+                for stage in analysis['describe']['stages']:
+                    execution = stage['execution']
+                    cdf.append({
+                        'launchedBy': execution['launchedBy'],
+                        'job': execution['id'],
+                        'workflowName': analysis['describe']['executableName'],
+                        'executableName': execution['executableName'],
+                        'region': execution['region'],
+                        'billTo': execution['billTo'],
+                        'state': execution['state'],
+                        'instanceType': execution['instanceType'],
+                        'totalPrice': execution['totalPrice'],
+                    })
+            # summarise compute costs
+            estComputeCostPerSample = 0
+            computeCost = 0
+            for name in workflow_counter:
+                estComputeCostPerSample += price_counter[name]/workflow_counter[name]
+                computeCost += price_counter[name]
+            costs[project_id] = (round(computeCost, 3), round(estComputeCostPerSample, 3))
+    return costs
+
+
+def storage_attribution(snapshot, project_ids, all_copies=False):
+    '''
+    Attributes file storage to projects deduplicated by file id (copies in other projects)
+    The inventory is streamed in chunks of contiguous file ids to bound memory usage.
+
+    input:
+        snapshot: Snapshot (file inventory)
+        project_ids: list (projects to report)
+        all_copies: bool (archival of all copies, e.g. --all)
+
+    output:
+        attribution: pd.DataFrame (files and bytes per project: unique, shared, live, saving)
+        joint_saving: int (bytes freed by archiving all given projects)
+    '''
+    project_ids = set(project_ids)
+
+    def attribute(pairs):
+        pairs = pairs.assign(size=pairs['size'].fillna(0), live=pairs['archivalState'] == 'live',
+            scope=pairs['project'].isin(project_ids))
+        by_file = pairs.groupby('id', sort=False)
+        copies = by_file['project'].transform('size')
+        live_copies = by_file['live'].transform('sum')
+        scope_live_copies = (pairs['live'] & pairs['scope']).groupby(pairs['id'], sort=False).transform('sum')
+        # storage is only freed once no live copy remains
+        freed = pairs['live'] & ((live_copies == 1) | all_copies)
+        pairs = pairs.assign(files=1,
+            unique=pairs['size'].where(copies == 1, 0),
+            shared=pairs['size'].where(copies > 1, 0),
+            live_size=pairs['size'].where(pairs['live'], 0),
+            saving=pairs['size'].where(freed, 0))
+        joint = pairs['live'] & pairs['scope'] & ((scope_live_copies == live_copies) | all_copies)
+        joint_saving = pairs.loc[joint].drop_duplicates('id')['size'].sum()
+        scoped = pairs[pairs['scope']]
+        return scoped.groupby('project')[['files', 'unique', 'shared', 'live_size', 'saving']].sum(), joint_saving
+
+    attribution = pd.DataFrame(columns=['files', 'unique', 'shared', 'live_size', 'saving'])
+    joint_saving = 0
+    carry = None
+    for chunk in snapshot.inventory():
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        # defer last file id (copies may continue in next chunk)
+        last = chunk['id'].iat[-1]
+        carry = chunk[chunk['id'] == last]
+        part, saving = attribute(chunk[chunk['id'] != last])
+        attribution = attribution.add(part, fill_value=0)
+        joint_saving += saving
+    if carry is not None:
+        part, saving = attribute(carry)
+        attribution = attribution.add(part, fill_value=0)
+        joint_saving += saving
+    return attribution, joint_saving
+
+
+def counted(objects, counts, key):
+    '''
+    Counts objects as they pass through a lazy pipeline
+
+    input:
+        objects: iterable (objects)
+        counts: Counter
+        key: str (counter key)
+
+    output:
+        generator: objects
+    '''
+    for obj in objects:
+        counts[key] += 1
+        yield obj
+
+
+def follow_objects(finder, objects, counts):
+    '''
+    Follows objects into other projects (adds other instances of found files) e.g. allows to find files
+    in a project and then tag/archive all copies of it. Files are followed once (found copies of
+    already followed files are skipped).
+
+    input:
+        finder: Dx or Snapshot
+        objects: iterable (object search results)
+        counts: Counter (found and followed objects)
+
+    output:
+        generator: objects followed by their instances in other projects
+    '''
+    # ids are buffered as strings and packed in bulk (lookups are slower than in a set, but small
+    # against the API requests per object, and millions of ids are held in ~24 bytes each)
+    followed = IdSet()
+    for obj in objects:
+        counts['found'] += 1
+        if obj['id'] in followed:
+            continue
+        followed.add(obj['id'])
+        yield obj
+        for p in finder.get_file_projects(obj['id']):
+            if p != obj['project']:
+                f = finder.get_file(p, obj['id'])
+                counts['followed'] += 1
+                yield { 'id': f['id'], 'project': f['project'], 'describe': f }
+
+
+def excluded(objects, exclude_files, counts):
+    '''
+    Removes objects that are contained in excluded projects
+
+    input:
+        objects: iterable (objects)
+        exclude_files: IdSet (file ids)
+        counts: Counter (excluded objects)
+
+    output:
+        generator: objects not excluded
+    '''
+    for obj in objects:
+        if obj['id'] in exclude_files:
+            counts['excluded'] += 1
+        else:
+            yield obj
+
+
+def object_row(obj, project):
+    '''
+    Object summary row
+
+    input:
+        obj: dict (object search result with describe)
+        project: dict (project descriptor)
+
+    output:
+        row: dict (OBJECT_COLUMNS)
+    '''
+    describe = obj['describe']
+    return {
+        'object': obj['id'],
+        'name': describe['name'],
+        'state': describe.get('state'),
+        'visibility': 'hidden' if describe['hidden'] else 'visible',
+        'archive': describe.get('archivalState'),
+        'tags': ','.join(describe['tags']) if 'tags' in describe else None,
+        'folder': describe.get('folder'),
+        'created': describe['created'],
+        'modified': describe['modified'],
+        'size': describe.get('size'),
+        'createdBy': describe['createdBy']['user'],
+        'project': project['name'],
+        'project-id': project['id'],
+        'projectCreatedBy': project['createdBy']['user'],
+        'billedTo': project['billTo'],
+    }
+
+
+def apply_actions(dx, obj, row, args, tags, untags, logger):
+    '''
+    Archives/unarchives and tags a single object (runs in worker threads)
+
+    input:
+        dx: Dx
+        obj: dict (object search result with describe)
+        row: dict (object summary row, receives the tagging outcome)
+        args: argparse.Namespace
+        tags: list (tags to add)
+        untags: list (tags to remove)
+        logger: logging.Logger
+
+    output:
+        row: dict
+    '''
+    is_file = obj['describe']['class'] == 'file'
+    if args.archive and is_file and obj['describe']['archivalState'] == 'live':
+        if args.dryrun:
+            logger.debug(f'Would archive {obj["id"]} in {obj["project"]}')
+        elif not dx.archive(obj['project'], obj['id'], args.all):
+            logger.warning(f'Failed to archive {obj["id"]} in {obj["project"]}. Check permissions.')
+        else:
+            logger.info(f'Archived {obj["id"]} in {obj["project"]}')
+    elif args.unarchive and is_file and obj['describe']['archivalState'] != 'live':
+        if args.dryrun:
+            logger.debug(f'Would unarchive {obj["id"]} in {obj["project"]}')
+        elif not dx.unarchive(obj['project'], obj['id']):
+            logger.warning(f'Failed to unarchive {obj["id"]} in {obj["project"]}. Check permissions.')
+        else:
+            logger.info(f'Unarchived {obj["id"]} in {obj["project"]}')
+    if tags or untags:
+        if args.dryrun:
+            if tags:
+                logger.debug(f'Would tag {obj["id"]} in {obj["project"]} with {args.tag}')
+            if untags:
+                logger.debug(f'Would untag {obj["id"]} in {obj["project"]} with {args.untag}')
+        else:
+            error = dx.change_object_tags(obj['describe']['class'], obj['project'], obj['id'], tags, untags)
+            if error:
+                logger.warning(f'Failed to change tags of {obj["id"]} in {obj["project"]} ({error})')
+            else:
+                logger.info(f'Changed tags of {obj["id"]} in {obj["project"]} (+{args.tag} -{args.untag})')
+            row['tagging'] = error if error else 'OK'
+    return row
+
+
+def find_archival_candidates(dx, project, exclude_files, visibility, tags, after, before):
+    '''
+    Finds files in a project that can be archived (closed, live, not empty and not excluded)
+
+    input:
+        dx: Dx
+        project: dict (project search result)
+        exclude_files: IdSet (file ids excluded from archival)
+        visibility: str
+        tags: list
+        after: str (modified after)
+        before: str (modified before)
+
+    output:
+        live_files: list (file ids)
+    '''
+    # find closed filed for archival
+    closed_files = dx.find_files('.*', 'regexp', project=project['id'], describe=True,
+        visibility=visibility, tags=tags, state='closed',
+        modified_after=after, modified_before=before)
+    # remove files from archival list if in referenced projects (vectorized membership)
+    in_excluded = exclude_files.contains([ x['id'] for x in closed_files ]) if len(exclude_files) else [False] * len(closed_files)
+    safe_files = [ x for x, is_excluded in zip(closed_files, in_excluded) if not is_excluded ]
+    # remove non-live (archival/archived) and zero size files
+    return [ x['id'] for x in safe_files if x['describe']['archivalState'] == 'live' and x['describe']['size'] > 0 ]
+
+
+def archive_project(dx, project, live_files, args, journal, logger):
+    '''
+    Archives files of a project in chunks (max ARCHIVE_BATCH per API call) and renames the project
+
+    input:
+        dx: Dx
+        project: dict (project search result)
+        live_files: list (file ids to archive, None if project has no live data)
+        args: argparse.Namespace
+        journal: Journal (skips committed chunks and renames)
+        logger: logging.Logger
+    '''
+    project_name = project['describe'].get('name')
+    if live_files is not None:
+        # show archival state
+        if args.dryrun:
+            logger.debug(f'Would archive {len(live_files)} objects in {project_name}')
+        elif live_files:
+            logger.info(f'Archiving {len(live_files)} objects in {project_name}')
+            # archive files in chunks (max ARCHIVE_BATCH per API call, failed chunks are run file by file)
+            chunks = [live_files[i:i + ARCHIVE_BATCH] for i in range(0, len(live_files), ARCHIVE_BATCH)]
+            for i, chunk in enumerate(chunks):
+                if journal and i in journal.chunks[project['id']]:
+                    continue
+                failed = dx.archive_files(project['id'], chunk, args.all)
+                if failed:
+                    logger.warning(f'Could not archive {len(failed)} objects in {project_name} (chunk {i+1}/{len(chunks)})')
+                if journal:
+                    journal.record_chunk(project['id'], i)
+
+    # rename project
+    if args.rename:
+        new_project_name = re.sub(args.project, args.rename, project_name)
+        if args.dryrun:
+            logger.debug(f'Would rename project {project_name} to {new_project_name}')
+        elif journal and project['id'] in journal.renames:
+            logger.debug(f'Already renamed {project_name} to {new_project_name}')
+        else:
+            logger.warning(f'Renaming {project_name} to {new_project_name}')
+            dx.update_project(project['id'], name=new_project_name)
+            if journal:
+                journal.record_rename(project['id'], new_project_name)
 
 
 def setup_logger(use_syslog, slack_webhook_url):
@@ -199,20 +686,42 @@ def setup_logger(use_syslog, slack_webhook_url):
     return logger
 
 
-def main(args,logger):
+def main(args,logger,dx=None,profiler=None,executions=None):
     """
-    Main function
+    Main function (reuses an existing DNAnexus session and execution store if given)
     """
+    if not profiler:
+        profiler = Profiler(enabled=False)
 
     # init progress reporter for pandas operations
     tqdm.pandas()
 
+    # archival what-if scenarios (offline, inventory is loaded once)
+    if args.simulate:
+        profiler.phase('simulate')
+        df = DataFile(args.output, columns=SIMULATION_COLUMNS, screen=args.screen)
+        snapshot = Snapshot(args.snapshot)
+        prices = tuple(map(float, args.prices.split(','))) if args.prices else None
+        simulator = ArchivalSimulator(snapshot, visibility=args.visibility, prices=prices)
+        logger.info(f'Loaded {simulator.files} files (storage cost per GB live {simulator.prices[0]:.4f}, archived {simulator.prices[1]:.4f})')
+        df.data = simulator.grid(args.ages or [args.before], args.patterns or [args.project or '.*'],
+            args.exclusions or [args.notin], all_copies=args.all)
+        snapshot.close()
+        df.commit()
+        sys.exit(0)
+
     # connect to DNAnexus
-    try:
-        dx = Dx(args.token)
-    except InvalidAuthentication:
-        logger.error("Authentication token could not be validated")
-        sys.exit(1)
+    profiler.phase('connect')
+    if not dx:
+        try:
+            dx = Dx(args.token)
+        except InvalidAuthentication:
+            logger.error("Authentication token could not be validated")
+            sys.exit(1)
+    if profiler.enabled:
+        # instrument a copy (the session may be shared by concurrent daemon jobs)
+        dx = copy.copy(dx)
+        profiler.instrument(dx, 'Dx')
 
     # argument transformations (time intervals, tag lists)
     after = f'-{args.after}' if args.after else None
@@ -221,8 +730,13 @@ def main(args,logger):
 
     # workstations
     if args.workstations:
-        df = DataFile(args.output, columns=WORKSTATION_COLUMNS)
-        workstations = dx.workstations(after=after, before=before)
+        profiler.phase('workstations')
+        df = DataFile(args.output, columns=WORKSTATION_COLUMNS, screen=args.screen)
+        cache = (executions or ExecutionCache(os.path.join(args.cache, 'executions.db'))) if args.incremental and args.cache else None
+        workstations = dx.workstations(fields=WORKSTATION_COLUMNS, cache=cache, workers=args.workers,
+            created_after=after, created_before=before)
+        if cache and cache is not executions:
+            cache.close()
         # get workstations (workstation app executions)
         logger.info(f'Found {len(workstations)} cloud workstations')
         for workstation in workstations:
@@ -236,7 +750,8 @@ def main(args,logger):
 
     # show orgs
     if args.orgs:
-        df = DataFile(args.output, columns=ORG_COLUMNS)
+        profiler.phase('orgs')
+        df = DataFile(args.output, columns=ORG_COLUMNS, screen=args.screen)
         orgs = list(dxpy.bindings.search.find_orgs({'level': 'MEMBER', 'describe': True}))
         # setup minimal funds warning
         if args.minfunds:
@@ -264,8 +779,20 @@ def main(args,logger):
         df.commit()
         sys.exit(0)
 
-    # datafile (output)
-    df = DataFile(args.output, email=args.email)
+    # sync offline metadata snapshot
+    if args.sync:
+        profiler.phase('snapshot sync')
+        snapshot = Snapshot(args.snapshot)
+        for project, updated in tqdm(snapshot.sync(dx, args.project or '.*', args.full, args.workers)):
+            logger.debug(f'Synced {updated} files of {project["describe"]["name"]}')
+        logger.info(f'Synced snapshot {args.snapshot} (matching {args.project or ".*"})')
+        snapshot.close()
+        sys.exit(0)
+
+    # searches run against offline snapshot if provided (updates are always applied via the API)
+    finder = Snapshot(args.snapshot) if args.snapshot else dx
+    # exclusion lists of archival runs are always live (a stale snapshot would exclude too few files)
+    excluder = dx if args.archive and not args.dryrun else finder
 
     # find data objects (files)
     if args.find:
@@ -274,178 +801,132 @@ def main(args,logger):
             # limit by single project
             project = None
             if args.project:
-                projs = dx.find_projects(args.project, mode='regexp')
+                projs = finder.find_projects(args.project, mode='regexp')
                 if len(projs) != 1:
                     logger.error(f'Found {len(projs)} projects matching {args.project}, expected 1')
                     sys.exit(1)
                 project = projs[0]['id']
                 logger.info(f'Found project {projs[0]["describe"]["name"]} ({project})')
-            # find objects
-            objects = list(dx.find_objects(args.object, mode='regexp', project=project, describe=True, \
-                visibility=args.visibility, tags=tags, classname=args.type, \
-                modified_after=after, modified_before=before, limit=args.limit))
-            logger.info(f'Found {len(objects)} objects matching {args.object}')
-            if not len(objects):
-                sys.exit(1)
-            # follow objects into other projects (finds other isntances of found files) e.g. allows to find files ina project and then tag/archive etc all copies of it
-            if args.follow:
-                followed_objects = []
-                logger.info(f'Following {len(objects)} objects into other projects...')
-                # iterate over objects list and show progress
-                for object in tqdm(objects):
-                    file_projects = dx.get_file_projects(object['id'])
-                    for p in file_projects:
-                        if p != object['project']:
-                            f = dx.get_file(p, object['id'])
-                            followed_objects.append({'id': f['id'], 'project': f['project'], 'describe': f})
-                objects += followed_objects
-                logger.info(f'Added {len(followed_objects)} objects from other projects')
-
-            # remove excluded objects
+            # objects to exclude (file ids in other projects)
+            exclude_files = IdSet()
             if args.notin:
-                exclude_files = dx.project_file_ids(args.notin, visibility=args.visibility)
-                not_excluded_objects = list(filter(lambda x: x['id'] not in exclude_files, objects))
-                logger.info(f'Removed {len(objects) - len(not_excluded_objects)} objects as they are contained in {args.notin}')
-                objects = not_excluded_objects
+                profiler.phase('exclude objects')
+                exclude_files = excluder.project_file_ids(args.notin, visibility=args.visibility)
+                logger.info(f'Excluding {len(exclude_files)} files contained in {args.notin}')
 
-            # print found objects
+            # lazy pipeline: search -> follow -> exclude -> report row -> action
+            # (objects are processed while later result pages are fetched, --limit stops the search)
+            profiler.phase('process objects')
+            counts = Counter()
+            objects = finder.iter_objects(args.object, mode='regexp', project=project, describe=True, \
+                visibility=args.visibility, tags=tags, classname=args.type, \
+                modified_after=after, modified_before=before, limit=args.limit)
+            objects = follow_objects(finder, objects, counts) if args.follow else counted(objects, counts, 'found')
+            if exclude_files:
+                objects = excluded(objects, exclude_files, counts)
+            # report rows (projects are described once)
             projects = {}
-            fileids = set([])
-            print(f'Finding projects...',file=sys.stderr)
-            for f in tqdm(objects):
-                fileids.add(f['id'])
-                # fetch file project
-                if f["project"] not in projects.keys():
-                    projects[f['project']] = dx.get_project(f["project"])
-                p = projects[f['project']]
-                # write file info
-                df.append({
-                    'object': f['id'],
-                    'name': f['describe']['name'],
-                    'state': f['describe']['state'] if 'state' in f['describe'] else None,
-                    'visibility': 'hidden' if f['describe']['hidden'] else 'visible',
-                    'archive': f['describe']['archivalState'] if 'archivalState' in f['describe'].keys() else None,
-                    'tags': ','.join(f['describe']['tags']) if 'tags' in f['describe'].keys() else None,
-                    'folder': f['describe'].get('folder'),
-                    'created': as_date(f['describe']['created']),
-                    'modified': as_date(f['describe']['modified']),
-                    'size': f['describe']['size'] if 'size' in f['describe'].keys() else None,
-                    'createdBy': f['describe']['createdBy']['user'],
-                    'project': p['name'],
-                    'project-id': p['id'],
-                    'projectCreatedBy': p['createdBy']['user'],
-                    'billedTo': p['billTo'],
-                })
+            def report(obj):
+                if obj['project'] not in projects:
+                    projects[obj['project']] = finder.get_project(obj['project'])
+                return obj, object_row(obj, projects[obj['project']])
+            rows = map(report, objects)
+
+            # actions run concurrently as rows arrive (archival, tagging)
+            add_tags = args.tag.split(',') if args.tag else None
+            remove_tags = args.untag.split(',') if args.untag else None
+            if args.archive or args.unarchive or add_tags or remove_tags:
+                action = lambda item: apply_actions(dx, *item, args, add_tags, remove_tags, logger)
+                rows = (row for _, row in stream_map(action, rows, workers=args.workers))
+            else:
+                rows = (row for _, row in rows)
+
+            # write object summary (describes are from before any updates)
+            columns = OBJECT_COLUMNS + (['tagging'] if (add_tags or remove_tags) and not args.dryrun else [])
+            df = DataFile(args.output, email=args.email, columns=columns, stream=True,
+                dates={'created': as_date, 'modified': as_date}, screen=args.screen)
+            fileids = IdSet()
+            for row in tqdm(rows, desc='Objects'):
+                fileids.add(row['object'])
+                df.append(row)
+            logger.info(f'Found {counts["found"]} objects matching {args.object}')
+            if args.follow:
+                logger.info(f'Added {counts["followed"]} objects from other projects')
+            if args.notin:
+                logger.info(f'Removed {counts["excluded"]} objects as they are contained in {args.notin}')
+            if not counts['found']:
+                sys.exit(1)
+            logger.debug(f'There are {len(fileids)} unique in a total of {counts["found"] + counts["followed"] - counts["excluded"]} files')
+            profiler.phase('write output')
             df.commit()
-            df.data.sort_values(by=['object'], inplace=True)
-            logger.debug(f'There are {len(fileids)} unique in a total of {len(df.data)} files')
 
-            # archiving
-            if args.archive:
-                files = list(filter(lambda x: x['describe']['class'] == 'file' and x['describe']['archivalState'] == 'live', objects))
-                print(f'Archiving {len(files)}...', file=sys.stderr)
-                for file in tqdm(files):
-                    if args.dryrun:
-                        logger.debug(f'Would archive {file["id"]} in {file["project"]}')
-                    else:
-                        if not dx.archive(file['project'], file['id'], args.all):
-                            logger.warning(f'Failed to archive {file["id"]} in {file["project"]}. Check permissions.')
-                        else:
-                            logger.info(f'Archived {file["id"]} in {file["project"]}')
-            elif args.unarchive:
-                files = list(filter(lambda x: x['describe']['class'] == 'file' and x['describe']['archivalState'] != 'live', objects))
-                print(f'Unarchiving {len(files)}...', file=sys.stderr)
-                for file in tqdm(files):
-                    if args.dryrun:
-                        logger.debug(f'Would unarchive {file["id"]} in {file["project"]}')
-                    else:
-                        if not dx.unarchive(file['project'], file['id']):
-                            logger.warning(f'Failed to unarchive {file["id"]} in {file["project"]}. Check permissions.')
-                        else:
-                            logger.info(f'Unarchived {file["id"]} in {file["project"]}')
-
-
-            # tagging
-            if args.tag or args.untag:
-                tags = args.tag.split(',') if args.tag else None
-                untags = args.untag.split(',') if args.untag else None
-                logger.info(f'Changing tags for {len(objects)} objects (+{args.tag} -{args.untag})...', file=sys.stderr)
-                for obj in tqdm(objects):
-                    classname = obj['describe']['class']
-                    if tags:
-                        tag_fun = f'{classname}_add_tags'
-                        if args.dryrun:
-                            logger.debug(f'Would tag {obj["id"]} in {obj["project"]} with {args.tag}')
-                        else:
-                            logger.info(f'Tagging {obj["id"]} in {obj["project"]} with {args.tag}')
-                            change_tag = getattr(dxpy.api, tag_fun)
-                            change_tag(obj["id"], { 'tags': tags, 'project': obj["project"] })
-                    if untags:
-                        tag_fun = f'{classname}_remove_tags'
-                        if args.dryrun:
-                            logger.debug(f'Would untag {obj["id"]} in {obj["project"]} with {args.untag}')
-                        else:
-                            logger.info(f'Untagging {obj["id"]} in {obj["project"]} with {args.untag}')
-                            change_tag = getattr(dxpy.api, tag_fun)
-                            change_tag(obj["id"], { 'tags': untags, 'project': obj["project"] })
-        
         # project centred (no files/objects specified)
         elif args.project:
+            df = DataFile(args.output, email=args.email, dates={'created': as_date, 'modified': as_day}, screen=args.screen)
+            # run journal (archival only, resumes discovered projects, candidates, chunks and renames)
+            journal = None
+            if args.archive and not args.dryrun and args.cache:
+                run_id = hashlib.sha1(json.dumps([args.project, args.after, args.before, args.visibility,
+                    args.tags, args.notin, args.all, args.rename]).encode()).hexdigest()[:12]
+                journal = Journal(os.path.join(args.cache, f'archive-{run_id}.journal'), resume=args.resume)
+                if journal.resumed:
+                    logger.info(f'Resuming archival run from {journal.path}')
+                elif journal.completed:
+                    logger.info(f'Previous archival run of {journal.path} completed, starting a new run')
+            elif args.resume:
+                logger.warning('Nothing to resume (only project archival runs are journaled)')
+
             # get projects
-            projects = dx.find_projects(f'{args.project}', mode='regexp', created_after=after, created_before=before)
+            profiler.phase('find projects')
+            if journal and journal.projects is not None:
+                projects = journal.projects
+            else:
+                projects = finder.find_projects(f'{args.project}', mode='regexp', created_after=after, created_before=before)
+                if journal:
+                    journal.record_projects(projects)
             logger.info(f'Found {len(projects)} projects (matching {args.project}, before {before}, after {after})')
             if not len(projects):
                 sys.exit(1)
 
+            # compute cost audit for projects
+            if args.compute:
+                profiler.phase('compute audit')
+                print(f'Auditing compute costs of {len(projects)} projects...', file=sys.stderr)
+                cdf = DataFile(args.compute, columns=COMPUTE_COLUMNS, stream=True, screen=args.screen)
+                cache = (executions or ExecutionCache(os.path.join(args.cache, 'executions.db'))) if args.cache else None
+                compute_costs = compute_audit(projects, cdf, cache, args.workers)
+                if cache and cache is not executions:
+                    cache.close()
+
             # audit
+            profiler.phase('project audit')
             for project in tqdm(projects):
                 data = {
                     'project-name': project['describe']['name'],
                     'project-id': project['id'],
-                    'created': as_date(project['describe']['created']),
-                    'modified': time.strftime('%Y-%m-%d', time.localtime(project['describe']['modified']/1000)),
+                    'created': project['describe']['created'],
+                    'modified': project['describe']['modified'],
                     'dataUsage': round(project['describe']['dataUsage'], 3),
                     'archivedDataUsage': round(project['describe']['archivedDataUsage'], 3),
                     'storageCost': round(project['describe']['storageCost'], 3) if 'storageCost' in project['describe'] else 0,
                     'billedTo': project['describe']['billTo']
                 }
-                # compute cost audit for projects
                 if args.compute:
-                    cdf = DataFile(args.compute, columns=COMPUTE_COLUMNS)
-                    # per project stats
-                    analyses = list(dxpy.bindings.find_executions(project=project['id'], classname='analysis', describe=True))
-                    workflow_counter = Counter()
-                    price_counter = Counter()
-                    for analysis in analyses:
-                        name = analysis['describe']['executableName']
-                        workflow_counter[name] += 1
-                        price = analysis['describe']['totalPrice'] 
-                        price_counter[name] += price
-                        ### detailed compute stats (per job)
-                        for stage in analysis['describe']['stages']:
-                            execution = stage['execution']
-                            cdf.append({
-                                'launchedBy': execution['launchedBy'],
-                                'job': execution['id'],
-                                'workflowName': analysis['describe']['executableName'],
-                                'executableName': execution['executableName'],
-                                'region': execution['region'],
-                                'billTo': execution['billTo'],
-                                'state': execution['state'],
-                                'instanceType': execution['instanceType'],
-                                'totalPrice': execution['totalPrice'],
-                            })
-                    # summarise compute costs
-                    estComputeCostPerSample = 0
-                    computeCost = 0
-                    for name in workflow_counter:
-                        estComputeCostPerSample += price_counter[name]/workflow_counter[name]
-                        computeCost += price_counter[name]
-                    data['computeCost'] = round(computeCost, 3)
-                    data['estComputeCostPerSample'] = round(estComputeCostPerSample, 3)
+                    data['computeCost'], data['estComputeCostPerSample'] = compute_costs[project['id']]
                 # write data
                 df.append(data)
 
+            # append cost snapshot to history and compare with the audit a week ago (same scope)
+            if args.cache:
+                history = CostHistory(os.path.join(args.cache, 'history.db'))
+                scope = json.dumps([args.project, args.after, args.before])
+                snapshot = history.record(scope, df.data)
+                df.trends = history.trends(scope, snapshot)
+                history.close()
+                if df.trends['storageCostDelta'].notna().any():
+                    total = df.trends.iloc[-1]
+                    logger.info(f'Storage cost change: ${total["storageCostDelta"]:+.2f} ({total["dataUsageDelta"]:+.3f} GB) since last week')
+
             df.data.sort_values(by=['storageCost'], inplace=True)
             df.commit()
             if args.compute:
@@ -464,79 +945,202 @@ def main(args,logger):
                 sum_compute = df.data['computeCost'].sum()
                 logger.info(f'Total compute cost: ${sum_compute:10.2f}')
 
+            # deduplicated storage attribution (file inventory from snapshot)
+            if args.dedup:
+                profiler.phase('storage attribution')
+                print(f'Attributing storage of {len(projects)} projects...', file=sys.stderr)
+                attribution, joint_saving = storage_attribution(finder, [ p['id'] for p in projects ], args.all)
+                adf = DataFile(args.dedup, columns=DEDUP_COLUMNS, screen=args.screen)
+                for project in projects:
+                    a = attribution.loc[project['id']] if project['id'] in attribution.index else None
+                    adf.append({
+                        'project-name': project['describe']['name'],
+                        'project-id': project['id'],
+                        'files': int(a['files']) if a is not None else 0,
+                        'uniqueGB': round(a['unique'] / GB, 3) if a is not None else 0,
+                        'sharedGB': round(a['shared'] / GB, 3) if a is not None else 0,
+                        'liveGB': round(a['live_size'] / GB, 3) if a is not None else 0,
+                        'savingGB': round(a['saving'] / GB, 3) if a is not None else 0,
+                    })
+                adf.data.sort_values(by=['savingGB'], inplace=True)
+                adf.commit()
+                logger.info(f'Storage freed:      {joint_saving / GB:12.3f} GB (archiving all projects matching {args.project}{", all copies" if args.all else ""})')
+
             # run archival
             if args.archive:
+                profiler.phase('archive projects')
                 print(f'Archiving {len(projects)} projects...', file=sys.stderr)
-                # get file ids from projects
-                exclude_files = dx.project_file_ids(args.notin, visibility=args.visibility)
-                logger.info(f'Added {len(exclude_files)} object-ids to the exclusion list')
-                # iterate over projects
-                projects_iterator = tqdm(projects)
-                for project in projects_iterator:
-                    # archive files if any in live state
-                    if project['describe']['dataUsage'] != project['describe']['archivedDataUsage']:
-                        # find closed filed for archival
-                        projects_iterator.set_description('Finding files to archive...')
-                        closed_files = list(dx.find_files('.*', 'regexp', project=project['id'], describe=True,
-                            visibility=args.visibility, tags=tags, state='closed', 
-                            modified_after=after, modified_before=before))
-                        # remove files from archival list if in referenced projects
-                        projects_iterator.set_description(f'Excluding files in protected projects ({len(closed_files)})...')
-                        safe_files = list(filter(lambda x: x['id'] not in exclude_files, closed_files))
-                        # remove non-live (archival/archived) and zero size files
-                        projects_iterator.set_description(f'Filtering for live files ({len(safe_files)})...')
-                        live_files = list(filter(lambda x: x['describe']['archivalState'] == 'live'
-                            and x['describe']['size'] > 0, safe_files))
-                        # show archival state
-                        if args.dryrun:
-                            logger.debug(f'Would archive {len(live_files)} objects in {project["describe"].get("name")}')
-                        elif live_files:
-                            logger.info(f'Archiving {len(live_files)} objects in {project["describe"].get("name")}')
-                            # archive files in chunks (max 1000 per API call)
-                            chunks = [live_files[i:i + 1000] for i in range(0, len(live_files), 1000)]
-                            for i, chunk in enumerate(chunks):
-                                projects_iterator.set_description(f'Archiving file chunk {i+1}/{len(chunks)} of {project["describe"]["name"]}...')
-                                files = list(map(lambda x: x['id'], chunk))
-                                try:
-                                    dxpy.api.project_archive(project['id'],
-                                        input_params={ 'files': files, 'allCopies': args.all },
-                                        always_retry=True)
-                                except Exception as e:
-                                    # Any exception in the batch operation will run the batch as individual operations
-                                    # e.g. archive as much as you can
-                                    logger.warning(f'Error in batch operation, running as separate tasks...')
-                                    for f in chunk:
-                                        try:
-                                            dxpy.api.project_archive(project['id'],
-                                                input_params={ 'files': [ f['id'] ], 'allCopies': args.all },
-                                                always_retry=True)
-                                        except dxpy.exceptions.PermissionDenied:
-                                            logger.warning(f'Cannot archive {f["id"]} (Permission Denied).')
-                                        except dxpy.exceptions.InvalidState:
-                                            logger.warning(f'Cannot archive {f["id"]} (Invalid State).')
-                                        except Exception as ee:
-                                            logger.fatal(f'Something prevented the following data object to be archived:')
-                                            print(f)
-                                            raise ee
-
-                    # rename project
-                    if args.rename:
-                        new_project_name = re.sub(args.project, args.rename, project['describe']['name'])
-                        if args.dryrun:
-                            logger.debug(f'Would rename project {project["describe"]["name"]} to {new_project_name}')
-                        else:
-                            logger.warning(f'Renaming {project["describe"]["name"]} to {new_project_name}')
-                            dx.update_project(project['id'], name=new_project_name)
+                # get file ids from projects (only if candidates are not yet known for all projects)
+                if journal and journal.exclude is not None:
+                    exclude_files = journal.exclude
+                elif not journal or any(p['id'] not in journal.candidates for p in projects):
+                    exclude_files = excluder.project_file_ids(args.notin, visibility=args.visibility)
+                    if journal:
+                        journal.record_exclude(exclude_files)
+                    logger.info(f'Added {len(exclude_files)} object-ids to the exclusion list')
+                # find candidates (closed, not excluded, live files)
+                def discover(project):
+                    if project['describe']['dataUsage'] == project['describe']['archivedDataUsage']:
+                        return project, None
+                    if journal and project['id'] in journal.candidates:
+                        return project, journal.candidates[project['id']]
+                    live_files = find_archival_candidates(dx, project, exclude_files, args.visibility, tags, after, before)
+                    if journal:
+                        journal.record_candidates(project['id'], live_files)
+                    return project, live_files
 
+                # pipeline (each project is archived as soon as its candidates are known, up to --workers projects
+                # in flight, candidates are only held for projects in flight, pending projects are cancelled on failure)
+                archive = lambda project: archive_project(dx, *discover(project), args, journal, logger)
+                for _ in tqdm(stream_map(archive, projects, workers=args.workers), total=len(projects), desc='Archiving projects'):
+                    pass
 
-if __name__ == "__main__":
+            if journal:
+                journal.record_done()
+                journal.close()
+
+
+def run(args, logger, dx=None, executions=None):
+    '''
+    Runs main function, profiled if requested (summary and stack samples are written on exit)
+    Profilers instrument process wide functions (dxpy.api, HTTP pool), profiled runs of
+    concurrent daemon jobs therefore run one at a time.
+
+    input:
+        args: argparse.Namespace
+        logger: logging.Logger
+        dx: Dx (reused session)
+        executions: ExecutionCache (reused execution store)
+    '''
+    if not (args.profile or args.sample):
+        return main(args, logger, dx, executions=executions)
+    with PROFILE_LOCK:
+        profiler = Profiler(sample=bool(args.sample))
+        profiler.start()
+        try:
+            main(args, logger, dx, profiler, executions)
+        finally:
+            profiler.stop()
+            if args.profile:
+                profiler.dump(args.profile)
+                logger.info(f'Profile written to {args.profile} ({profiler.wall:.1f}s)')
+            if args.sample:
+                profiler.dump_samples(args.sample)
+                logger.info(f'Stack samples written to {args.sample}')
+
+
+def as_seconds(interval):
+    '''
+    Converts schedule interval to seconds
+    input:
+        interval: str (e.g. 30m, 12h, 1d, 1w)
+        output: int
+    '''
+    m = re.match(r'^(\d+)([smhdw])$', interval)
+    if not m:
+        raise ValueError(f'Invalid interval: {interval}')
+    return int(m.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}[m.group(2)]
+
+
+def run_job(job, dx, executions, logger):
+    '''
+    Runs a scheduled job and logs its duration
+
+    input:
+        job: dict (name, args, notify)
+        dx: Dx (shared session)
+        executions: dict (cache directory -> shared ExecutionCache)
+        logger: logging.Logger
+    '''
+    start = time.time()
+    status = 0
+    try:
+        run(job['args'], logger, dx, executions.get(job['args'].cache))
+    except SystemExit as e:
+        status = e.code
+    except Exception as e:
+        logger.error(f'Job {job["name"]} failed after {time.time() - start:.1f}s ({e})')
+        return
+    level = logging.WARNING if job['notify'] else logging.INFO
+    logger.log(level, f'Job {job["name"]} completed in {time.time() - start:.1f}s' + (f' (exit status {status})' if status else ''))
+
+
+def daemon(args, logger, parser):
+    '''
+    Runs jobs from a schedule with a single authenticated session
+    The schedule is a JSON file with the maximum number of concurrent jobs and a list of jobs, e.g.
+    { "concurrency": 2, "jobs": [ { "name": "funds", "every": "1h", "args": "-r --minfunds 500", "notify": false } ] }
+    Jobs run every interval (first run at startup or at the optional "at" time HH:MM), runs of the same job never overlap.
+
+    input:
+        args: argparse.Namespace (daemon options)
+        logger: logging.Logger
+        parser: argparse.ArgumentParser (parses job arguments)
+    '''
+    with open(args.schedule) as infile:
+        schedule = json.load(infile)
+    jobs = []
+    now = time.time()
+    for job in schedule['jobs']:
+        job_args = parser.parse_args(shlex.split(job['args']))
+        job_args.token = args.token
+        validate_args(parser, job_args)
+        if job_args.daemon:
+            parser.error(f'Scheduled job cannot run a daemon: {job["args"]}')
+        next_run = now
+        if job.get('at'):
+            hour, minute = map(int, job['at'].split(':'))
+            next_run = time.mktime(time.localtime(now)[:3] + (hour, minute, 0, 0, 0, -1))
+            if next_run < now:
+                next_run += 86400
+        jobs.append({ 'name': job.get('name', job['args']), 'args': job_args, 'every': as_seconds(job['every']),
+            'next': next_run, 'notify': job.get('notify', False) })
+    logger.info(f'Scheduled {len(jobs)} jobs from {args.schedule}')
+
+    # single authenticated session (connection pool and rate limiter shared by all jobs)
+    try:
+        dx = Dx(args.token)
+    except InvalidAuthentication:
+        logger.error("Authentication token could not be validated")
+        sys.exit(1)
+    # execution stores stay open (and warm) between jobs, one per cache directory
+    executions = { job['args'].cache: ExecutionCache(os.path.join(job['args'].cache, 'executions.db'))
+        for job in jobs if job['args'].cache }
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=schedule.get('concurrency', 1)) as executor:
+        while True:
+            now = time.time()
+            for job in jobs:
+                if job['next'] > now:
+                    continue
+                if job['name'] in running and not running[job['name']].done():
+                    logger.warning(f'Job {job["name"]} still running, skipping scheduled run')
+                else:
+                    logger.info(f'Starting job {job["name"]}')
+                    running[job['name']] = executor.submit(run_job, job, dx, executions, logger)
+                while job['next'] <= now:
+                    job['next'] += job['every']
+            time.sleep(max(1, min(job['next'] for job in jobs) - time.time()))
+
+
+def get_parser():
+    '''
+    Command line parser (also parses scheduled jobs in daemon mode)
+
+    output:
+        parser: argparse.ArgumentParser
+    '''
     parser = argparse.ArgumentParser(description="Project Archiving Tool")
 
     parser_global = parser.add_argument_group('Global Options')
     parser_global.add_argument("--token", help="DNAnexus access token", default=DX_API_TOKEN)
-    parser_global.add_argument("--output", help="Output file (defaults to STDOUT)", default=None)
+    parser_global.add_argument("--output", help="Output file (defaults to STDOUT, .parquet for columnar output)", default=None)
+    parser_global.add_argument("--screen", help="Maximum rows printed to screen (0 to suppress)", type=int, metavar="ROWS", default=None)
     parser_global.add_argument("--syslog", help="Log actions to SYSLOG (if available)", action='store_true')
     parser_global.add_argument("--slack", help="Log actions to Slack", metavar="WEBHOOK_URL")
+    parser_global.add_argument("--cache", help="Local cache directory (empty to disable)", default=DXARC_CACHE)
+    parser_global.add_argument("--workers", help="Concurrent API calls for bulk operations", type=int, default=WORKERS)
     parser_global.add_argument("--email", help="Send audit as email (via unencrypted relay)", metavar="HOST:PORT,FROM,TO,SUBJECT")
 
     parser_main = parser.add_argument_group('Main Options')
@@ -544,6 +1148,9 @@ if __name__ == "__main__":
     parser_commands.add_argument('-w', dest='workstations', action='store_true', help='Get Workstation info')
     parser_commands.add_argument('-r', dest='orgs', action='store_true', help="Get Organisation info")
     parser_commands.add_argument('-f', dest='find', action='store_true', help="Find projects/objects")
+    parser_commands.add_argument('-s', dest='sync', action='store_true', help="Sync offline metadata snapshot (requires --snapshot)")
+    parser_commands.add_argument('-d', dest='daemon', action='store_true', help="Run scheduled jobs (requires --schedule)")
+    parser_commands.add_argument('-a', dest='simulate', action='store_true', help="Simulate archival scenarios (requires --snapshot)")
 
     parser_find = parser.add_argument_group('Find options')
     parser_find.add_argument("--project", dest='project', help="Project name pattern (e.g. ^002_)", type=str, default=None) 
@@ -557,11 +1164,16 @@ if __name__ == "__main__":
     parser_find.add_argument("--notin", help="Exclude file if in project (regex)", type=str, default=None)
     parser_find.add_argument("--follow", help="Also return the matching files in all projects", action='store_true')
 
+    parser_snapshot = parser.add_argument_group('Snapshot')
+    parser_snapshot.add_argument("--snapshot", metavar='FILE', help="Offline metadata snapshot (synced with -s, searched with -f)", default=None)
+    parser_snapshot.add_argument("--full", action="store_true", help="Full snapshot sync (purges removed files)")
+
     parser_archiving = parser.add_argument_group('Archiving')
     parser_archiving.add_argument("--unarchive", action="store_true", help="Unarchives projects/files")
     parser_archiving.add_argument("--archive", action="store_true", help="Archives projects/files")
     parser_archiving.add_argument("--all", action="store_true", help="Forces archival of all copies of a given file (used with --archive)")
     parser_archiving.add_argument("--rename", help="Rename projects matched regex (e.g. 802_). Only effective when archiving projects!", type=str, default=None)
+    parser_archiving.add_argument("--resume", action="store_true", help="Resume interrupted project archival from the run journal (kept in --cache)")
     parser_archiving.add_argument("--dryrun", action="store_true", help="Dry-run (used with --archive)")
 
     parser_updating = parser.add_argument_group('Updating')
@@ -569,24 +1181,71 @@ if __name__ == "__main__":
     parser_updating.add_argument("--untag", help="Remove file tags", metavar="TAG1,TAG2,...", type=str)
 
     parser_audit = parser.add_argument_group('Audit')
-    parser_audit.add_argument("--compute", metavar='FILE', help="Compute cost audit")
+    parser_audit.add_argument("--compute", metavar='FILE', help="Compute cost audit (.parquet for columnar output)")
+    parser_audit.add_argument("--dedup", metavar='FILE', help="Deduplicated storage attribution and archival saving per project (requires --snapshot)")
+    parser_audit.add_argument("--incremental", action="store_true", help="Only fetch new or running workstations (terminated workstations are kept in --cache)")
     parser_audit.add_argument("--minfunds", metavar='AMOUNT[:ORG]', help="Warns if funds are below level (optional ORG)")
 
+    parser_profile = parser.add_argument_group('Profiling')
+    parser_profile.add_argument("--profile", metavar='FILE', help="Write JSON profile (phase wall time, API calls, bytes received, retries, throttling)")
+    parser_profile.add_argument("--sample", metavar='FILE', help="Write sampled Python stacks (folded format)")
 
-    # outputs
-    args = parser.parse_args()
+    parser_simulate = parser.add_argument_group('Simulation (evaluates all combinations)')
+    parser_simulate.add_argument("--ages", nargs='+', metavar='AGE', help="Modified before thresholds (defaults to --before)", default=None)
+    parser_simulate.add_argument("--patterns", nargs='+', metavar='REGEX', help="Project name patterns (defaults to --project)", default=None)
+    parser_simulate.add_argument("--exclusions", nargs='+', metavar='REGEX', help="Exclusion project patterns (defaults to --notin)", default=None)
+    parser_simulate.add_argument("--prices", metavar='LIVE,ARCHIVED', help="Storage cost per GB live and archived (estimated from project costs)", default=None)
+
+    parser_daemon = parser.add_argument_group('Daemon')
+    parser_daemon.add_argument("--schedule", metavar='FILE', help="Job schedule (JSON)", default=None)
+    return parser
 
+
+def validate_args(parser, args):
+    '''
+    Validates argument combinations (exits with usage on error)
+
+    input:
+        parser: argparse.ArgumentParser
+        args: argparse.Namespace
+    '''
     if args.find and not (args.project or args.object):
         parser.error("--project and/or --object is required with -f")
 
+    if args.sync and not args.snapshot:
+        parser.error("--snapshot is required with -s")
+
+    if args.dedup and not args.snapshot:
+        parser.error("--snapshot is required with --dedup")
+
+    if args.simulate and not args.snapshot:
+        parser.error("--snapshot is required with -a")
+
+    if args.prices and not re.match(r'^[\d.]+,[\d.]+$', args.prices):
+        parser.error("--prices must be LIVE,ARCHIVED (cost per GB)")
+
+    if args.daemon and not args.schedule:
+        parser.error("--schedule is required with -d")
+
     if not args.token:
         parser.error("Supply access token or set the DX_API_TOKEN environment variable.")
 
+
+if __name__ == "__main__":
+    parser = get_parser()
+
+    # outputs
+    args = parser.parse_args()
+    validate_args(parser, args)
+
     # setup logger
     logger = setup_logger(args.syslog, args.slack)
 
     try:
-        main(args, logger)
+        if args.daemon:
+            daemon(args, logger, parser)
+        else:
+            run(args, logger)
     except Exception as e:
         logger.critical('DXARC failed with',e)
     else:
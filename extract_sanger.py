@@ -1,56 +1,157 @@
 import sys
+import numpy as np
 import pandas as pd
 import os
 import re
 from collections import defaultdict
 import argparse
-import pyhgvs as hgvs
-import pyhgvs.utils as hgvs_utils
+import openpyxl
 from pyfaidx import Fasta
-
-def get_variants(df):
-    cols = [ i for i, col in enumerate(df.columns) if type(col)==str and re.match(r'NGS\w+_\d+_\w+_\w{2}',col) ]
-    index_column = df.columns[min(cols)-1]
-    rows = df.index[df[index_column].isin(['SNV variant confirmation','Final Result']) == True]
-    result = df.iloc[rows,cols]
-    result.index = ['request','result']
-    return result
-
-
-class Variant(object):
-    def __init__(self,cell):
-        self._zygo = re.search(r'(het|hom)', cell, re.IGNORECASE)
-        self._hgvs = re.search(r'(c\.\d+\S+)', cell)
-        self._gene = re.search(r'([A-Z][A-Z0-9]+)', cell)
-
-    def __str__(self):
-        if self._zygo and self._hgvs and self._gene:
-            return '{} {} {}'.format(self._gene.group(1), self._hgvs.group(1), self._zygo.group(1).lower())
-        else:
-            return 'X'
-
-    def check_result(self,other):
-        if str(self) and not str(other):
-            return 'FP'
-        elif str(other) and not str(self):
-            return 'FN'
-        elif not str(self) and not str(other):
-            return 'TN'
-        elif str(self) == str(other):
-            return 'TP'
-    
-    def gene(self):
-        return self._gene.group(1) if self._gene else ''
-
-    def hgvs(self):
-        return self._hgvs.group(1) if self._hgvs else ''
+from tqdm.auto import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.transcripts import load_transcripts
+from app.genomic import GenomicResolver
+from app.parsecache import ParseCache, file_stamp
+
+SAMPLE_PATTERN = r'NGS\w+_\d+_\w+_\w{2}'
+SAMPLE_NAME = r'(\w+)_(\d+)_(\w+)_(\w{2})_([MFU])_([^_]+)_(Pan\d+)'
+# parts of variant descriptions (e.g. BRCA1 c.68_69del het)
+VARIANT_PARTS = { 'gene': r'([A-Z][A-Z0-9]+)', 'hgvs': r'(c\.\d+\S+)', 'zygosity': r'(?i)(het|hom)' }
+VARIANT_ROWS = ['SNV variant confirmation', 'Final Result']
+# local cache (shared with dxarc), cached variant tables are invalidated by changes of read_variants
+CACHE_DIR = os.getenv('DXARC_CACHE', os.path.expanduser('~/.dxarc'))
+PARSER_VERSION = 'sanger-variants-1'
+
+
+def cell_value(value):
+    """
+    Cell value as stored in the parse cache (str, number or None)
+    """
+    return value if value is None or isinstance(value, (str, int, float)) else str(value)
+
+
+def read_variants(path):
+    """
+    Read the requested and confirmed variants of the samples of a workbook (runs in worker processes)
+    Only the header row and the columns from the row labels (preceding the first sample) to the last sample are read,
+    up to the last variant row.
+    Returns the modification time and size of the file, and a list of [sample, request, result]
+    """
+    stamp = file_stamp(path)
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+        cols = [ i for i, col in enumerate(header) if type(col)==str and re.match(SAMPLE_PATTERN, col) ]
+        if not cols:
+            raise ValueError('no sample columns')
+        first = min(cols) - 1
+        rows = []
+        for row in sheet.iter_rows(min_row=2, min_col=first + 1, max_col=max(cols) + 1, values_only=True):
+            if row[0] in VARIANT_ROWS:
+                rows.append([ cell_value(row[i - first]) for i in cols ])
+                if len(rows) == len(VARIANT_ROWS):
+                    break
+        if len(rows) != len(VARIANT_ROWS):
+            raise ValueError('variant rows not found')
+    finally:
+        workbook.close()
+    return stamp, [ [header[i], request, result] for i, request, result in zip(cols, *rows) ]
+
+
+def read_workbooks(paths, jobs=1, cache=None):
+    """
+    Read the variants of workbooks in worker processes (files cached with the same modification time and size are not read)
+    Returns a DataFrame with request and result rows and a column per sample (in order of paths)
+    """
+    variants = { path: cache.get(path) for path in paths } if cache else {}
+    parse = [ path for path in paths if variants.get(path) is None ]
+    print(f'Reading {len(parse)} of {len(paths)} workbooks...', file=sys.stderr)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = { executor.submit(read_variants, path): path for path in parse }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            path = futures[future]
+            try:
+                stamp, variants[path] = future.result()
+            except Exception as error:
+                print(f'Could not read {path}: {error}', file=sys.stderr)
+                continue
+            if cache:
+                cache.put(path, variants[path], stamp)
+    samples = [ sample for path in paths for sample in variants.get(path) or [] ]
+    return pd.DataFrame([ sample[1:] for sample in samples ], index=[ sample[0] for sample in samples ],
+        columns=['request', 'result']).T
+
+
+def describe_variants(cells):
+    """
+    Extract gene, HGVS.c and zygosity from variant descriptions (parts not found are empty)
+    The variant is 'gene hgvs zygosity' if all parts are found, empty otherwise (no variant described).
+    Returns a DataFrame of gene, hgvs, zygosity and variant
+    """
+    cells = pd.Series(cells, dtype=object)
+    parts = pd.DataFrame({ part: cells.str.extract(pattern, expand=False).fillna('')
+        for part, pattern in VARIANT_PARTS.items() })
+    parts['zygosity'] = parts['zygosity'].str.lower()
+    parts['variant'] = (parts['gene'] + ' ' + parts['hgvs'] + ' ' + parts['zygosity']).where(
+        (parts[list(VARIANT_PARTS)] != '').all(axis=1), '')
+    return parts
+
+
+def classify(requested, confirmed):
+    """
+    Classify requested against confirmed variants (TP, FP, FN, TN, empty if different variants)
+    Missing or incomplete descriptions are empty (the previous loop described them as X, so that only TP was produced).
+    """
+    requested, confirmed = np.asarray(requested, dtype=object), np.asarray(confirmed, dtype=object)
+    return np.select([
+        (requested != '') & (confirmed == ''),
+        (confirmed != '') & (requested == ''),
+        (requested == '') & (confirmed == ''),
+        requested == confirmed
+    ], ['FP', 'FN', 'TN', 'TP'], default='')
+
+
+def build_results(data, babelfish):
+    """
+    Build the result table of samples with a requested variant (data has request and result rows and a column per sample)
+    Each unique gene and HGVS.c is resolved once.
+    """
+    samples = data.T
+    samples = samples[samples['request'].map(type) == str]
+    requested = describe_variants(samples['request'].to_numpy())
+    confirmed = describe_variants(samples['result'].to_numpy())
+    result = classify(requested['variant'], confirmed['variant'])
+    # samples with HGVS.c in the requested variant
+    keep = (requested['hgvs'] != '').to_numpy()
+    requested, confirmed, result = requested[keep], confirmed[keep], result[keep]
+    # sample name and its constituents
+    names = samples.index.to_series()[keep].str.extract(f'({SAMPLE_NAME})')
+    # genomic coordinates (if gene known)
+    variants = list(zip(requested['gene'], requested['hgvs']))
+    genomic = babelfish.get_genomic_batch(variant for variant in variants if variant[0])
+    coordinates = [ genomic[variant] if variant[0] else ('', '', '', '', '') for variant in variants ]
+    return pd.DataFrame({
+        'Gene': requested['gene'].to_numpy(),
+        'DNA': names[3].to_numpy(),
+        'Final result (HGVS)': confirmed['hgvs'].to_numpy(),
+        'Chr': [ chrom for chrom, pos, ref, alt, transcript in coordinates ],
+        'genomics': [ f'g.{pos}{ref}>{alt}' if pos != '' else '' for chrom, pos, ref, alt, transcript in coordinates ],
+        'transcript': 'NM_138701.3',
+        'hgvs nom': requested['hgvs'].to_numpy(),
+        'Real': np.where(result == 'TP', result, ''),
+        'False Pos': np.where(result == 'FP', result, ''),
+        'False Neg': np.where(result == 'FN', result, ''),
+        'Run Name': names[0].to_numpy(),
+    })
 
 
 class HGVS(object):
     def __init__(self, refgene, genome, genetranscripts) -> None:
         self.genome = Fasta(genome) 
-        with open(refgene) as infile:
-            self.transcripts = hgvs_utils.read_transcripts(infile)
+        # compiled transcript index (version fallbacks are precomputed)
+        self.transcripts = load_transcripts(refgene)
+        self.resolver = GenomicResolver(self.genome, self._get_transcript)
 
         # read preferred transcripts
         self.genetranscripts = defaultdict(list)
@@ -61,25 +162,13 @@ class HGVS(object):
             
 
     def _get_transcript(self, tx):
-        transcript = self.transcripts.get(tx)
-        if not transcript:
-            # extract transcript (following successive versioning)
-            try:
-                nm, version = tx.split('.')
-            except ValueError as e:
-                nm, version = tx, 1
-            for i in range(int(version),int(version)+10):
-                transcript = self.transcripts.get(f'{nm}.{i}')
-                if transcript:
-                    break
-        return transcript
+        return self.transcripts.get(tx)
 
     def get_genomic(self, transcript, hgvsc):
         # if only gene known ifer from genomic from preferred transcript list
         if not transcript.startswith('NM_'):
             transcript_candidates = self.genetranscripts.get(transcript)
-            genomic = list(map(lambda t: hgvs.parse_hgvs_name(f'{t}:{hgvsc}', self.genome, get_transcript=self._get_transcript),
-                transcript_candidates))
+            genomic = self.resolver.resolve_batch(f'{t}:{hgvsc}' for t in transcript_candidates)
             if len(genomic) > 1:
                 try:
                     assert len(list(set(genomic))) == 1
@@ -87,10 +176,17 @@ class HGVS(object):
                     raise Exception('Cannot unambiguously determine transcript from gene name')
             return *genomic[0], transcript_candidates[0]
         # return genomic coordinate from single transcript
-        chrom, offset, ref, alt = hgvs.parse_hgvs_name(f'{transcript}:{hgvsc}', self.genome, get_transcript=self._get_transcript)
+        chrom, offset, ref, alt = self.resolver.resolve(f'{transcript}:{hgvsc}')
         return chrom, offset, ref, alt, self._get_transcript(transcript)
         # return chrom, offset, ref, alt, transcript
 
+    def get_genomic_batch(self, variants):
+        """
+        Resolve (transcript or gene, hgvsc) pairs, each unique pair once
+        Returns a dict of get_genomic results by pair
+        """
+        return { variant: self.get_genomic(*variant) for variant in dict.fromkeys(variants) }
+
 
 def main(args):
     # load Babelfish
@@ -98,47 +194,17 @@ def main(args):
     babelfish = HGVS(args.refgene, args.genome, args.genetranscripts)
     print('DONE',file=sys.stderr)
 
-    # extract data
-    dataframes = []
-    for directory, subdirectories, files in os.walk(args.directory):
-        for f in files:
-            if f.endswith('.xlsx'):
-                # read data
-                a = pd.read_excel(os.path.join(directory,f))
-                # get variants
-                df = get_variants(a)
-                dataframes.append(df)
-    data = pd.concat(dataframes,axis=1)
-
-    df = pd.DataFrame([],index=[])
-    for sample in data.columns:
-        if type(data[sample]['request']) == str:
-            # get variant and assess FP/FN/TP/TN
-            requested_variant = Variant(data[sample]['request'])
-            confirmed_variant = Variant(data[sample]['result'])
-            result = requested_variant.check_result(confirmed_variant)
-            if requested_variant.hgvs():
-                # get sample name constituents
-                s = re.match(r'(\w+)_(\d+)_(\w+)_(\w{2})_([MFU])_([^_]+)_(Pan\d+)',sample)
-                # get HGVS and transcript (guess)
-                if requested_variant.gene() and requested_variant.hgvs():
-                    chrom, pos, ref, alt, transcript = babelfish.get_genomic(requested_variant.gene(), requested_variant.hgvs())
-                    genomics = f'g.{pos}{ref}>{alt}'
-                # build data frame
-                df = df.append(pd.DataFrame({
-                    'Gene': requested_variant.gene(),
-                    'DNA': s.group(3),
-                    'Final result (HGVS)': confirmed_variant.hgvs(),
-                    'Chr': chrom,
-                    'genomics': genomics,
-                    'transcript': 'NM_138701.3',
-                    'hgvs nom': requested_variant.hgvs(),
-                    'Real': result if result == 'TP' else '',
-                    'False Pos': result if result == 'FP' else '',
-                    'False Neg': result if result == 'FN' else '',
-                    'Run Name': s.group(0),
-                }, index=[0]), ignore_index=True)
-    
+    # extract data (only new or changed workbooks are read)
+    paths = [ os.path.join(directory, f) for directory, subdirectories, files in os.walk(args.directory)
+        for f in files if f.endswith('.xlsx') ]
+    cache = ParseCache(os.path.join(args.cache, 'sanger.db'), PARSER_VERSION) if args.cache else None
+    data = read_workbooks(paths, args.jobs, cache)
+    if cache:
+        cache.close()
+
+    # classify and resolve all samples at once
+    df = build_results(data, babelfish)
+
     # write output
     df.to_csv(args.output if args.output else sys.stdout, sep=',', index=False)
 
@@ -151,6 +217,8 @@ if __name__=="__main__":
     parser.add_argument("--refgene", help="RefGene file for HGVS.c resolution", required=True)
     parser.add_argument("--genome", help="Genome file for HGVS.c resolution/validation", required=True)
     parser.add_argument("--genetranscripts", help="Preferred transcripts")
+    parser.add_argument("--jobs", help="Worker processes reading workbooks", type=int, default=4)
+    parser.add_argument("--cache", help="Local cache directory for extracted variants (empty to disable)", default=CACHE_DIR)
 
     parser.add_argument("--force", help="Force file identification", action='store_true')
     parser.add_argument("--folder", help="File folder", default="/output")
@@ -4,17 +4,18 @@ from collections import defaultdict
 import sys
 import os
 import re
-import csv
+import json
 import argparse
 import pandas as pd
 from dxpy.exceptions import InvalidAuthentication
 from app.dx import *
+from app.transcripts import load_transcripts
+from app.genomic import GenomicResolver
+from app.blockcache import BlockCache, BlockProxy
 import pysam
-import pyhgvs as hgvs
-import pyhgvs.utils as hgvs_utils
 from pyfaidx import Fasta
 from tqdm.auto import tqdm
-from functools import cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
 SAMPLE_COLUMN = 'Run Name'
 CHROM_COLUMN = 'Chr'
 GDOT_COLUMN = 'genomics'
@@ -23,11 +24,17 @@ HGVS_COLUMN = 'hgvs nom'
 VALIDATED_GENOMIC = 'validated_genomic'
 VARIANT_PADDING = 10
 VCF_COLUMN = 'qual'
+VCF_FIELDS = ['qual', 'GT', 'GQ', 'DP', 'AF', 'BaseQRankSum', 'ExcessHet', 'QD']
 UNARCHIVED_COLUMN = 'unarchived'
+# ids of the files unarchived for a sample (separated by ;)
+UNARCHIVED_FILES_COLUMN = 'unarchived-files'
+# local cache (shared with dxarc)
+CACHE_DIR = os.getenv('DXARC_CACHE', os.path.expanduser('~/.dxarc'))
+FILE_COLUMNS = ['project-id', 'project-name', 'vcf-id', 'vcf-name', 'index-id', 'index-name']
 
 '''Data read and write'''
 class DataFile(object):
-    def __init__(self, file):
+    def __init__(self, file, checkpoint=None):
         self.file = file
         data = pd.read_csv(file)
         if 'project-id' not in data:
@@ -41,80 +48,262 @@ class DataFile(object):
         if 'index-name' not in data:
             data['index-name'] = ''
         self.data = data
-    
+        # replay sample assignments of an interrupted run
+        self.checkpoint = checkpoint
+        if checkpoint and os.path.exists(checkpoint):
+            self.assign_samples(self.read_checkpoint())
+
     def reload(self):
         self.data = pd.read_csv(self.file)
 
-    def assign(self, sample, column, value):
-        self.data.loc[self.data[SAMPLE_COLUMN] == sample,column] = value
-    
+    def assign_samples(self, values):
+        """
+        Assign column values of many samples at once ({ sample: { column: value } })
+        """
+        if not values:
+            return
+        aligned = pd.DataFrame.from_dict(values, orient='index').reindex(self.data[SAMPLE_COLUMN])
+        aligned.index = self.data.index
+        for column in aligned.columns:
+            self.data[column] = aligned[column].combine_first(self.data[column]) if column in self.data else aligned[column]
+
+    def log(self, sample, values):
+        """
+        Append the column values of a sample to the checkpoint log
+        """
+        if self.checkpoint:
+            with open(self.checkpoint, 'a') as outfile:
+                outfile.write(json.dumps([sample, values], default=lambda x: x.item() if hasattr(x, 'item') else str(x)) + '\n')
+
+    def read_checkpoint(self):
+        """
+        Read the checkpoint log (later entries of a sample take precedence, a partially written last line is ignored)
+        """
+        values = {}
+        with open(self.checkpoint) as infile:
+            for line in infile:
+                try:
+                    sample, sample_values = json.loads(line)
+                except ValueError:
+                    continue
+                values.setdefault(sample, {}).update(sample_values)
+        return values
+
     def has_column(self,colname):
         return colname in self.data.columns
 
     def samples(self,all=False):
         if all:
             return self.data[SAMPLE_COLUMN].unique()
-        return self.data[self.data['vcf-id'] == ''][SAMPLE_COLUMN].unique()
+        return self.data[self.data['vcf-id'].fillna('') == ''][SAMPLE_COLUMN].unique()
 
     def commit(self,outfile=None):
-        return self.data.to_csv(outfile if outfile else self.file, index=False)
+        self.data.to_csv(outfile if outfile else self.file, index=False)
+        # all progress is in the written file
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
 
 """HGVS translator"""
 class HGVS(object):
     def __init__(self, refgene, genome) -> None:
         self.genome = Fasta(genome) 
-        with open(refgene) as infile:
-            self.transcripts = hgvs_utils.read_transcripts(infile)
+        # compiled transcript index (version fallbacks are precomputed)
+        self.transcripts = load_transcripts(refgene)
+        self.resolver = GenomicResolver(self.genome, self._get_transcript)
 
     def _get_transcript(self, tx):
-        transcript = self.transcripts.get(tx)
-        if not transcript:
-            nm, version = tx.split('.')
-            for i in range(int(version),int(version)+10):
-                transcript = self.transcripts.get(f'{nm}.{i}')
-                if transcript:
-                    break
-        return transcript
+        return self.transcripts.get(tx)
 
     def get_genomic(self, hgvs_name):
-        chrom, offset, ref, alt = hgvs.parse_hgvs_name(hgvs_name, self.genome, get_transcript=self._get_transcript)
+        chrom, offset, ref, alt = self.resolver.resolve(hgvs_name)
         return chrom, offset, ref, alt
 
+    def get_genomic_batch(self, hgvs_names):
+        """
+        Resolve HGVS names (each unique name once), returns a dict of genomic coordinates by name
+        """
+        hgvs_names = list(hgvs_names)
+        return dict(zip(hgvs_names, self.resolver.resolve_batch(hgvs_names)))
+
+
+def fetch_vcf_record(vcf, variant):
+    """
+    Fetch a variant (chrom, pos, ref, alt) from an open VCF file
+    """
+    chrom, pos, ref, alt = variant
+    # determine search window
+    start = max(0, int(pos) - 1 - VARIANT_PADDING)
+    end = int(pos) - 1 + len(ref) + VARIANT_PADDING
+    for record in vcf.fetch(chrom, start, end):
+        if (record.pos == int(pos) and record.ref == ref and ','.join(record.alts) == alt):
+            f = dict(record.samples[0].items())
+            i = dict(record.info.items())
+            return {
+                'qual': record.qual,
+                'GT': '/'.join(map(str,f['GT'])),
+                'GQ': f['GQ'],
+                'DP': f['DP'],
+                'AF': f['AD'][1]/sum(f['AD']),
+                'BaseQRankSum': i['BaseQRankSum'] if 'BaseQRankSum' in i else None,
+                'ExcessHet': i['ExcessHet'],
+                'QD': i['QD']
+            }
+
+
+def get_vcf_records(url_vcf, url_tbi, variants):
+    """
+    Get the vcf records of variants (chrom:pos:ref:alt by row index) from a VCF file (runs in worker processes)
+    The VCF is opened once and the variants are fetched in coordinate order.
+    Returns a dict of records by row index (rows without record are omitted)
+    """
+    records = {}
+    with pysam.VariantFile(filename=url_vcf, index_filename=url_tbi) as vcf:
+        variants = variants.str.split(':')
+        for index, variant in sorted(variants.items(), key=lambda x: (x[1][0], int(x[1][1]))):
+            record = fetch_vcf_record(vcf, variant)
+            if record:
+                records[index] = record
+    return records
+
+
+def located_rows(data):
+    """
+    Rows with a VCF file
+    """
+    return data[data['vcf-id'].notna() & (data['vcf-id'] != '')]
+
+
+def sample_files(data):
+    """
+    VCF and index files of rows, returns a dict of samples by (project-id, file-id)
+    """
+    files = defaultdict(set)
+    for column in ('vcf-id', 'index-id'):
+        rows = data[data[column].notna() & (data[column] != '')]
+        for project_id, file_id, sample in rows[['project-id', column, SAMPLE_COLUMN]].itertuples(index=False):
+            files[(project_id, file_id)].add(sample)
+    return files
+
+
+def unarchived_files(data):
+    """
+    Files unarchived for extraction (recorded by request_unarchival), returns a dict of samples by (project-id, file-id)
+    """
+    files = defaultdict(set)
+    if UNARCHIVED_FILES_COLUMN not in data:
+        return files
+    rows = data[(data[UNARCHIVED_COLUMN] == True) & data[UNARCHIVED_FILES_COLUMN].notna()]
+    for project_id, file_ids, sample in rows[['project-id', UNARCHIVED_FILES_COLUMN, SAMPLE_COLUMN]].itertuples(index=False):
+        for file_id in str(file_ids).split(';'):
+            if file_id:
+                files[(project_id, file_id)].add(sample)
+    return files
+
 
-def get_vcf_record(row, dx):
-    """
-    Get the vcf record from dnanexus unique file and project identfiers
-    """
-    # determine search window and variant alleles
-    chrom, pos, ref, alt = row[VALIDATED_GENOMIC].split(':')
-    start = int(pos) - 1 - VARIANT_PADDING
-    end = start + len(ref) + VARIANT_PADDING
-    url_vcf = dx.file_url(row['project-id'], row['vcf-id'])['url']
-    url_tbi = dx.file_url(row['project-id'], row['index-id'])['url']
-    if url_vcf and url_tbi:
-        vcf = pysam.VariantFile(filename=url_vcf, index_filename=url_tbi)
-        # get chromsome location
-        records = vcf.fetch(chrom,start,end)
-        for record in records:
-            if (record.pos == int(pos) and record.ref == ref and ','.join(record.alts) == alt):
-                f = dict(record.samples[0].items())
-                i = dict(record.info.items())
-                values = {
-                    'GT': '/'.join(map(str,f['GT'])),
-                    'GQ': f['GQ'],
-                    'DP': f['DP'],
-                    'AF': f['AD'][1]/sum(f['AD']),
-                    'BaseQRankSum': i['BaseQRankSum'] if 'BaseQRankSum' in i else None,
-                    'ExcessHet': i['ExcessHet'],
-                    'QD': i['QD']
-                }
-                return pd.Series(dict(qual=record.qual, **values))
-    return pd.Series()
-
-
-def get_genomic_coordinates(row, babelfish):
-    """
-    Get the genomic coordinates from the HGVS.g / HGVS.c (validates)
+def request_unarchival(dx, data):
+    """
+    Request unarchival of the archived VCF and index files of all rows (one batch per project)
+    Files being archived cannot be unarchived until archival completes and are not requested.
+    Returns the ids of the files being unarchived by sample
+    """
+    files = sample_files(located_rows(data))
+    states = dx.archival_states(files)
+    archived = defaultdict(list)
+    for project_id, file_id in files:
+        if states.get(file_id) == 'archived':
+            archived[project_id].append(file_id)
+    unarchived = defaultdict(list)
+    for project_id, file_ids in archived.items():
+        failed = set(dx.unarchive_files(project_id, file_ids))
+        for file_id in file_ids:
+            if file_id not in failed:
+                for sample in files[(project_id, file_id)]:
+                    unarchived[sample].append(file_id)
+    return unarchived
+
+
+def rearchive_files(dx, data):
+    """
+    Re-archive the files that were unarchived for extraction (one batch per project, live files only)
+    Files that were live before the run are left live, files still being unarchived are left for a later run.
+    Returns the samples whose files were re-archived
+    """
+    files = unarchived_files(data)
+    states = dx.archival_states(files)
+    live = defaultdict(list)
+    for project_id, file_id in files:
+        if states.get(file_id) == 'live':
+            live[project_id].append(file_id)
+    samples, failed = set(), set()
+    for project_id, file_ids in live.items():
+        failed.update(dx.archive_files(project_id, file_ids))
+        samples.update(sample for file_id in file_ids for sample in files[(project_id, file_id)])
+    # samples with files still being unarchived or that failed to archive stay marked as unarchived
+    samples.difference_update(sample for (project_id, file_id), file_samples in files.items()
+        if states.get(file_id) != 'live' or file_id in failed for sample in file_samples)
+    return samples
+
+
+def extract_vcf_records(data, dx, jobs=1, proxy=None, wait=None):
+    """
+    Extract the vcf records of all rows with a VCF file (one task per project-id and vcf-id)
+    Files are signed in the main process and read by a pool of worker processes, as pysam holds the GIL while decoding.
+    With a block cache proxy, files are read through the proxy (signed when blocks are missing).
+    With wait (seconds), archival states are polled in bulk and each VCF is read as soon as it and its index are live.
+    Returns a DataFrame of VCF_FIELDS indexed like the given rows (rows without record are omitted)
+    """
+    groups = dict(list(located_rows(data).groupby(['project-id', 'vcf-id'], sort=False)))
+    file_url = proxy.url if proxy else lambda project_id, file_id: dx.file_url(project_id, file_id)['url']
+    records = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        def submit(project_id, vcf_id):
+            rows = groups[(project_id, vcf_id)]
+            url_vcf = file_url(project_id, vcf_id)
+            url_tbi = file_url(project_id, rows['index-id'].iloc[0])
+            if url_vcf and url_tbi:
+                futures[executor.submit(get_vcf_records, url_vcf, url_tbi, rows[VALIDATED_GENOMIC])] = vcf_id
+        if wait is None:
+            for project_id, vcf_id in groups:
+                submit(project_id, vcf_id)
+        else:
+            # files each VCF is waiting for, VCFs waiting for each file
+            pending = { key: { key[1], rows['index-id'].iloc[0] } for key, rows in groups.items() }
+            waiting = defaultdict(list)
+            for (project_id, vcf_id), file_ids in pending.items():
+                for file_id in file_ids:
+                    waiting[(project_id, file_id)].append((project_id, vcf_id))
+            with tqdm(total=len(pending), desc='Live') as progress:
+                for project_id, file_id in dx.wait_live(list(waiting), timeout=wait):
+                    for key in waiting[(project_id, file_id)]:
+                        pending[key].discard(file_id)
+                        if not pending[key]:
+                            submit(*key)
+                            progress.update()
+            not_live = sum(1 for file_ids in pending.values() if file_ids)
+            if not_live:
+                print(f'{not_live} VCF files did not become live')
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                records.update(future.result())
+            except Exception as error:
+                print(f'Could not read VCF {futures[future]}: {error}')
+    # merged in row order
+    return pd.DataFrame.from_dict(records, orient='index', columns=VCF_FIELDS).reindex(
+        [ index for index in data.index if index in records ])
+
+
+def hgvs_name(row):
+    """
+    HGVS.c name of a row (transcript:hgvs), None if either is missing
+    """
+    if pd.notna(row[TRANSCRIPT_COLUMN]) and pd.notna(row[HGVS_COLUMN]) and row[TRANSCRIPT_COLUMN] and row[HGVS_COLUMN]:
+        return f'{row[TRANSCRIPT_COLUMN]}:{row[HGVS_COLUMN]}'
+
+
+def get_genomic_coordinates(row, resolved):
+    """
+    Get the genomic coordinates from the HGVS.g / HGVS.c (validates against the resolved HGVS.c names)
     """
     try:
         return row[VALIDATED_GENOMIC]
@@ -123,35 +312,56 @@ def get_genomic_coordinates(row, babelfish):
     m = re.match(r'g\.(\d+)(\w+)>(\w+)',row[GDOT_COLUMN])
     chrom1 = row[CHROM_COLUMN]
     pos1, ref1, alt1 = m.groups()
-    if row[TRANSCRIPT_COLUMN] and row[HGVS_COLUMN]:
-        chrom2, pos2, ref2, alt2 = babelfish.get_genomic(f'{row[TRANSCRIPT_COLUMN]}:{row[HGVS_COLUMN]}')
+    name = hgvs_name(row)
+    if not name:
+        return ':'.join(map(str,[chrom1, pos1, ref1, alt1]))
+    chrom2, pos2, ref2, alt2 = resolved[name]
     if int(pos1) == int(pos2) and ref1 == ref2 and alt1 == alt2:
         return ':'.join(map(str,[chrom2, pos2, ref2, alt2]))
     return ':'.join(map(str,[chrom1, pos1, ref1, alt1]))
 
 
-# def get_dnanexus_resources(row, dx, suffix):
-#     """
-#     Get the dnanexus project and file identifiers
-#     """
-#     sample = row[SAMPLE_COLUMN]
-#     search_pattern = f'{sample}.*{suffix}'        
-#     files = dx.find_files(search_pattern, 'regexp', { "folder": args.folder })
-#     # get all files and sense check for uniqueness (in case a project had to be rerun and uses the same sample identifiers)
-#     for f in files:
-#         # check if project matches
-#         project = dx.get_project(f['project'])
-#         if re.match(args.project, project['name']):
-#             # add file and project id to relevant lines
-#             file = dx.get_file(f['project'], f['id'])
-#             file_type = 'index' if file['name'].endswith('.tbi') else 'vcf'
-#             return pd.Series({
-#                 f'{file_type}-id': file['id'],
-#                 f'{file_type}-name': file['name'],
-#                 'project-id': project['id'],
-#                 'project-name': project['name']
-#             })
-#     return pd.Series()
+def index_sample_files(dx, project, folder, suffix, workers=WORKERS):
+    """
+    Index VCF and index files by sample with a single search per project (name pattern) over folder and suffix
+    Files are keyed by the part of the name preceding the suffix. If a sample was analysed in several projects
+    (e.g. reruns), the files of the most recently created project are used.
+    Returns a dict of project, vcf and index ids, names and archival states by sample
+    """
+    projects = [ p for p in dx.find_projects(project, 'regexp') if re.match(project, p['describe']['name']) ]
+    def search(p):
+        return dx.find_files(f'.*{suffix}', 'regexp', project=p['id'], folder=folder,
+            describe={ 'fields': { 'name': True, 'archivalState': True } })
+    found = { p['id']: files for p, files in stream_map(search, projects, workers) }
+    index = {}
+    for p in sorted(projects, key=lambda p: p['describe']['created']):
+        samples = defaultdict(dict)
+        for f in found[p['id']]:
+            name = f['describe']['name']
+            m = re.search(suffix, name)
+            if m:
+                file_type = 'index' if name.endswith('.tbi') else 'vcf'
+                samples[name[:m.start()]].update({
+                    f'{file_type}-id': f['id'],
+                    f'{file_type}-name': name,
+                    f'{file_type}-state': f['describe']['archivalState']
+                })
+        for sample, files in samples.items():
+            index[sample] = { 'project-id': p['id'], 'project-name': p['describe']['name'], **files }
+    return index
+
+
+def resolve_sample(index, sample):
+    """
+    Look up the files of a sample in the index
+    As with a search for sample.*suffix, the sample pattern may match any part of the indexed name.
+    """
+    sample = str(sample)
+    if sample in index:
+        return index[sample]
+    for name in reversed(index):
+        if re.search(sample, name):
+            return index[name]
 
 
 def main(args):
@@ -159,7 +369,7 @@ def main(args):
     Main function
     """
     # read CSV file
-    df = DataFile(args.input)
+    df = DataFile(args.input, checkpoint=f'{args.output or args.input}.checkpoint')
 
     # init progress reporter for pandas operations
     tqdm.pandas()
@@ -174,57 +384,66 @@ def main(args):
 
     
 
-    # find and assign files
-    # dx_ids = df.data.progress_apply(get_dnanexus_resources, axis=1, args=(dx,args.suffix,))
-    # df.data = df.data.join(dx_ids)
-    # iterative version of the above with intermediary file writes
+    # find and assign files (one search per project instead of one per sample)
     print("Getting DNAnexus project and file IDs...")
-    for sample in df.samples(args.force):
-        search_pattern = f'{sample}.*{args.suffix}'        
-        print(f'Searching for sample {search_pattern}...')
-        files = dx.find_files(search_pattern, 'regexp', { "folder": args.folder })
-        # get all files and sense check for uniqueness (in case a project had to be rerun and uses the same sample identifiers)
-        print(files)
-        for f in files:
-            # check if project matches
-            project = dx.get_project(f['project'])
-            if re.match(args.project, project['name']):
-                # add file and project id to relevant lines
-                file = dx.get_file(f['project'], f['id'])
-                print(file)
-                print(sample, project['name'], file['folder'], file['name'])
-                file_type = 'index' if file['name'].endswith('.tbi') else 'vcf'
-                df.assign(sample, f'{file_type}-id', f['id'])
-                df.assign(sample, f'{file_type}-name', file['name'])
-                df.assign(sample, 'project-id', f['project'])
-                df.assign(sample, 'project-name', project['name'])
-                if args.unarchive and file['archivalState'] == 'archived':
-                    if dx.unarchive(f['project-id'],f['id']):
-                        df.assign(sample, UNARCHIVED_COLUMN, True)
-        # save the intermediary result to file
+    samples = df.samples(args.force)
+    if len(samples):
+        index = index_sample_files(dx, args.project, args.folder, args.suffix)
+        print(f'Indexed files of {len(index)} samples')
+        resolved = {}
+        for sample in samples:
+            files = resolve_sample(index, sample)
+            if not files:
+                print(f'No files found for sample {sample}')
+                continue
+            values = { column: files[column] for column in FILE_COLUMNS if column in files }
+            # save the intermediary result (appended to the checkpoint log)
+            df.log(sample, values)
+            resolved[sample] = values
+        df.assign_samples(resolved)
         df.commit(args.output)
-        print(df.data)
-    
+
     # get validated genomic coordinates
     if not df.has_column(VALIDATED_GENOMIC):
         # get HGVS babelfish
         print('Loading refgene data...',end='')
         babelfish = HGVS(args.refgene, args.genome)
         print('Getting and validating genomic coordinates...')
-        df.data[VALIDATED_GENOMIC] = df.data.progress_apply(get_genomic_coordinates, axis=1, args=(babelfish,))
+        # resolve each HGVS.c name once before mapping back to rows
+        resolved = babelfish.get_genomic_batch(df.data.apply(hgvs_name, axis=1).dropna().unique())
+        df.data[VALIDATED_GENOMIC] = df.data.progress_apply(get_genomic_coordinates, axis=1, args=(resolved,))
         # df.commit(args.output)
 
     # get vcf records
     if not df.has_column(VCF_COLUMN):
         print('Getting VCF records...')
-        vcf_data = df.data.progress_apply(get_vcf_record, axis=1, args=(dx,))
-        df.data = df.data.join(vcf_data)
+        # one remote VCF per sample (rows without VCF are skipped)
+        proxy = BlockProxy(BlockCache(os.path.join(args.cache, 'blocks.db'), int(args.cache_size * 1024 ** 3)),
+            lambda project_id, file_id: dx.file_url(project_id, file_id)['url']) if args.cache else None
+        wait = None
+        if args.unarchive:
+            # request unarchival in bulk, then extract each sample as its files become live
+            unarchived = { sample: { UNARCHIVED_COLUMN: True, UNARCHIVED_FILES_COLUMN: ';'.join(file_ids) }
+                for sample, file_ids in request_unarchival(dx, df.data).items() }
+            print(f'Unarchiving files of {len(unarchived)} samples (waiting up to {args.wait} hours)...')
+            for sample, values in unarchived.items():
+                df.log(sample, values)
+            df.assign_samples(unarchived)
+            wait = args.wait * 3600
+        df.data = df.data.join(extract_vcf_records(df.data, dx, args.jobs, proxy, wait))
+        if proxy:
+            print(f'Read {proxy.served / 1024 ** 2:.1f} MB from cache, fetched {proxy.fetched / 1024 ** 2:.1f} MB')
+            proxy.shutdown()
+            proxy.cache.close()
         df.commit(args.output)
 
     # rearchive if extracted
-    if args.rearchive:
-        print('-')
-        print(df.data[df.data[UNARCHIVED_COLUMN] == True])
+    if args.rearchive and df.has_column(UNARCHIVED_COLUMN):
+        print('Re-archiving unarchived files...')
+        rearchived = rearchive_files(dx, df.data)
+        print(f'Re-archived files of {len(rearchived)} samples')
+        df.assign_samples({ sample: { UNARCHIVED_COLUMN: False } for sample in rearchived })
+        df.commit(args.output)
 
 
 if __name__ == "__main__":
@@ -242,6 +461,10 @@ if __name__ == "__main__":
     parser.add_argument("--suffix", help="File suffix", default="_S\\d+_R1_001\\.vcf\\.gz")
     parser.add_argument("--unarchive", action="store_true", help="Unarchive to extract")
     parser.add_argument("--rearchive", action="store_true", help="Re-archive after data extraction")
+    parser.add_argument("--wait", help="Maximum time to wait for unarchival (hours)", type=float, default=48)
+    parser.add_argument("--jobs", help="Worker processes reading VCF files", type=int, default=4)
+    parser.add_argument("--cache", help="Local cache directory for remote VCF reads (empty to disable)", default=CACHE_DIR)
+    parser.add_argument("--cache-size", help="Size limit of cached VCF blocks (GB)", type=float, default=10)
 
 
     args = parser.parse_args()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules are imported from the repository root (as by the scripts and benchmarks)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
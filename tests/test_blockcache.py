@@ -0,0 +1,115 @@
+import re
+import threading
+import pytest
+from urllib.error import HTTPError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from app.blockcache import BlockCache, BlockProxy
+
+DATA = bytes(range(256)) * 4
+
+
+def stored_bytes(cache):
+    return cache.db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blocks').fetchone()[0]
+
+
+def test_store_counts_blocks(tmp_path):
+    cache = BlockCache(str(tmp_path / 'blocks.db'), block_size=4)
+    cache.store('file-1', 100, 0, b'x' * 10)
+    assert cache.blocks('file-1', 0, 2) == { 0: b'xxxx', 1: b'xxxx', 2: b'xx' }
+    assert cache.size('file-1') == 100
+    assert cache.cached_bytes == stored_bytes(cache) == 10
+
+
+def test_store_replaced_blocks_counted_once(tmp_path):
+    cache = BlockCache(str(tmp_path / 'blocks.db'), block_size=4)
+    cache.store('file-1', 100, 0, b'x' * 16)
+    # overlapping fetch (blocks 2 and 3 are replaced)
+    cache.store('file-1', 100, 2, b'y' * 16)
+    cache.store('file-1', 100, 0, b'z' * 16)
+    assert cache.cached_bytes == stored_bytes(cache) == 24
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = BlockCache(str(tmp_path / 'blocks.db'), max_bytes=40, block_size=4)
+    cache.store('file-1', 16, 0, b'a' * 16)
+    cache.store('file-2', 16, 0, b'b' * 16)
+    # file-1 was read last
+    cache.blocks('file-1', 0, 3)
+    cache.store('file-3', 16, 0, b'c' * 16)
+    # evicted down to 90% of the limit, oldest blocks first
+    assert cache.cached_bytes == stored_bytes(cache) <= 36
+    assert len(cache.blocks('file-1', 0, 3)) == 4
+    assert len(cache.blocks('file-3', 0, 3)) == 4
+    assert len(cache.blocks('file-2', 0, 3)) < 4
+
+
+def test_cached_bytes_persist(tmp_path):
+    path = str(tmp_path / 'blocks.db')
+    cache = BlockCache(path, block_size=4)
+    cache.store('file-1', 100, 0, b'x' * 12)
+    cache.close()
+    assert BlockCache(path).cached_bytes == 12
+
+
+def test_proxy_counters_thread_safe(tmp_path):
+    proxy = BlockProxy(BlockCache(str(tmp_path / 'blocks.db')), lambda project_id, file_id: None)
+    def count():
+        for _ in range(10000):
+            proxy.count('served', 1)
+            proxy.count('fetched', 2)
+    threads = [ threading.Thread(target=count) for _ in range(8) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    proxy.shutdown()
+    assert (proxy.served, proxy.fetched) == (80000, 160000)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    # serves byte ranges of DATA after failing the first requests
+    failures = []
+
+    def do_GET(self):
+        if self.failures:
+            self.send_error(self.failures.pop(0))
+            return
+        start, end = map(int, re.match(r'bytes=(\d+)-(\d+)', self.headers['Range']).groups())
+        end = min(end, len(DATA) - 1)
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(DATA)}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(DATA[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server(monkeypatch):
+    monkeypatch.setattr('app.dx.time.sleep', lambda seconds: None)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.mark.parametrize('failures', [[503], [500, 429], []])
+def test_fetch_retries_transient_errors(tmp_path, flaky_server, failures):
+    FlakyHandler.failures = list(failures)
+    url = f'http://127.0.0.1:{flaky_server.server_address[1]}/data'
+    proxy = BlockProxy(BlockCache(str(tmp_path / 'blocks.db')), lambda project_id, file_id: url)
+    assert proxy.fetch('project-1', 'file-1', 10, 19) == (DATA[10:20], len(DATA))
+    assert not FlakyHandler.failures
+    proxy.shutdown()
+
+
+def test_fetch_does_not_retry_missing(tmp_path, flaky_server):
+    FlakyHandler.failures = [404, 503]
+    url = f'http://127.0.0.1:{flaky_server.server_address[1]}/data'
+    proxy = BlockProxy(BlockCache(str(tmp_path / 'blocks.db')), lambda project_id, file_id: url)
+    with pytest.raises(HTTPError):
+        proxy.fetch('project-1', 'file-1', 0, 9)
+    assert FlakyHandler.failures == [503]
+    proxy.shutdown()
@@ -0,0 +1,48 @@
+import threading
+from app.cache import ExecutionCache
+
+
+def execution(execution_id, state, created):
+    return { 'id': execution_id, 'describe': { 'state': state, 'created': created } }
+
+
+def test_unsynced_scope(tmp_path):
+    cache = ExecutionCache(str(tmp_path / 'executions.db'))
+    assert cache.watermark('project-1') is None
+    assert cache.executions('project-1') == []
+
+
+def test_watermark_held_back_by_running(tmp_path):
+    cache = ExecutionCache(str(tmp_path / 'executions.db'))
+    cache.update('project-1', [execution('analysis-1', 'done', 1000000), execution('analysis-2', 'running', 2000000)], 5000000)
+    # overlapping by a minute before the oldest running execution
+    assert cache.watermark('project-1') == 2000000 - 60000
+    assert [ e['id'] for e in cache.executions('project-1') ] == ['analysis-1']
+    cache.update('project-1', [execution('analysis-2', 'failed', 2000000)], 6000000)
+    assert cache.watermark('project-1') == 6000000 - 60000
+
+
+def test_update_merges_cached_and_fetched(tmp_path):
+    path = str(tmp_path / 'executions.db')
+    cache = ExecutionCache(path)
+    cache.update('project-1', [execution('analysis-1', 'done', 1000), execution('analysis-2', 'running', 2000)], 5000)
+    cache.close()
+    # fetched executions take precedence over cached ones (reopened store)
+    cache = ExecutionCache(path)
+    executions = cache.update('project-1', [execution('analysis-2', 'done', 2000), execution('analysis-3', 'idle', 3000)], 6000)
+    assert sorted((e['id'], e['describe']['state']) for e in executions) == [
+        ('analysis-1', 'done'), ('analysis-2', 'done'), ('analysis-3', 'idle')]
+    # scopes are separate
+    assert cache.executions('project-2') == [] and cache.watermark('project-2') is None
+
+
+def test_shared_between_threads(tmp_path):
+    cache = ExecutionCache(str(tmp_path / 'executions.db'))
+    def sync(scope):
+        cache.update(scope, [ execution(f'analysis-{scope}-{i}', 'done', i) for i in range(100) ], 1000)
+    threads = [ threading.Thread(target=sync, args=(f'project-{i}',)) for i in range(8) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(len(cache.executions(f'project-{i}')) == 100 for i in range(8))
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+import dxarc
+from dxarc import DataFile
+
+
+@pytest.fixture(autouse=True)
+def row_groups(monkeypatch):
+    monkeypatch.setattr(dxarc, 'ROW_GROUP_SIZE', 4)
+
+
+@pytest.mark.parametrize('ext', ['tsv', 'parquet'])
+@pytest.mark.parametrize('screen,printed', [(None, 10), (3, 3), (0, 0)])
+def test_streamed_rows_written_not_kept(tmp_path, capsys, ext, screen, printed):
+    path = str(tmp_path / f'objects.{ext}')
+    df = DataFile(path, columns=['object', 'size'], stream=True, screen=screen)
+    for i in range(10):
+        df.append({ 'object': f'file-{i}', 'size': i })
+        assert not df._kept
+    with pytest.raises(RuntimeError):
+        df.data
+    df.commit()
+    out = capsys.readouterr()
+    written = pd.read_parquet(path) if ext == 'parquet' else pd.read_csv(path, sep='\t')
+    assert written['size'].tolist() == list(range(10))
+    assert df.count == 10 and df.data.empty
+    # header once, then the printed rows
+    lines = out.out.splitlines()
+    assert len(lines) == (printed + 1 if printed else 0)
+    assert sum('file-' in line for line in lines) == printed
+    assert ('... 7 more rows' in out.err) == (screen == 3)
+
+
+def test_streamed_rows_kept_for_email(tmp_path, capsys):
+    df = DataFile(str(tmp_path / 'objects.tsv'), email='invalid', columns=['object', 'size'], stream=True, screen=0)
+    for i in range(10):
+        df.append({ 'object': f'file-{i}', 'size': i })
+    df.commit()
+    assert df.data['object'].tolist() == [ f'file-{i}' for i in range(10) ]
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import app.idset
+from app.idset import IdSet, encode, encode_one, decode, mix
+
+
+def random_ids(n, seed):
+    rng = np.random.default_rng(seed)
+    return decode(rng.integers(0, 2 ** 60, size=n, dtype=np.uint64),
+        rng.integers(0, 2 ** 60, size=n, dtype=np.uint64)).tolist()
+
+
+def test_encode_roundtrip():
+    ids = ['file-GK2b4Qj0x8Vz5b1F9bKq0p3X', 'project-G0000000000000000000000z', 'analysis-zzzzzzzzzzzzzzzzzzzzzzzz']
+    assert decode(*encode(ids)).tolist() == ids
+
+
+def test_encode_one_matches_vectorized():
+    ids = random_ids(100, 1)
+    hi, lo = encode(ids)
+    key = mix(hi, lo)
+    assert [ encode_one(x) for x in ids ] == list(zip(key.tolist(), hi.tolist(), lo.tolist()))
+
+
+@pytest.mark.parametrize('object_id', ['file-123', 'nothing-GK2b4Qj0x8Vz5b1F9bKq0p3X', 'file-GK2b4Qj0x8Vz5b1F9bKq0paa'])
+def test_invalid_ids(object_id):
+    with pytest.raises(ValueError):
+        encode([object_id])
+    with pytest.raises(ValueError):
+        encode_one(object_id)
+
+
+def test_membership():
+    ids = random_ids(1000, 1)
+    others = random_ids(1000, 2)
+    idset = IdSet(ids + ids[:10])
+    assert len(idset) == 1000
+    assert all(x in idset for x in ids)
+    assert not any(x in idset for x in others)
+    assert idset.contains(ids[:5] + others[:5]).tolist() == [True] * 5 + [False] * 5
+    # invalid ids are not contained
+    assert 'file-123' not in idset and None not in idset
+    assert sorted(idset) == sorted(ids)
+
+
+def test_pending_ids_not_merged_on_lookup():
+    ids = random_ids(200, 1)
+    idset = IdSet(ids[:100])
+    for x in ids[100:]:
+        idset.add(x)
+    assert x in idset and ids[0] in idset and 'file-GK2b4Qj0x8Vz5b1F9bKq0p3X' not in idset
+    # single lookups leave the buffer unmerged
+    assert len(idset._pending) == 100
+    assert len(idset) == 200 and not idset._pending
+    assert all(x in idset for x in ids)
+
+
+def test_pending_merged_above_limit(monkeypatch):
+    monkeypatch.setattr(app.idset, 'PENDING', 10)
+    idset = IdSet()
+    for x in random_ids(25, 1):
+        idset.add(x)
+    assert len(idset._pending) == 5
+    assert len(idset) == 25
+
+
+def test_set_operations():
+    ids = random_ids(300, 1)
+    first, second = IdSet(ids[:200]), IdSet(ids[100:])
+    assert sorted(first & second) == sorted(ids[100:200])
+    assert sorted(first - second) == sorted(ids[:100])
+    assert sorted(second - first) == sorted(ids[200:])
+    assert sorted(first | second) == sorted(ids)
+    # operands can be iterables of ids and sets of different size
+    assert sorted(first - ids[150:]) == sorted(ids[:150])
+    assert sorted(first & ids[:10]) == sorted(ids[:10])
+
+
+def test_colliding_keys(monkeypatch):
+    # all ids share one key (collisions are resolved by the full id)
+    monkeypatch.setattr(app.idset, 'mix', lambda hi, lo: np.zeros(len(hi), dtype=np.uint64))
+    ids = random_ids(50, 1)
+    idset = IdSet(ids[:30] + ids[:5])
+    assert len(idset) == 30
+    assert idset.contains(ids).tolist() == [True] * 30 + [False] * 20
+    assert sorted(idset - ids[10:]) == sorted(ids[:10])
+
+
+def test_merges_into_sorted_arrays(monkeypatch):
+    monkeypatch.setattr(app.idset, 'PENDING', 7)
+    ids = random_ids(100, 1)
+    idset = IdSet(ids[:30])
+    # re-added ids are merged once
+    for x in ids[20:] + ids[:10]:
+        if x not in idset:
+            idset.add(x)
+        idset.add(x)
+    assert len(idset) == 100
+    assert (np.diff(idset.key.astype(np.float64)) >= 0).all()
+    assert all(x in idset for x in ids)
+    assert sorted(idset) == sorted(ids)
@@ -0,0 +1,78 @@
+from app.journal import Journal
+from app.idset import IdSet
+
+FILES = ['file-GK2b4Qj0x8Vz5b1F9bKq0p3X', 'file-GK2b4Qj0x8Vz5b1F9bKq0p3Y']
+
+
+def write_run(path):
+    journal = Journal(path)
+    journal.record_projects([{ 'id': 'project-1' }, { 'id': 'project-2' }])
+    journal.record_exclude(FILES[:1])
+    journal.record_candidates('project-1', FILES)
+    journal.record_chunk('project-1', 0)
+    journal.record_chunk('project-1', 2)
+    journal.record_rename('project-1', 'archived_project')
+    journal.close()
+
+
+def test_new_journal_ignores_existing(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    write_run(path)
+    journal = Journal(path)
+    assert not journal.resumed
+    assert journal.projects is None
+    journal.close()
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    write_run(path)
+    journal = Journal(path, resume=True)
+    assert journal.resumed
+    assert journal.projects == [{ 'id': 'project-1' }, { 'id': 'project-2' }]
+    assert isinstance(journal.exclude, IdSet) and list(journal.exclude) == FILES[:1]
+    assert journal.candidates == { 'project-1': FILES }
+    assert journal.chunks['project-1'] == { 0, 2 }
+    assert journal.renames == { 'project-1': 'archived_project' }
+    journal.close()
+
+
+def test_truncates_incomplete_record(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    write_run(path)
+    with open(path, 'ab') as outfile:
+        outfile.write(b'{"type": "chunk", "project": "project-1", "ch')
+    journal = Journal(path, resume=True)
+    assert journal.chunks['project-1'] == { 0, 2 }
+    # records of the resumed run follow the last complete record
+    journal.record_chunk('project-1', 1)
+    journal.close()
+    journal = Journal(path, resume=True)
+    assert journal.chunks['project-1'] == { 0, 1, 2 }
+    assert journal.renames == { 'project-1': 'archived_project' }
+    journal.close()
+
+
+def test_resume_without_journal(tmp_path):
+    journal = Journal(str(tmp_path / 'missing' / 'run.journal'), resume=True)
+    assert not journal.resumed
+    assert journal.candidates == {} and journal.exclude is None
+    journal.close()
+
+
+def test_completed_journal_starts_new_run(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    write_run(path)
+    journal = Journal(path, resume=True)
+    journal.record_done()
+    journal.close()
+    journal = Journal(path, resume=True)
+    assert not journal.resumed and journal.completed
+    assert journal.projects is None and journal.candidates == {} and not journal.chunks
+    journal.record_chunk('project-1', 5)
+    journal.close()
+    # only records of the new run are replayed
+    journal = Journal(path, resume=True)
+    assert journal.resumed and not journal.completed
+    assert journal.chunks == { 'project-1': { 5 } } and journal.renames == {}
+    journal.close()
@@ -0,0 +1,33 @@
+import os
+from app.parsecache import ParseCache, file_stamp
+
+
+def test_value_valid_while_file_unchanged(tmp_path):
+    path = tmp_path / 'workbook.xlsx'
+    path.write_bytes(b'first')
+    cache = ParseCache(str(tmp_path / 'cache.db'), 'parser-1')
+    assert cache.get(str(path)) is None
+    cache.put(str(path), [['sample', 'request', 'result']])
+    assert cache.get(str(path)) == [['sample', 'request', 'result']]
+    # changed size
+    path.write_bytes(b'changed')
+    assert cache.get(str(path)) is None
+
+
+def test_stamp_of_parsed_file(tmp_path):
+    path = tmp_path / 'workbook.xlsx'
+    path.write_bytes(b'first')
+    stamp = file_stamp(str(path))
+    # modified while parsing (same size, later modification time)
+    os.utime(path, ns=(stamp[0] + 10 ** 9, stamp[0] + 10 ** 9))
+    cache = ParseCache(str(tmp_path / 'cache.db'), 'parser-1')
+    cache.put(str(path), 'value', stamp)
+    assert cache.get(str(path)) is None
+
+
+def test_kinds_cached_separately(tmp_path):
+    path = tmp_path / 'workbook.xlsx'
+    path.write_bytes(b'first')
+    ParseCache(str(tmp_path / 'cache.db'), 'parser-1').put(str(path), 1)
+    assert ParseCache(str(tmp_path / 'cache.db'), 'parser-2').get(str(path)) is None
+    assert ParseCache(str(tmp_path / 'cache.db'), 'parser-1').get(str(path)) == 1
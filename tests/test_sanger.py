@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+from extract_sanger import build_results, classify, describe_variants
+from benchmarks.sanger import FixedGenomic, sample_data, append_results
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_build_results_matches_previous_loop(seed):
+    data = sample_data(200, seed)
+    babelfish = FixedGenomic()
+    expected = append_results(data, babelfish)
+    pd.testing.assert_frame_equal(build_results(data, babelfish).astype(str), expected.astype(str), check_dtype=False)
+
+
+def test_build_results_classification():
+    data = pd.DataFrame({
+        'NGS100_10_200001_AB_M_VCP1_Pan4001': ['BRCA1 c.68A>G het', 'BRCA1 c.68A>G het'],
+        'NGS100_10_200002_AB_F_VCP1_Pan4001': ['TP53 c.100del hom', 'No variant detected'],
+        'NGS100_10_200003_AB_U_VCP1_Pan4001': ['Not requested', 'BRCA2 c.5A>G het'],
+        'NGS100_10_200004_AB_U_VCP1_Pan4001': [np.nan, 'BRCA2 c.5A>G het'],
+        'NGS100_10_200005_AB_U_VCP1_Pan4001': ['BRCA2 c.5A>G het', 'BRCA2 c.5A>G hom'],
+        'NGS100_10_200006_AB_U_VCP1_Pan4001': ['BRCA2 c.5A>G het', np.nan],
+    }, index=['request', 'result'])
+    results = build_results(data, FixedGenomic())
+    assert results['DNA'].tolist() == ['200001', '200002', '200005', '200006']
+    assert results['Run Name'].tolist()[0] == 'NGS100_10_200001_AB_M_VCP1_Pan4001'
+    assert results['Real'].tolist() == ['TP', '', '', '']
+    # requested variants not confirmed (no or missing result), different zygosity is neither
+    assert results['False Pos'].tolist() == ['', 'FP', '', 'FP']
+    assert results['False Neg'].tolist() == ['', '', '', '']
+    assert results['Final result (HGVS)'].tolist() == ['c.68A>G', '', 'c.5A>G', '']
+
+
+@pytest.mark.parametrize('requested,confirmed,expected', [
+    ('BRCA1 c.68A>G het', 'BRCA1 c.68A>G het', 'TP'),
+    ('BRCA1 c.68A>G het', 'No variant detected', 'FP'),
+    ('BRCA1 c.68A>G', 'BRCA1 c.68A>G het', 'FN'),
+    ('BRCA1 c.68A>G', None, 'TN'),
+    (None, None, 'TN'),
+    ('BRCA1 c.68A>G het', 'BRCA1 c.68A>G hom', ''),
+])
+def test_classify(requested, confirmed, expected):
+    result = classify(describe_variants([requested])['variant'], describe_variants([confirmed])['variant'])
+    assert result.tolist() == [expected]
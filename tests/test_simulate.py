@@ -0,0 +1,24 @@
+import json
+import time
+from app.snapshot import Snapshot
+from app.simulate import ArchivalSimulator, GB
+
+DAY = 86400 * 1000
+
+
+def test_age_limits_projects_and_files(tmp_path):
+    now = int(time.time() * 1000)
+    snapshot = Snapshot(str(tmp_path / 'snapshot.db'))
+    for project_id, created in (('project-old', now - 100 * DAY), ('project-new', now - 10 * DAY)):
+        snapshot.db.execute('INSERT INTO projects VALUES (?,?,?,?,?,?)', (project_id, f'002_{project_id}', created, created,
+            now, json.dumps({ 'storageCost': 0 })))
+    # old files in both projects (the new project holds files copied from elsewhere)
+    for file_id, project_id, modified in (('file-1', 'project-old', now - 50 * DAY), ('file-2', 'project-new', now - 50 * DAY),
+            ('file-3', 'project-old', now - 1 * DAY)):
+        snapshot.db.execute('INSERT INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?,?)', (file_id, project_id, file_id, '/', GB,
+            'live', '[]', modified, modified, 0, 'closed', 'user-1'))
+    simulator = ArchivalSimulator(snapshot, prices=(1.0, 0.0))
+    result = simulator.evaluate('4w', '^002_')
+    assert (result['projects'], result['files'], result['freedGB']) == (1, 1, 1.0)
+    result = simulator.evaluate(None, '^002_')
+    assert (result['projects'], result['files']) == (2, 3)
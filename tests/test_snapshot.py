@@ -0,0 +1,17 @@
+import json
+from app.snapshot import Snapshot
+
+
+def add_file(snapshot, file_id, tags):
+    snapshot.db.execute('INSERT INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?,?)', (file_id, 'project-1', f'{file_id}.vcf',
+        '/', 100, 'live', json.dumps(tags), 0, 0, 0, 'closed', 'user-1'))
+
+
+def test_tag_filter_requires_all_tags(tmp_path):
+    snapshot = Snapshot(str(tmp_path / 'snapshot.db'))
+    add_file(snapshot, 'file-1', ['a'])
+    add_file(snapshot, 'file-2', ['a', 'b'])
+    add_file(snapshot, 'file-3', [])
+    assert [ f['id'] for f in snapshot.iter_files('.*', 'regexp', tags=['a', 'b']) ] == ['file-2']
+    assert sorted(f['id'] for f in snapshot.iter_files('.*', 'regexp', tags=['a'])) == ['file-1', 'file-2']
+    assert len(list(snapshot.iter_files('.*', 'regexp'))) == 3
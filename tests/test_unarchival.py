@@ -0,0 +1,63 @@
+import pandas as pd
+from app.dx import Dx
+from extract_vcf import request_unarchival, rearchive_files, UNARCHIVED_COLUMN, UNARCHIVED_FILES_COLUMN
+
+
+class FakeDx(object):
+    # archival states of files, unarchived files become live
+    def __init__(self, states):
+        self.states = states
+        self.calls = []
+
+    def archival_states(self, files):
+        return { file_id: self.states.get(file_id) for _, file_id in files }
+
+    def unarchive_files(self, project_id, file_ids):
+        self.calls.append(('unarchive', project_id, sorted(file_ids)))
+        self.states.update({ file_id: 'live' for file_id in file_ids })
+        return []
+
+    def archive_files(self, project_id, file_ids):
+        self.calls.append(('archive', project_id, sorted(file_ids)))
+        return []
+
+
+def test_rearchives_only_unarchived_files():
+    data = pd.DataFrame({
+        'Run Name': ['A', 'A', 'B', 'C'],
+        'project-id': ['project-1', 'project-1', 'project-1', 'project-2'],
+        'vcf-id': ['file-v1', 'file-v1', 'file-v2', 'file-v3'],
+        'index-id': ['file-i1', 'file-i1', 'file-i2', 'file-i3'],
+    })
+    dx = FakeDx({ 'file-v1': 'archived', 'file-i1': 'live', 'file-v2': 'live', 'file-i2': 'live',
+        'file-v3': 'archival', 'file-i3': 'archived' })
+    unarchived = request_unarchival(dx, data)
+    assert dict(unarchived) == { 'A': ['file-v1'], 'C': ['file-i3'] }
+    # files being archived are not requested
+    assert dx.calls == [('unarchive', 'project-1', ['file-v1']), ('unarchive', 'project-2', ['file-i3'])]
+
+    data[UNARCHIVED_COLUMN] = data['Run Name'].map(lambda sample: True if sample in unarchived else None)
+    data[UNARCHIVED_FILES_COLUMN] = data['Run Name'].map(lambda sample: ';'.join(unarchived.get(sample, [])) or None)
+    dx.calls = []
+    assert rearchive_files(dx, data) == { 'A', 'C' }
+    # index files that were live before are left live
+    assert dx.calls == [('archive', 'project-1', ['file-v1']), ('archive', 'project-2', ['file-i3'])]
+
+
+def test_rearchive_leaves_unarchiving_files():
+    data = pd.DataFrame({ 'Run Name': ['A'], 'project-id': ['project-1'], 'vcf-id': ['file-v1'], 'index-id': ['file-i1'],
+        UNARCHIVED_COLUMN: [True], UNARCHIVED_FILES_COLUMN: ['file-v1;file-i1'] })
+    dx = FakeDx({ 'file-v1': 'live', 'file-i1': 'unarchiving' })
+    assert rearchive_files(dx, data) == set()
+    assert dx.calls == [('archive', 'project-1', ['file-v1'])]
+
+
+def test_wait_live_drops_files_being_archived(monkeypatch):
+    dx = Dx.__new__(Dx)
+    states = { 'file-1': 'unarchiving', 'file-2': 'archival', 'file-3': 'live' }
+    monkeypatch.setattr(dx, 'archival_states', lambda files: { file_id: states[file_id] for _, file_id in files })
+    def sleep(seconds):
+        states['file-1'] = 'live'
+    monkeypatch.setattr('app.dx.time.sleep', sleep)
+    live = list(dx.wait_live([('project-1', 'file-1'), ('project-1', 'file-2'), ('project-1', 'file-3')], timeout=60))
+    assert live == [('project-1', 'file-3'), ('project-1', 'file-1')]
@@ -34,3 +34,7 @@ awk 'BEGIN { OFS = "\t" };
 ## get reference sequence
 echo "Getting reference sequence..."
 wget -c ftp://ftp.1000genomes.ebi.ac.uk/vol1/ftp/technical/reference/phase2_reference_assembly_sequence/hs37d5ss.fa.gz
+
+## compile transcript index (loaded by the HGVS helpers)
+echo "Compiling transcript index..."
+python3 $(dirname $0)/../app/transcripts.py ${REFGENE}